@@ -25,16 +25,19 @@ import sys
 sys.path.insert(1, '../src/')
 
 import Tkinter as TK
-import tkFileDialog as TKFD 
 from functools import partial
 import process_SCPI
 import process_GUI
+import telemetry_map
+import SMB_CRC
 import time
 import os
-import openpyxl
 import csv
 import struct
 
+# tkFileDialog and openpyxl are slow to load so they are imported where they 
+# are used
+
 
 #
 # -------
@@ -51,6 +54,22 @@ DATA_FLASH_IDS = [0,1,2,4,
                   104,105,106,107,
                   112]
 
+# commands used for every page read
+READ_PAGE_COMMAND = process_SCPI.command_template(
+    'BM2:BQF READ_PAGE,{id},{page}')
+
+# file that records the length of every subclass for each firmware version,
+# kept next to this module rather than in the working directory
+FLASH_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'flash_index.csv')
+
+# time allowed for the gas gauge to commit a data flash write (ms)
+WRITE_TIMEOUT = 2000
+
+# number of times the data flash is written before giving up on pages that do
+# not verify
+WRITE_ATTEMPTS = 3
+
 #
 # -------
 # Classes
@@ -226,6 +245,75 @@ class Flash_Subclass:
         """
         return [self.subclassID, self.length] + [self.data]
     # end def
+    
+    def diff(self, flash_subclass):
+        """
+        Find the parts of this subclass that differ from the subclass in the 
+        data flash. Each page is written separately so the changes in a page
+        are merged into one span from the first to the last changed byte.
+        
+        @param    flash_subclass  (Flash_Subclass) The subclass in the data 
+                                                   flash, None if it is not 
+                                                   known
+        @return   (list)          The Flash_Spans to write
+        """
+        if flash_subclass == None:
+            # write all of it
+            flash_data = []
+            
+        else:
+            flash_data = flash_subclass.data
+        # end if
+        
+        spans = []
+        
+        for start in range(0, self.length, 32):
+            # the offsets in this page that have changed
+            changed = [offset for offset in range(start, 
+                                                  min(start + 32, self.length))
+                       if (offset >= len(flash_data)) or 
+                          (self.data[offset] != flash_data[offset])]
+            
+            if changed != []:
+                spans.append(Flash_Span(self.subclassID, changed[0], 
+                                        self.data[changed[0]:changed[-1]+1]))
+            # end if
+        # end for
+        
+        return spans
+    # end def
+# end class
+
+class Flash_Span:
+    """
+    Class contianing a run of bytes to write to a data flash subclass, which 
+    does not cross a page.
+    
+    @attribute subclassID  (int)  Subclass ID of the bytes.
+    @attribute offset      (int)  Offset of the first byte in the subclass.
+    @attribute length      (int)  Number of bytes.
+    @attribute data        (list) The bytes to write.
+    """ 
+    def __init__(self, subclass_ID, offset, span_data):
+        """
+        Initialise the class.
+        
+        @param  subclass_ID   (int)  the subclass ID of the bytes
+        @param  offset        (int)  the offset of the first byte
+        @param  span_data     (list) the bytes
+        """
+        self.subclassID = subclass_ID
+        self.offset = offset
+        self.length = len(span_data)
+        self.data = span_data
+    # end def
+    
+    def to_SCPI(self):
+        """ 
+        Function to convert the span to a usable SCPI command
+        """
+        return "BM2:BQF WRITE," + str(self.subclassID) + ',' + str(self.offset) + ',' + str(self.length) + ',' + ','.join(self.data)
+    # end def
 # end class
 
 class Flash_Page:
@@ -356,6 +444,16 @@ class Flash_Page:
         return [self.subclassID, self.page_number, self.length] + [self.data]
     # end def
     
+    def crc(self):
+        """
+        Function to calculate the SMBus CRC-8 of the page data
+        
+        @return   (int)     The CRC
+        """
+        return SMB_CRC.Calc_CRC_8([int(item) for item in self.data], 
+                                  self.length)
+    # end def
+    
     def to_SCPI(self):
         """ 
         Function to convert the page to a usable SCPI command
@@ -365,6 +463,503 @@ class Flash_Page:
 # end class
         
 
+class Flash_Image:
+    """
+    Class contianing the whole data flash read from a module.
+    
+    @attribute subclasses  (dict)  The Flash_Subclass of each subclass that 
+                                   holds data, keyed by the subclass ID as a 
+                                   string.
+    @attribute empty       (list)  The IDs of the subclasses with no data.
+    @attribute failed      (list)  The (subclass ID, page) of each page that 
+                                   could not be read.
+    @attribute pages       (int)   The number of pages read.
+    @attribute read_time   (float) The time taken to read the image (s).
+    @attribute version     (string) The firmware version of the module, None
+                                   if it was not read.
+    """
+    def __init__(self):
+        """
+        Initialise an empty image.
+        """
+        self.subclasses = {}
+        
+        self.version = None
+        
+        self.empty = []
+        
+        self.failed = []
+        
+        self.pages = 0
+        
+        self.read_time = 0.0
+    # end def
+    
+    def add_page(self, ID, page_number, page_data):
+        """
+        Add a page read from the module to the image
+        
+        @param    ID          (int)    The subclass ID of the page
+        @param    page_number (int)    The page within the subclass
+        @param    page_data   (list)   The length and bytes of the page as read,
+                                       None if the read failed
+        """
+        self.pages += 1
+        
+        if page_data == None:
+            # the read failed
+            self.failed.append((ID, page_number))
+        
+        elif page_data[0] == 0:
+            # catch for empty pages
+            if page_number == 1:
+                self.empty.append(ID)
+            # end if
+            
+        else:
+            if str(ID) not in self.subclasses:
+                self.subclasses[str(ID)] = Flash_Subclass(ID)
+            # end if
+            
+            # store the page
+            self.subclasses[str(ID)].append([str(item) for item in 
+                                             page_data[1:page_data[0]+1]])
+        # end if
+    # end def
+    
+    def pages_per_second(self):
+        """
+        Get the rate the image was read at
+        
+        @return   (float)   The pages read per second, 0 if nothing was read
+        """
+        if self.read_time <= 0:
+            return 0.0
+        # end if
+        
+        return self.pages/self.read_time
+    # end def
+# end class
+
+
+class Flash_Index:
+    """
+    Class that remembers the length of every data flash subclass for each 
+    firmware version, so that the reader can read exactly the pages that 
+    hold data rather than reading until a page is short. The lengths are 
+    learned from complete reads and stored in FLASH_INDEX_FILE.
+    
+    The version is that of the SupMCU firmware (SUP:TEL? 0). A subclass 
+    indexed as empty is not read, a subclass with no index entry is read 
+    until a page is short, and any page that does not match the index causes
+    it to be learned again.
+    
+    @attribute file_name   (string) The file the lengths are stored in.
+    @attribute versions    (dict)   The length of each subclass, by subclass
+                                    ID, for each firmware version.
+    """
+    def __init__(self, file_name = FLASH_INDEX_FILE):
+        """
+        Initialise the index from its file
+        
+        @param  file_name  (string)  The file the lengths are stored in
+        """
+        self.file_name = file_name
+        
+        self.versions = {}
+        
+        self.load()
+    # end def
+    
+    def lengths(self, version, IDs):
+        """
+        Get the lengths of the subclasses for a firmware version
+        
+        @param    version   (string)  The firmware version
+        @param    IDs       (list)    The subclass IDs that will be read
+        @return   (dict)              The length of each subclass that is 
+                                      known, empty if none of them are
+        """
+        known = self.versions.get(version, {})
+        
+        return dict([(ID, known[ID]) for ID in IDs if ID in known])
+    # end def
+    
+    def learn(self, version, IDs, image):
+        """
+        Store the lengths of the subclasses from a complete read
+        
+        @param    version   (string)       The firmware version
+        @param    IDs       (list)         The subclass IDs that were read
+        @param    image     (Flash_Image)  The data flash that was read
+        """
+        lengths = self.versions.setdefault(version, {})
+        
+        for ID in IDs:
+            if str(ID) in image.subclasses:
+                lengths[ID] = image.subclasses[str(ID)].length
+                
+            else:
+                lengths[ID] = 0
+            # end if
+        # end for
+        
+        self.save()
+    # end def
+    
+    def invalidate(self, version):
+        """
+        Forget the lengths of a firmware version once they are seen to be 
+        wrong
+        
+        @param    version   (string)  The firmware version
+        """
+        if version in self.versions:
+            del self.versions[version]
+            self.save()
+        # end if
+    # end def
+    
+    def load(self):
+        """
+        Read the lengths from the file
+        """
+        self.versions = {}
+        
+        if not os.path.isfile(self.file_name):
+            return
+        # end if
+        
+        with open(self.file_name, 'rb') as index_file:
+            for row in csv.reader(index_file):
+                if (len(row) < 3) or row[0].startswith('#') or \
+                   (row[0] == 'Version'):
+                    # skip comments, titles and blank lines
+                    continue
+                # end if
+                
+                self.versions.setdefault(row[0], {})[int(row[1])] = \
+                    int(row[2])
+            # end for
+        # end with
+    # end def
+    
+    def save(self):
+        """
+        Write the lengths to the file
+        """
+        try:
+            with open(self.file_name, 'wb') as index_file:
+                writer = csv.writer(index_file)
+                writer.writerow(['# Published through BM2_flash.py'])
+                writer.writerow(['Version', 'Subclass ID', 'Length'])
+                
+                for version in sorted(self.versions.keys()):
+                    for ID in sorted(self.versions[version].keys()):
+                        writer.writerow([version, ID, 
+                                         self.versions[version][ID]])
+                    # end for
+                # end for
+            # end with
+            
+        except IOError:
+            print "Could not write the data flash index " + self.file_name
+        # end try
+    # end def
+# end class
+
+
+class Flash_Reader:
+    """
+    Class that reads the whole data flash over one aardvark session. As soon
+    as the length of a page is known the read of the next page is requested, 
+    so that the module is fetching the next page while the current one is 
+    stored. The module is polled for each page rather than waiting a fixed 
+    delay.
+    
+    If there is an index that knows the subclass lengths of the module's 
+    firmware only the pages that hold data are read, and a subclass indexed
+    as empty is skipped. A subclass that is not in the index is read until a
+    page is short. If a page read does not match the index the index is 
+    invalidated and the rest of the subclasses are read until a page is 
+    short. The lengths of the subclasses that were read are then learned.
+    
+    @attribute address     (string)   The address of the module.
+    @attribute progress    (function) Called with the reader after each page,
+                                      None to not report progress.
+    @attribute index       (Flash_Index) The known subclass lengths, None to 
+                                      not use an index.
+    @attribute lengths     (dict)     The length of each subclass known from
+                                      the index, empty if none are known.
+    @attribute image       (Flash_Image) The image being read.
+    @attribute subclass    (int)      The number of subclasses started.
+    @attribute total       (int)      The number of subclasses to read.
+    @attribute start_time  (float)    The time the read started.
+    """
+    def __init__(self, address, progress = None, index = None):
+        """
+        Initialise the reader
+        
+        @param  address   (string)   The address of the module
+        @param  progress  (function) Called with the reader after each page
+        @param  index     (Flash_Index) The known subclass lengths
+        """
+        self.address = address
+        
+        self.progress = progress
+        
+        self.index = index
+        
+        self.lengths = {}
+        
+        self.image = None
+        
+        self.subclass = 0
+        
+        self.total = 0
+        
+        self.start_time = 0.0
+    # end def
+    
+    def pages_per_second(self):
+        """
+        Get the rate the pages are being read at
+        
+        @return   (float)   The pages read per second so far
+        """
+        elapsed = time.time() - self.start_time
+        
+        if (self.image == None) or (elapsed <= 0):
+            return 0.0
+        # end if
+        
+        return self.image.pages/elapsed
+    # end def
+    
+    def read(self, IDs = DATA_FLASH_IDS):
+        """
+        Read the data flash
+        
+        @param    IDs     (list)         The subclass IDs to read
+        @return   (Flash_Image)          The data flash, None if no aardvark 
+                                         was found
+        """
+        self.image = Flash_Image()
+        self.lengths = {}
+        self.subclass = 1
+        self.total = len(IDs)
+        self.start_time = time.time()
+        
+        # the subclasses skipped as the index says they are empty
+        skipped = []
+        
+        # hold the bus for the whole read so that no other thread's command 
+        # can come between a page request and its response
+        with process_SCPI.aardvark() as AARD, AARD.hold():
+            if AARD.port == None:
+                # no aardvark was found
+                return None
+            # end if
+            
+            # poll for each page rather than waiting the fixed delay
+            AARD.ready_mode = 'poll'
+            
+            module = telemetry_map.bm2_telemetry(AARD, self.address)
+            
+            if self.index != None:
+                # use the lengths known for this firmware
+                self.image.version = module.firmware_version()
+                self.lengths = self.index.lengths(self.image.version, IDs)
+            # end if
+            
+            # request the first page
+            request = self._next_request(IDs, None, 0, 0, skipped)
+            
+            if request != None:
+                AARD.send_SCPI(READ_PAGE_COMMAND.fill(id = request[0], 
+                                                      page = request[1]), 
+                               self.address)
+            # end if
+            
+            while request != None:
+                (ID, page) = request
+                
+                # read the page
+                page_data = module.flash_page()
+                
+                if (page == 1) and (page_data != None) and \
+                   (page_data[0] == 0) and (self.lengths.get(ID) != 0):
+                    # the first page of a subclass is sometimes read as empty,
+                    # so read it again before deciding that it is empty, 
+                    # unless the index says that it is empty
+                    AARD.send_SCPI(READ_PAGE_COMMAND.fill(id = ID, page = 1), 
+                                   self.address)
+                    page_data = module.flash_page()
+                # end if
+                
+                if page_data != None:
+                    # the length can not be more than a page
+                    page_data[0] = min(page_data[0], 32)
+                # end if
+                
+                if (ID in self.lengths) and (page_data != None) and \
+                   (page_data[0] != min(32, self.lengths[ID] - (page-1)*32)):
+                    # the index is wrong so find the lengths again
+                    self.index.invalidate(self.image.version)
+                    self.lengths = {}
+                # end if
+                
+                request = self._next_request(IDs, ID, page, 
+                                             0 if page_data == None else 
+                                             page_data[0], skipped)
+                
+                if request != None:
+                    # have the module fetch the next page while this one is 
+                    # stored
+                    AARD.send_SCPI(READ_PAGE_COMMAND.fill(id = request[0], 
+                                                          page = request[1]), 
+                                   self.address)
+                # end if
+                
+                self.image.add_page(ID, page, page_data)
+                
+                if self.progress != None:
+                    self.progress(self)
+                # end if
+            # end while
+        # end with
+        
+        self.image.read_time = time.time() - self.start_time
+        
+        # the subclasses that were read rather than taken from the index
+        learned = [ID for ID in IDs 
+                   if (ID not in self.lengths) and (ID not in skipped)]
+        
+        if (self.index != None) and (self.image.version != None) and \
+           learned and (self.image.failed == []):
+            # remember the lengths for next time
+            self.index.learn(self.image.version, learned, self.image)
+        # end if
+        
+        return self.image
+    # end def
+    
+    def read_pages(self, pages):
+        """
+        Read chosen pages of the data flash, eg. to check pages that have 
+        been written
+        
+        @param    pages   (list)         The (subclass ID, page) of each page
+        @return   (dict)                 The Flash_Page read for each 
+                                         (subclass ID, page), None for a page
+                                         that could not be read. None if no 
+                                         aardvark was found
+        """
+        read_pages = {}
+        
+        # hold the bus so each page request is followed by its own response
+        with process_SCPI.aardvark() as AARD, AARD.hold():
+            if AARD.port == None:
+                # no aardvark was found
+                return None
+            # end if
+            
+            # poll for each page rather than waiting the fixed delay
+            AARD.ready_mode = 'poll'
+            
+            module = telemetry_map.bm2_telemetry(AARD, self.address)
+            
+            for position in range(len(pages)):
+                if position == 0:
+                    # request the first page
+                    AARD.send_SCPI(READ_PAGE_COMMAND.fill(id = pages[0][0], 
+                                                          page = pages[0][1]),
+                                   self.address)
+                # end if
+                
+                # read the page
+                page_data = module.flash_page()
+                
+                if position + 1 < len(pages):
+                    # have the module fetch the next page while this one is 
+                    # stored
+                    (ID, page) = pages[position + 1]
+                    AARD.send_SCPI(READ_PAGE_COMMAND.fill(id = ID, 
+                                                          page = page), 
+                                   self.address)
+                # end if
+                
+                (ID, page) = pages[position]
+                
+                if page_data == None:
+                    # the read failed
+                    read_pages[(ID, page)] = None
+                    
+                else:
+                    # the length can not be more than a page
+                    length = min(page_data[0], 32)
+                    read_pages[(ID, page)] = Flash_Page(ID, page, 
+                        [str(item) for item in page_data[1:length+1]])
+                # end if
+            # end for
+        # end with
+        
+        return read_pages
+    # end def
+    
+    def _next_request(self, IDs, ID, page, length, skipped):
+        """
+        Find the next page to read
+        
+        @param    IDs     (list)         The subclass IDs being read
+        @param    ID      (int)          The subclass just read, None to start
+        @param    page    (int)          The page just read
+        @param    length  (int)          The length of the page just read
+        @param    skipped (list)         The subclasses skipped so far, any 
+                                         skipped now are added to it
+        @return   (tuple)                The (subclass ID, page) to read next,
+                                         None if the read is finished
+        """
+        if ID != None:
+            if ID in self.lengths:
+                # read the pages the index says hold data
+                more = page*32 < self.lengths[ID]
+                
+            else:
+                # a full page may be followed by another
+                more = (length == 32)
+            # end if
+            
+            if more:
+                return (ID, page + 1)
+            # end if
+            
+            position = IDs.index(ID) + 1
+            
+        else:
+            position = 0
+        # end if
+        
+        # move on to the next subclass
+        while position < len(IDs):
+            self.subclass = position + 1
+            
+            if self.lengths.get(IDs[position]) == 0:
+                # the subclass is empty so there is nothing to read
+                self.image.empty.append(IDs[position])
+                skipped.append(IDs[position])
+                position += 1
+                
+            else:
+                return (IDs[position], 1)
+            # end if
+        # end while
+        
+        return None
+    # end def
+# end class
+        
+
 class Update_Flash:
     """
     Template for a class that describes a step in a process.
@@ -440,6 +1035,8 @@ class Update_Flash:
         options['initialdir'] = os.getcwd()
         options['title'] = 'Select .csv file to open' 
               
+        import tkFileDialog as TKFD
+        
         # open window to fet filename to open
         filename = TKFD.askopenfilename(**file_opt)   
         
@@ -509,6 +1106,8 @@ class Update_Flash:
         options['title'] = 'Save .csv file as:'     
         
         # get the file name from the user
+        import tkFileDialog as TKFD
+        
         filename = TKFD.asksaveasfilename(**file_opt)
         
         # see if the user selected a file or not
@@ -560,41 +1159,139 @@ class Update_Flash:
     
     def write_data_flash(self):
         """
-        Write the data flash subclasses to the gas gauge
+        Write the data flash subclasses to the gas gauge, then if verifying 
+        read back the pages written and rewrite any that do not match
         """
         
         self.disable_buttons()
         
-        # initialise the list of pages to write
-        pages_to_write = []
+        # initialise the list of changes to write
+        spans_to_write = []
+        
+        # the (subclass key, page) of each page that is changed
+        pages_to_check = []
         
         # sort the keys
         keylist = sorted_key_list(self.parsed_flash_pages)
 
-        # populate the list of pages
+        # populate the list of changes, only the changed part of each page 
+        # is written
         for key in keylist:
-            if not self.parsed_flash_pages[key].is_equal(self.read_flash_pages[key]):
-                pages_to_write.extend(self.parsed_flash_pages[key].to_pages())
+            spans = self.parsed_flash_pages[key].diff(
+                self.read_flash_pages.get(key))
+            
+            spans_to_write.extend(spans)
+            pages_to_check.extend([(key, span.offset/32 + 1) 
+                                   for span in spans])
         # end for
         
-        with process_SCPI.aardvark() as AARD:
+        # the subclasses that are changed
+        changed_keys = set([key for (key, page) in pages_to_check])
+        
+        written = self.write_spans(spans_to_write)
+        attempts = 1
+        
+        while written and self.verify_write.get() and (pages_to_check != []):
+            # find the pages that did not get written
+            mismatches = self.verify_pages(pages_to_check)
+            
+            if mismatches == None:
+                # no aardvark was found
+                break
+            
+            elif mismatches == []:
+                print 'verified the changes to %d subclasses' % \
+                      len(changed_keys)
+                
+                # the gas gauge now holds the parsed subclasses
+                for key in changed_keys:
+                    self.read_flash_pages[key] = \
+                        self.parsed_flash_pages[key].copy()
+                # end for
+                break
+            
+            elif attempts == WRITE_ATTEMPTS:
+                print '*** %d pages did not verify ***' % len(mismatches)
+                break
+            # end if
+            
+            print 'rewriting %d of %d pages that did not verify' % \
+                  (len(mismatches), len(pages_to_check))
+            
+            # rewrite the whole of each page that did not match
+            pages_to_check = mismatches
+            written = self.write_spans([Flash_Span(page.subclassID, 
+                                                   (page.page_number-1)*32, 
+                                                   page.data) 
+                                        for page in 
+                                        [self.parsed_page(key, page_number)
+                                         for (key, page_number) in 
+                                         mismatches]])
+            attempts += 1
+        # end while
+        
+        # re-enable buttons
+        self.parse_button.config(state = 'normal')
+        self.save_button.config(state = 'normal')
+        self.load_button.config(state = 'normal')
+        self.write_button.config(state = 'normal')
+        self.read_button.config(state = 'normal')      
+    # end def
+    
+    def write_spans(self, spans_to_write):
+        """
+        Write changes to the data flash of the gas gauge
+        
+        @param    spans_to_write  (list)   The Flash_Spans to write
+        @return   (bool)                   True if every change was written
+        """
+        # the time each write took to commit in ms
+        commit_times = []
+        
+        # hold the bus from the unlock to the lock so that no other thread's
+        # command lands in the middle of the update
+        with process_SCPI.aardvark() as AARD, AARD.hold():
             # initialise the aardvark
             if AARD.port != None:
                 
+                # poll for the pages read back rather than a fixed delay
+                AARD.ready_mode = 'poll'
+                
                 # get the serial number
-                serial_number = AARD.read_SCPI("SUP:TEL? 9,data", 
-                                             self.properties.address, 
-                                             'uint')
+                module = telemetry_map.bm2_telemetry(AARD, 
+                                                     self.properties.address)
+                serial_number = module.serial_number()
                 
                 # unlock the flash
                 AARD.send_SCPI(("SUP:NVM UNLOCK," + str(serial_number+12345)), self.properties.address) 
                 
-                # write the flash updating commands
-                for page in pages_to_write:
-                    AARD.send_SCPI(page.to_SCPI(), self.properties.address) 
-                    time.sleep(1)
+                # write the flash updating commands, waiting until the gas 
+                # gauge gives back what was written rather than a fixed time
+                for span in spans_to_write:
+                    command = span.to_SCPI()
+                    commit_time = AARD.send_and_wait(
+                        command, self.properties.address, 
+                        partial(self.span_written, AARD, module, span), 
+                        WRITE_TIMEOUT)
+                    
+                    if commit_time == None:
+                        # do not keep writing to a gauge that is not keeping up
+                        print AARD.message
+                        break
+                    # end if
+                    
+                    commit_times.append(commit_time)
                 # end for
                 
+                if commit_times != []:
+                    print 'wrote %d of %d changes, commit time min %.0f ms, ' \
+                          'mean %.0f ms, max %.0f ms' % \
+                          (len(commit_times), len(spans_to_write), 
+                           min(commit_times), 
+                           sum(commit_times)/len(commit_times), 
+                           max(commit_times))
+                # end if
+                
                 # lock the flash
                 AARD.send_SCPI("SUP:NVM WRITE,1", self.properties.address)                            
                 
@@ -603,14 +1300,86 @@ class Update_Flash:
                 self.no_aardvark = True
                 
             #end if
-        # end with        
+        # end with
         
-        # re-enable buttons
-        self.parse_button.config(state = 'normal')
-        self.save_button.config(state = 'normal')
-        self.load_button.config(state = 'normal')
-        self.write_button.config(state = 'normal')
-        self.read_button.config(state = 'normal')      
+        return len(commit_times) == len(spans_to_write)
+    # end def
+    
+    def span_written(self, AARD, module, span):
+        """
+        Read back the page of the gas gauge's data flash that a span was 
+        written to and check that it holds the span
+        
+        @param    AARD    (aardvark)      The aardvark the span was written by
+        @param    module  (bm2_telemetry) The telemetry of the module
+        @param    span    (Flash_Span)    The span that was written
+        @return   (bool)                  True if the page holds the span
+        """
+        AARD.send_SCPI(READ_PAGE_COMMAND.fill(id = span.subclassID, 
+                                              page = span.offset/32 + 1), 
+                       self.properties.address)
+        
+        page_data = module.flash_page()
+        
+        if page_data == None:
+            # the page could not be read so it may not be written yet
+            return False
+        # end if
+        
+        # the position of the span in the page
+        start = span.offset % 32 + 1
+        
+        return (min(page_data[0], 32) + 1 >= start + span.length) and \
+               (list(page_data[start:start+span.length]) == 
+                [int(item) for item in span.data])
+    # end def
+    
+    def parsed_page(self, key, page_number):
+        """
+        Get a page of a parsed subclass
+        
+        @param    key          (string)  The key of the subclass
+        @param    page_number  (int)     The page within the subclass
+        @return   (Flash_Page)           The page
+        """
+        subclass = self.parsed_flash_pages[key]
+        
+        return Flash_Page(subclass.subclassID, page_number, 
+                          subclass.data[(page_number-1)*32:page_number*32])
+    # end def
+    
+    def verify_pages(self, pages):
+        """
+        Read back pages of the data flash and compare the CRC of each with 
+        the parsed page, which costs far less than reading the whole data flash
+        
+        @param    pages   (list)         The (subclass key, page) of each page
+        @return   (list)                 The (subclass key, page) of each page
+                                         that does not match, None if no 
+                                         aardvark was found
+        """
+        read_pages = Flash_Reader(self.properties.address).read_pages(pages)
+        
+        if read_pages == None:
+            # no aardvark was found
+            self.no_aardvark = True
+            return None
+        # end if
+        
+        mismatches = []
+        
+        for (key, page_number) in pages:
+            read_page = read_pages[(key, page_number)]
+            parsed_page = self.parsed_page(key, page_number)
+            
+            if (read_page == None) or \
+               (read_page.length != parsed_page.length) or \
+               (read_page.crc() != parsed_page.crc()):
+                mismatches.append((key, page_number))
+            # end if
+        # end for
+        
+        return mismatches
     # end def
             
     
@@ -621,47 +1390,34 @@ class Update_Flash:
         
         self.disable_buttons()
         
-        for ID in DATA_FLASH_IDS:
-            current_page = 1
-            
-            recieved_subclass = Flash_Subclass(ID)
+        # read the whole data flash in one session
+        reader = Flash_Reader(self.properties.address, self.show_progress,
+                              Flash_Index())
+        image = reader.read()
+        
+        if image == None:
+            # no aardvark was found
+            self.no_aardvark = True
             
-            recieved_page = self.read_BM2_page(ID, current_page)
+        else:
+            for ID in image.empty:
+                print "subclass " + str(ID) + " is empty"
+            # end for
             
-            if (recieved_page.length == 0):
-                recieved_page = self.read_BM2_page(ID, current_page)
-                if (recieved_page.length == 0):
-                    print "subclass " + str(ID) + " is empty"
-                    
-                else:
-                    # store the page
-                    recieved_subclass.append(recieved_page.data)
-                # end if
+            for (ID, page) in image.failed:
+                print "subclass " + str(ID) + " page " + str(page) + \
+                      " could not be read"
+            # end for
             
-            else:
-                # store the page
-                recieved_subclass.append(recieved_page.data)
-            # end if
+            print "Read " + str(image.pages) + " pages in " + \
+                  "%.1f s (%.1f pages/s)" % (image.read_time, 
+                                              image.pages_per_second())
             
-            while recieved_page.length == 32:
-                # look for extra pages
-                current_page += 1
-                recieved_page = self.read_BM2_page(ID, current_page)
-                
-                if (recieved_page.length == 0):
-                    # catch for empty pages
-                    pass
-                
-                else:
-                    # store the page
-                    recieved_subclass.append(recieved_page.data)
-                # end if
-            # end while
-            
-            if (recieved_subclass.length != 0):
-                self.read_flash_pages[str(ID)] = recieved_subclass
-            # end if
-        # end for
+            self.read_flash_pages.update(image.subclasses)
+        # end if
+        
+        # restore the body text
+        self.body.config(text = self.text)
         
         self.load_button.config(state = 'normal')
         self.read_button.config(state = 'normal')  
@@ -669,6 +1425,21 @@ class Update_Flash:
         self.save_button.config(state = 'normal')
     # end def
     
+    def show_progress(self, reader):
+        """
+        Show the progress of a data flash read in the body text
+        
+        @param    reader  (Flash_Reader) The reader
+        """
+        self.body.config(text = "Reading subclass %d of %d, %d pages at "
+                         "%.1f pages/s" % (reader.subclass, reader.total, 
+                                           reader.image.pages, 
+                                           reader.pages_per_second()))
+        
+        # the read holds the GUI thread so draw the text now
+        self.body.update_idletasks()
+    # end def
+    
     def read_BM2_page(self, ID, page):
         """
         Read a page of data from the BM2
@@ -682,21 +1453,24 @@ class Update_Flash:
         read_page = Flash_Page(ID, page)
         
         # define the SPCI command to send
-        SCPI_command = "BM2:BQF READ_PAGE," + str(read_page.subclassID) + ',' + str(read_page.page_number)
+        SCPI_command = READ_PAGE_COMMAND.fill(id = read_page.subclassID, 
+                                              page = read_page.page_number)
         
-        with process_SCPI.aardvark() as AARD:
+        # hold the bus between the page request and reading the page
+        with process_SCPI.aardvark() as AARD, AARD.hold():
             # initialise the aardvark
             if AARD.port != None:
+                # poll for the page, as Flash_Reader does, as the module only
+                # answers once it has fetched the page from the gauge
+                AARD.ready_mode = 'poll'
+                
                 # if an aardvark was found, request the page to be read
                 AARD.send_SCPI(SCPI_command, self.properties.address)
                 
-                # wait for 0.1 seconds
-                time.sleep(0.1)
-                
                 # read the page
-                page_data = AARD.read_SCPI("BM2:TEL? 78,data", 
-                                             self.properties.address, 
-                                             33*['char'])
+                module = telemetry_map.bm2_telemetry(AARD, 
+                                                     self.properties.address)
+                page_data = module.flash_page()
                 
                 # extract the data from the result
                 
@@ -742,6 +1516,8 @@ class Update_Flash:
         # end if
             
         # open the file
+        import openpyxl
+        
         workbook = openpyxl.load_workbook(filename = self.excel_path, data_only = True)
         
         # get the desired configuration information from the file
@@ -1042,6 +1818,8 @@ class Update_Flash:
             options['initialfile'] = dir_list[1]
         # end if
         
+        import tkFileDialog as TKFD
+        
         # open window to fet filename to open
         filename = TKFD.askopenfilename(**file_opt)
          
@@ -1127,6 +1905,12 @@ class Update_Flash:
                                      state = 'disabled')
         self.save_button.grid(row = 6, column = 1, sticky = 'nsew')         
         
+        # checkbox to determine if written pages should be read back
+        self.verify_write = TK.IntVar(value = 1)
+        self.verify_checkbox = TK.Checkbutton(parent_frame, text = 'Verify Data Flash Writes',
+                                              variable = self.verify_write)
+        self.verify_checkbox.grid(row = 7, column = 0, columnspan = 2, sticky = 'nsew')
+        
         # This check is only required if the step 
         # requires the use of the arrdvark
         if self.no_aardvark:
@@ -1153,6 +1937,7 @@ class Update_Flash:
         self.load_button.grid_forget()
         self.lifetime_checkbox.grid_forget()
         self.cal_checkbox.grid_forget()
+        self.verify_checkbox.grid_forget()
         self.write_button.grid_forget()
         self.read_button.grid_forget()
         self.save_button.grid_forget()
@@ -28,6 +28,7 @@ import Tkinter as TK
 from functools import partial
 import process_SCPI
 import process_GUI
+import telemetry_map
 import time
 import SUP_process
 import BM2_flash
@@ -94,15 +95,15 @@ class _BM2_verification:
         with process_SCPI.aardvark() as AARD:
             # initialise the assrdvark
             if AARD.port != None:
-                # if an aardvark was found, read the data
-                self.voltage_read = AARD.read_SCPI("BM2:TEL? 9,data", 
-                                                   self.properties.address, 
-                                                   "uint")/1000.0
-                self.temp_read = AARD.read_SCPI("BM2:TEL? 8,data", 
-                                                self.properties.address, 
-                                                "uint")/100.0
-                self.SOC_read = AARD.read_SCPI("BM2:TEL? 13,data", 
-                                               self.properties.address, "char")
+                # if an aardvark was found, read the data in one batch
+                bm2 = telemetry_map.bm2_telemetry(AARD, 
+                                                  self.properties.address)
+                telemetry = bm2.read_many(['voltage', 'temperature', 
+                                           'state_of_charge'])
+                
+                self.voltage_read = telemetry['voltage']
+                self.temp_read = telemetry['temperature']
+                self.SOC_read = telemetry['state_of_charge']
             else:
                 # no aardvark was found
                 self.no_aardvark = True
@@ -215,6 +216,8 @@ class _BM2_heater_test:
     @attribute error_label     (TK label)   Text to display if there is an error
     @attribute no_aardvark     (bool)       True is a connection to an aardvark 
                                             has been made, False otherwise.
+    @attribute read_failed     (bool)       True if the current or voltage 
+                                            could not be read from the BM2
     @attribute initial_current (float)      Initial current read from the BM2
     @attribute voltage         (float)      Voltage read from the BM2
     @attribute power_label     (TK Label)   Power calculation title
@@ -239,6 +242,7 @@ class _BM2_heater_test:
         
         # initialise attributes 
         self.no_aardvark = False
+        self.read_failed = False
         self.initial_current = 0
         self.voltage = 0
         
@@ -257,12 +261,14 @@ class _BM2_heater_test:
             # initialise the aardvark
             if AARD.port != None:
                 # if an aardvark was found, read the data
-                self.initial_current = AARD.read_SCPI("BM2:TEL? 10,data", 
-                                                      self.properties.address, 
-                                                      "uint")/1000.0
-                self.voltage = AARD.read_SCPI("BM2:TEL? 9,data", 
-                                              self.properties.address, 
-                                              "uint")/1000.0
+                bm2 = telemetry_map.bm2_telemetry(AARD, 
+                                                  self.properties.address)
+                self.initial_current = bm2.discharge_current()
+                self.voltage = bm2.voltage()
+                
+                # the heater power can not be found without both readings
+                self.read_failed = (self.initial_current == None) or \
+                                   (self.voltage == None)
             else:
                 # no aardvark was found
                 self.no_aardvark = True
@@ -296,6 +302,14 @@ class _BM2_heater_test:
                                  bg = process_GUI.default_color)
             self.error_label.grid(row = 2, column=0, columnspan = 2)   
         
+        elif self.read_failed:
+            # the BM2 did not respond so print an error
+            self.error_label = TK.Label(parent_frame, 
+                                        text = "Could not read the BM2")
+            self.error_label.config(font = process_GUI.label_font, 
+                                 bg = process_GUI.default_color)
+            self.error_label.grid(row = 2, column=0, columnspan = 2)   
+        
         else:
             # Aardvark communications were successful so load the rest of the GUI
         
@@ -332,7 +346,7 @@ class _BM2_heater_test:
         self.Header.grid_forget()
         self.body.grid_forget()
         
-        if self.no_aardvark:
+        if self.no_aardvark or self.read_failed:
             # if an aardvark was not found remove the error label
             self.error_label.grid_forget()
             
@@ -369,9 +383,9 @@ class _BM2_heater_test:
                 time.sleep(2)
                 
                 # read the new current
-                new_current = AARD.read_SCPI("BM2:TEL? 10,data", 
-                                             self.properties.address, 
-                                             "int")/-1000.0    
+                bm2 = telemetry_map.bm2_telemetry(AARD, 
+                                                  self.properties.address)
+                new_current = bm2.discharge_current()
                 
                 #comand the heater to turn off again
                 AARD.send_SCPI("BM2:HEA OFF", self.properties.address)
@@ -382,6 +396,12 @@ class _BM2_heater_test:
             #end if
         # end with
         
+        if new_current == None:
+            # the heated current could not be read
+            self.power.insert(0, 'Read failed')
+            return
+        # end if
+        
         # calculate the power increase with the heaters on
         heater_power = (new_current * self.voltage) - rest_power
         
@@ -584,26 +604,19 @@ class _Calibrate_Temp:
             # initialise the aardvark
             if AARD.port != None:
                 # if an aardvark was found, extract the device NVM key.
-                nvm_key = AARD.read_SCPI("SUP:TEL? 9,data", 
-                                         self.properties.address, "uint")+12345   
+                bm2 = telemetry_map.bm2_telemetry(AARD, 
+                                                  self.properties.address)
+                nvm_key = bm2.serial_number() + 12345
                 
                 # initialise sample list
                 num_samples = 10
-                temp_samples = num_samples*[6*[0]]
+                temp_samples = []
                 
-                for sample in temp_samples:
-                    sample[0] = AARD.read_SCPI("BM2:TEL? 50,data", 
-                                         self.properties.address, "uint")
-                    sample[1] = AARD.read_SCPI("BM2:TEL? 51,data", 
-                                                               self.properties.address, "uint")
-                    sample[2] = AARD.read_SCPI("BM2:TEL? 71,data", 
-                                                               self.properties.address, "uint")
-                    sample[3] = AARD.read_SCPI("BM2:TEL? 72,data", 
-                                                               self.properties.address, "uint")
-                    sample[4] = AARD.read_SCPI("BM2:TEL? 73,data", 
-                                                               self.properties.address, "uint")
-                    sample[5] = AARD.read_SCPI("BM2:TEL? 74,data", 
-                                                               self.properties.address, "uint")
+                for i in range(num_samples):
+                    # read all of the channels in one batch
+                    temps = bm2.read_many(telemetry_map.BM2_TEMPERATURES)
+                    temp_samples.append([temps[name] for name in 
+                                         telemetry_map.BM2_TEMPERATURES])
                     time.sleep(1)
                 # end for
                 
@@ -611,8 +624,7 @@ class _Calibrate_Temp:
                 average_temps = self.average_temperatures(temp_samples)
                 
                 # read the current offsets
-                temp_offsets = AARD.read_SCPI("BM2:TEL? 75,data", 
-                                         self.properties.address, 6*["float"])
+                temp_offsets = bm2.temperature_offsets()
                 
                 # un-adjust the temperatures read
                 average_temps = [t-o for t,o in zip(average_temps, temp_offsets)]
@@ -622,16 +634,18 @@ class _Calibrate_Temp:
                 offsets = [cal_temp-t for t in average_temps]
                 
                 # unlock the module NVM, set the tuning parameter and write it 
-                # to the NVM
-                AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
-                               self.properties.address)
-                for i in range(len(offsets)):
-                    param_text = str(i+2) + ',' + str(offsets[i])
-                    AARD.send_SCPI("BM2:NVM T_OFFSET,"+param_text, 
+                # to the NVM without any other commands in between
+                with AARD.hold():
+                    AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
                                    self.properties.address)
-                # end for
-                AARD.send_SCPI("SUP:NVM WRITE,1", 
-                               self.properties.address)
+                    for i in range(len(offsets)):
+                        param_text = str(i+2) + ',' + str(offsets[i])
+                        AARD.send_SCPI("BM2:NVM T_OFFSET,"+param_text, 
+                                       self.properties.address)
+                    # end for
+                    AARD.send_SCPI("SUP:NVM WRITE,1", 
+                                   self.properties.address)
+                # end with
                 
             else:
                 # no aardvark was found
@@ -650,20 +664,25 @@ class BM2_Process(object):
                                                             of BM2 process
     @attribute process     (list)                           Steps in the process
     """
-    # define the properties of the Process
-    properties = SUP_process.process_properties("BM2", "0x5C")
-    
-    # get the SupMCU process list
-    __sup_process = SUP_process.SupMCU_process(properties)
-    
-    # initialise the BM2 process steps
-    __verification = _BM2_verification(properties)
-    __heater_test = _BM2_heater_test(properties)
-    __update_flash = BM2_flash.Update_Flash(properties)
-    __sup_temp_cal = _Calibrate_Temp(properties)
-    
-    # construct the list of steps in the process
-    process = __sup_process.process + \
-             [__update_flash, __sup_temp_cal, __verification,
-             __heater_test]
+    def __init__(self):
+        """
+        Initialise the steps of the process, this is done when the process is
+        created rather than when the module is imported.
+        """
+        # define the properties of the Process
+        self.properties = SUP_process.process_properties("BM2", "0x5C")
+        
+        # get the SupMCU process list
+        sup_process = SUP_process.SupMCU_process(self.properties)
+        
+        # initialise the BM2 process steps
+        verification = _BM2_verification(self.properties)
+        heater_test = _BM2_heater_test(self.properties)
+        update_flash = BM2_flash.Update_Flash(self.properties)
+        sup_temp_cal = _Calibrate_Temp(self.properties)
+        
+        # construct the list of steps in the process
+        self.process = sup_process.process + \
+                       [update_flash, sup_temp_cal, verification, heater_test]
+    # end def
 #end object
\ No newline at end of file
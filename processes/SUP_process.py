@@ -28,6 +28,7 @@ import Tkinter as TK
 from functools import partial
 import process_SCPI
 import process_GUI
+import telemetry_map
 import time
 
 #
@@ -134,9 +135,9 @@ class _Serial_number:
             # initialise the aardvark
             if AARD.port != None:
                 # if an aardvark was found, read the data
-                self.serial_number = AARD.read_SCPI("SUP:TEL? 9,data", 
-                                                    self.properties.address,
-                                                    "uint")
+                module = telemetry_map.sup_telemetry(AARD, 
+                                                     self.properties.address)
+                self.serial_number = module.serial_number()
             else:
                 # no aardvark was found
                 self.no_aardvark = True
@@ -258,12 +259,14 @@ class _Serial_number:
             if AARD.port != None:
                 # if an aardvark was found, send the commands to unlock the NVM,
                 # update the serial number and write it to NVM
-                AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
-                               self.properties.address)
-                AARD.send_SCPI("SUP:NVM SERIAL,"+serial_text, 
-                               self.properties.address)
-                AARD.send_SCPI("SUP:NVM WRITE,1", 
-                               self.properties.address)
+                with AARD.hold():
+                    AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
+                                   self.properties.address)
+                    AARD.send_SCPI("SUP:NVM SERIAL,"+serial_text, 
+                                   self.properties.address)
+                    AARD.send_SCPI("SUP:NVM WRITE,1", 
+                                   self.properties.address)
+                # end with
             else:
                 # no aardvark was found
                 self.no_aardvark = True
@@ -468,17 +471,20 @@ class _I2C_address:
             if AARD.port != None:
                 # if an aardvark was found extract the NVM key from the 
                 # serial number
-                nvm_key = AARD.read_SCPI("SUP:TEL? 9,data", 
-                                         self.properties.address, "uint")+12345   
+                module = telemetry_map.sup_telemetry(AARD, 
+                                                     self.properties.address)
+                nvm_key = module.serial_number() + 12345
                 
                 # send the commands to unlock the NVM, update the I2C address 
                 # and write it to the NVM
-                AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
-                               self.properties.address)
-                AARD.send_SCPI("SUP:NVM I2C,"+str(address_num), 
-                               self.properties.address)
-                AARD.send_SCPI("SUP:NVM WRITE,1", 
-                               address_text)
+                with AARD.hold():
+                    AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
+                                   self.properties.address)
+                    AARD.send_SCPI("SUP:NVM I2C,"+str(address_num), 
+                                   self.properties.address)
+                    AARD.send_SCPI("SUP:NVM WRITE,1", 
+                                   address_text)
+                # end with
                 
                 #update the address in the process properties
                 self.properties.address = address_text
@@ -543,9 +549,9 @@ class _Update_OSCTUN:
             # initialise the aardvark
             if AARD.port != None:
                 # if an aardvark was found, read the data
-                self.tuning_param = AARD.read_SCPI("SUP:TEL? 11,data", 
-                                                    self.properties.address,
-                                                    "schar")
+                module = telemetry_map.sup_telemetry(AARD, 
+                                                     self.properties.address)
+                self.tuning_param = module.tuning()
                 
             else:
                 # no aardvark was found
@@ -667,17 +673,20 @@ class _Update_OSCTUN:
             # initialise the aardvark
             if AARD.port != None:
                 # if an aardvark was found, extract the device NVM key.
-                nvm_key = AARD.read_SCPI("SUP:TEL? 9,data", 
-                                         self.properties.address, "uint")+12345   
+                module = telemetry_map.sup_telemetry(AARD, 
+                                                     self.properties.address)
+                nvm_key = module.serial_number() + 12345
                 
                 # unlock the module NVM, set the tuning parameter and write it 
                 # to the NVM
-                AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
-                               self.properties.address)
-                AARD.send_SCPI("SUP:NVM OSCTUN,"+param_text, 
-                               self.properties.address)
-                AARD.send_SCPI("SUP:NVM WRITE,1", 
-                               self.properties.address)
+                with AARD.hold():
+                    AARD.send_SCPI("SUP:NVM UNLOCK,"+str(nvm_key), 
+                                   self.properties.address)
+                    AARD.send_SCPI("SUP:NVM OSCTUN,"+param_text, 
+                                   self.properties.address)
+                    AARD.send_SCPI("SUP:NVM WRITE,1", 
+                                   self.properties.address)
+                # end with
                 
             else:
                 # no aardvark was found
@@ -0,0 +1,1050 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package SCPI_simulator
+Module that simulates aardvarks connected to SupMCU modules so that processes
+can be run without any hardware. It provides the parts of the aardvark_py
+interface used by process_SCPI so that it can be used in its place, either by
+setting the SCPI_TRANSPORT environment variable to 'simulator' or by calling
+process_SCPI.set_transport(SCPI_simulator).
+
+A BM2 is simulated at 0x5C by default, with its data flash loaded from
+full_data_flash.csv.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import time
+import random
+import struct
+import csv
+import os
+import threading
+from array import array
+
+#
+# ---------
+# Constants
+
+# the aardvark_py constants used by process_SCPI
+AA_OK                        =    0
+AA_UNABLE_TO_OPEN            =   -7
+AA_INVALID_HANDLE            =   -9
+AA_I2C_NOT_AVAILABLE         = -100
+AA_I2C_READ_ERROR            = -102
+AA_I2C_WRITE_ERROR           = -103
+AA_PORT_NOT_FREE             = 0x8000
+AA_FEATURE_SPI               = 0x00000001
+AA_FEATURE_I2C               = 0x00000002
+AA_CONFIG_SPI_I2C            = 0x03
+AA_I2C_NO_FLAGS              = 0x00
+AA_I2C_PULLUP_BOTH           = 0x03
+AA_I2C_STATUS_OK             = 0
+AA_I2C_STATUS_BUS_ERROR      = 1
+AA_I2C_STATUS_SLA_ACK        = 2
+AA_I2C_STATUS_SLA_NACK       = 3
+AA_I2C_STATUS_DATA_NACK      = 4
+AA_I2C_STATUS_ARB_LOST       = 5
+AA_I2C_STATUS_BUS_LOCKED     = 6
+AA_I2C_MONITOR_NOT_ENABLED   = -501
+AA_FEATURE_I2C_MONITOR       = 0x00000010
+AA_ASYNC_NO_DATA             = 0x00000000
+AA_ASYNC_I2C_MONITOR         = 0x00000008
+AA_I2C_MONITOR_DATA          = 0x00ff
+AA_I2C_MONITOR_NACK          = 0x0100
+AA_I2C_MONITOR_CMD_START     = 0xff00
+AA_I2C_MONITOR_CMD_STOP      = 0xff01
+
+# the data flash snapshot to load into a simulated BM2
+_Data_flash_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'full_data_flash.csv')
+
+# the size of a data flash page
+_Page_size = 32
+
+# the size of a telemetry name
+_Name_size = 32
+
+# time for the module to process a command (ms), by command prefix
+_Turnaround = {'default': 2.0,
+               'SUP:NVM WRITE': 50.0,
+               'BM2:BQF READ_PAGE': 20.0,
+               'BM2:BQF WRITE': 100.0}
+
+#
+# ---------
+# Classes
+
+class SupMCU_module:
+    """
+    Class that simulates a SupMCU module
+    
+    @attribute address     (int)     The I2C address of the module
+    @attribute telemetry   (dict)    The (name, struct format, value) of each
+                                     telemetry item, by SCPI header and index
+    @attribute nvm         (dict)    The settings stored in the NVM
+    @attribute pending     (dict)    Settings that will be stored on the next
+                                     NVM write
+    @attribute unlocked    (bool)    True if the NVM has been unlocked
+    @attribute response    (array)   The response to the last command
+    @attribute ready_time  (float)   The time the response will be ready
+    @attribute commands    (list)    The commands that have been received
+    @attribute start_time  (float)   The time the module was started
+    """
+    
+    # the SCPI header of the module's own commands
+    header = 'SUP'
+    
+    def __init__(self, address, serial = 1234):
+        """
+        Initialise the module
+        
+        @param[in]    address:         the I2C address of the module (int)
+        @param[in]    serial:          the serial number of the module (int)
+        """
+        self.address = address
+        
+        self.nvm = {'SERIAL': serial, 'I2C': address, 'OSCTUN': 0}
+        
+        self.pending = {}
+        
+        self.unlocked = False
+        
+        self.response = array('B', [0])
+        
+        self.ready_time = 0.0
+        
+        self.commands = []
+        
+        self.start_time = _clock()
+        
+        self.telemetry = {
+            ('SUP', 0): ('Firmware version', '32s', 'SIM 1.0'),
+            ('SUP', 1): ('Uptime', '<l', 0),
+            ('SUP', 9): ('Serial number', '<H', serial),
+            ('SUP', 11): ('Oscillator tuning', '<b', 0)}
+    # end def
+    
+    def update_telemetry(self):
+        """
+        Update the telemetry that changes with time or the NVM settings
+        """
+        self.set_telemetry('SUP', 1, int(_clock() - self.start_time))
+        self.set_telemetry('SUP', 9, self.nvm['SERIAL'])
+        self.set_telemetry('SUP', 11, self.nvm['OSCTUN'])
+    # end def
+    
+    def set_telemetry(self, header, index, value):
+        """
+        Set the value of a telemetry item
+        
+        @param[in]    header:          the SCPI header of the item (string)
+        @param[in]    index:           the telemetry index (int)
+        @param[in]    value:           the new value of the item
+        """
+        (name, format, old_value) = self.telemetry[(header, index)]
+        self.telemetry[(header, index)] = (name, format, value)
+    # end def
+    
+    def receive(self, command):
+        """
+        Process a received command and prepare its response
+        
+        @param[in]    command:         the SCPI command without terminator
+                                       (string)
+        """
+        self.commands.append(command)
+        
+        # the module is busy until the command is processed, after any 
+        # command that it is still processing
+        turnaround = _Turnaround['default']
+        
+        for prefix in _Turnaround:
+            if command.startswith(prefix):
+                turnaround = _Turnaround[prefix]
+            # end if
+        # end for
+        
+        self.ready_time = max(_clock(), self.ready_time) + \
+                          turnaround*transport.time_scale/1000.0
+        
+        if command.upper().startswith(('SUP:TEL?', self.header + ':TEL?')):
+            self.response = self.telemetry_response(command)
+        
+        else:
+            # commands have no response
+            self.response = array('B', [0])
+            self.execute(command)
+        # end if
+    # end def
+    
+    def telemetry_response(self, command):
+        """
+        Prepare the response to a telemetry request
+        
+        @param[in]    command:         the request eg. "SUP:TEL? 9,data"
+                                       (string)
+        @return       (array)          The bytes of the response
+        """
+        try:
+            (header, request) = command.split(':TEL?', 1)
+            (index, field) = request.strip().split(',', 1)
+            (name, format, value) = self.telemetry[(header, int(index))]
+        
+        except (ValueError, KeyError):
+            # unknown item so the response is never ready
+            return array('B', [0])
+        # end try
+        
+        self.update_telemetry()
+        (name, format, value) = self.telemetry[(header, int(index))]
+        
+        if isinstance(value, (list, tuple)):
+            data = struct.pack(format, *value)
+        
+        else:
+            data = struct.pack(format, value)
+        # end if
+        
+        if field == 'ascii':
+            # text has no preamble
+            return array('B', str(value) + '\0')
+        
+        elif field == 'name':
+            data = struct.pack(str(_Name_size) + 's', name)
+        
+        elif field == 'length':
+            data = struct.pack('<h', len(data))
+        # end if
+        
+        # write flag and timestamp preamble
+        preamble = struct.pack('<BL', 1, int(_clock()*1000) & 0xFFFFFFFF)
+        
+        return array('B', preamble + data)
+    # end def
+    
+    def execute(self, command):
+        """
+        Carry out a command that has no response
+        
+        @param[in]    command:         the SCPI command (string)
+        """
+        (name, comma, parameters) = command.partition(',')
+        parameters = parameters.split(',') if comma else []
+        
+        if name == 'SUP:NVM UNLOCK':
+            self.unlocked = (int(parameters[0]) == self.nvm['SERIAL'] + 12345)
+        
+        elif name in ('SUP:NVM SERIAL', 'SUP:NVM I2C', 'SUP:NVM OSCTUN'):
+            self.pending[name.split(' ')[1]] = int(parameters[0])
+        
+        elif name == 'SUP:NVM WRITE':
+            if self.unlocked:
+                self.nvm.update(self.pending)
+            # end if
+            
+            self.pending = {}
+            self.unlocked = False
+        # end if
+    # end def
+# end class
+
+
+class BM2_module(SupMCU_module):
+    """
+    Class that simulates a BM2 battery module, including the data flash of
+    its gas gauge.
+    
+    @attribute data_flash  (dict)    The bytes of each data flash subclass
+    @attribute heater      (bool)    True if the heater is on
+    @attribute temps       (list)    The uncalibrated temperatures (0.1 K)
+    @attribute offsets     (list)    The temperature offsets (0.1 K)
+    """
+    
+    header = 'BM2'
+    
+    def __init__(self, address, serial = 1234, flash_file = _Data_flash_file):
+        """
+        Initialise the module
+        
+        @param[in]    address:         the I2C address of the module (int)
+        @param[in]    serial:          the serial number of the module (int)
+        @param[in]    flash_file:      the data flash snapshot to load (string)
+        """
+        SupMCU_module.__init__(self, address, serial)
+        
+        self.data_flash = load_data_flash(flash_file)
+        
+        self.heater = False
+        
+        self.temps = [2981, 2983, 2979, 2980, 2982, 2984]
+        
+        self.offsets = 6*[0]
+        
+        self.telemetry.update({
+            ('BM2', 8): ('Temperature', '<H', 2981),
+            ('BM2', 9): ('Voltage', '<H', 8200),
+            ('BM2', 10): ('Current', '<h', 0),
+            ('BM2', 13): ('Relative state of charge', '<B', 90),
+            ('BM2', 50): ('Temperature 1', '<H', 0),
+            ('BM2', 51): ('Temperature 2', '<H', 0),
+            ('BM2', 71): ('Temperature 3', '<H', 0),
+            ('BM2', 72): ('Temperature 4', '<H', 0),
+            ('BM2', 73): ('Temperature 5', '<H', 0),
+            ('BM2', 74): ('Temperature 6', '<H', 0),
+            ('BM2', 75): ('Temperature offsets', '<6f', 6*[0.0]),
+            ('BM2', 78): ('Data flash page', '33B', 33*[0])})
+    # end def
+    
+    def update_telemetry(self):
+        """
+        Update the telemetry that changes with time or the NVM settings
+        """
+        SupMCU_module.update_telemetry(self)
+        
+        # the heater draws current from the battery
+        self.set_telemetry('BM2', 10, -1500 if self.heater else -20)
+        
+        temperatures = [t + o for t, o in zip(self.temps, self.offsets)]
+        
+        for (index, temp) in zip([50, 51, 71, 72, 73, 74], temperatures):
+            self.set_telemetry('BM2', index, temp)
+        # end for
+        
+        self.set_telemetry('BM2', 75, [float(o) for o in self.offsets])
+    # end def
+    
+    def execute(self, command):
+        """
+        Carry out a command that has no response
+        
+        @param[in]    command:         the SCPI command (string)
+        """
+        (name, comma, parameters) = command.partition(',')
+        parameters = parameters.split(',') if comma else []
+        
+        if name == 'BM2:HEA ON':
+            self.heater = True
+        
+        elif name == 'BM2:HEA OFF':
+            self.heater = False
+        
+        elif name == 'BM2:NVM T_OFFSET':
+            self.pending[('T_OFFSET', int(parameters[0]))] = \
+                int(float(parameters[1]))
+        
+        elif name == 'SUP:NVM WRITE':
+            for key in self.pending.keys():
+                if isinstance(key, tuple) and self.unlocked:
+                    # temperature offsets are numbered from 2
+                    self.offsets[key[1]-2] = self.pending.pop(key)
+                # end if
+            # end for
+            
+            SupMCU_module.execute(self, command)
+        
+        elif name == 'BM2:BQF READ_PAGE':
+            self.read_page(int(parameters[0]), int(parameters[1]))
+        
+        elif name == 'BM2:BQF WRITE':
+            self.write_flash(int(parameters[0]), int(parameters[1]),
+                             [int(item) for item in parameters[3:]])
+        
+        else:
+            SupMCU_module.execute(self, command)
+        # end if
+    # end def
+    
+    def read_page(self, ID, page):
+        """
+        Load a page of the data flash into telemetry item 78, whose first byte
+        is the number of bytes in the page
+        
+        @param[in]    ID:              the subclass ID (int)
+        @param[in]    page:            the page number, from 1 (int)
+        """
+        subclass = self.data_flash.get(ID, [])
+        data = subclass[(page-1)*_Page_size:page*_Page_size]
+        
+        self.set_telemetry('BM2', 78,
+                           [len(data)] + data + (_Page_size-len(data))*[0])
+    # end def
+    
+    def write_flash(self, ID, offset, data):
+        """
+        Write bytes into a data flash subclass
+        
+        @param[in]    ID:              the subclass ID (int)
+        @param[in]    offset:          the offset to write at (int)
+        @param[in]    data:            the bytes to write (list)
+        """
+        subclass = self.data_flash.setdefault(ID, [])
+        
+        if len(subclass) < offset + len(data):
+            subclass.extend((offset + len(data) - len(subclass))*[0])
+        # end if
+        
+        subclass[offset:offset+len(data)] = data
+    # end def
+# end class
+
+
+class simulated_transport:
+    """
+    Class that holds the configuration and state of the simulation
+    
+    @attribute modules     (dict)    The modules on the bus, by address
+    @attribute unique_ids  (list)    The unique ID of each simulated aardvark
+    @attribute in_use      (list)    The ports opened by another application
+    @attribute open_ports  (dict)    The port of each open handle
+    @attribute monitors    (dict)    The monitor words waiting to be read by
+                                     each handle that is monitoring the bus
+    @attribute time_scale  (float)   Factor to scale all delays by
+    @attribute bitrate     (int)     The I2C bitrate (kHz)
+    @attribute max_bitrate (int)     The fastest bitrate that works, faster 
+                                     transfers are often not acknowledged or
+                                     are corrupted (kHz)
+    @attribute nak_rate    (float)   Probability that a transfer is not
+                                     acknowledged
+    @attribute dead        (list)    Addresses that never acknowledge
+    @attribute random      (Random)  Source of the simulated errors
+    @attribute lock        (Lock)    Protects the state
+    """
+    
+    def __init__(self):
+        """
+        Initialise the default simulation of one aardvark and one BM2
+        """
+        self.modules = {}
+        
+        self.unique_ids = [2237000001]
+        
+        self.in_use = []
+        
+        self.open_ports = {}
+        
+        self.monitors = {}
+        
+        self.time_scale = 1.0
+        
+        self.bitrate = 100
+        
+        self.max_bitrate = 400
+        
+        self.nak_rate = 0.0
+        
+        self.dead = []
+        
+        self.random = random.Random(0)
+        
+        self.lock = threading.Lock()
+    # end def
+    
+    def module(self, address):
+        """
+        Find the module that will respond at an address
+        
+        @param[in]    address:         the I2C address (int)
+        @return       (SupMCU_module)  The module, None if there is none
+        """
+        if not self.modules:
+            # create the default BM2 when it is first needed
+            self.modules[0x5C] = BM2_module(0x5C)
+        # end if
+        
+        if (address in self.dead) or (self.random.random() < self.nak_rate):
+            return None
+        # end if
+        
+        if (self.bitrate > self.max_bitrate) and (self.random.random() < 0.5):
+            # too fast for the bus so the address is lost
+            return None
+        # end if
+        
+        for module in self.modules.values():
+            if module.nvm['I2C'] == address:
+                return module
+            # end if
+        # end for
+        
+        return None
+    # end def
+    
+    def transfer(self, length):
+        """
+        Spend the time taken to move bytes over the bus
+        
+        @param[in]    length:          the number of bytes, including the
+                                       address (int)
+        """
+        _sleep(length*9.0/(self.bitrate*1000.0))
+    # end def
+    
+    def monitor(self, address, read, data, acknowledged):
+        """
+        Show a transfer to every aardvark that is monitoring the bus
+        
+        @param[in]    address:         the I2C address (int)
+        @param[in]    read:            True for a read, False for a write 
+                                       (bool)
+        @param[in]    data:            the bytes transferred (array)
+        @param[in]    acknowledged:    False if the address was not 
+                                       acknowledged (bool)
+        """
+        if not self.monitors:
+            return
+        # end if
+        
+        words = [AA_I2C_MONITOR_CMD_START, 
+                 (address << 1) | int(read) | 
+                 (AA_I2C_MONITOR_NACK*int(not acknowledged))]
+        
+        if acknowledged:
+            words.extend(data)
+        # end if
+        
+        words.append(AA_I2C_MONITOR_CMD_STOP)
+        
+        with self.lock:
+            for handle in self.monitors:
+                self.monitors[handle].extend(words)
+            # end for
+        # end with
+    # end def
+# end class
+
+#
+# ----------------
+# Public Functions
+
+def load_data_flash(file_name):
+    """
+    Load a data flash snapshot saved by BM2_flash
+    
+    @param[in]    file_name:       the csv file to load (string)
+    @return       (dict)           The bytes of each subclass
+    """
+    data_flash = {}
+    
+    if not os.path.isfile(file_name):
+        return data_flash
+    # end if
+    
+    with open(file_name, 'rb') as flash_file:
+        for row in csv.reader(flash_file, delimiter = '\t'):
+            try:
+                values = [int(item) for item in row if item.strip() != '']
+            
+            except ValueError:
+                # skip the header rows
+                continue
+            # end try
+            
+            if len(values) >= 2:
+                data_flash[values[0]] = values[2:2+values[1]]
+            # end if
+        # end for
+    # end with
+    
+    return data_flash
+# end def
+
+def configure(modules = None, adapters = 1, time_scale = 1.0, nak_rate = 0.0,
+              dead = [], seed = 0, max_bitrate = 400):
+    """
+    Configure the simulation, this resets the state of every module.
+    
+    @param[in]    modules:         the simulated modules, None for one BM2 at
+                                   0x5C (list of SupMCU_module)
+    @param[in]    adapters:        the number of aardvarks connected (int)
+    @param[in]    time_scale:      factor to scale all delays by, 0 to run
+                                   without delays (float)
+    @param[in]    nak_rate:        probability that a transfer is not
+                                   acknowledged (float)
+    @param[in]    dead:            addresses that never acknowledge (list)
+    @param[in]    seed:            seed for the simulated errors (int)
+    @param[in]    max_bitrate:     the fastest bitrate that works (kHz)
+    """
+    with transport.lock:
+        transport.modules = {}
+        
+        for module in (modules or []):
+            transport.modules[module.address] = module
+        # end for
+        
+        transport.unique_ids = [2237000001 + i for i in range(adapters)]
+        transport.time_scale = time_scale
+        transport.nak_rate = nak_rate
+        transport.dead = list(dead)
+        transport.random = random.Random(seed)
+        transport.max_bitrate = max_bitrate
+    # end with
+# end def
+
+def aa_find_devices(devices):
+    """
+    Find the simulated aardvarks
+    
+    @param[in]    devices:         the maximum number to find (int)
+    @return       (int, array)     The number found and their ports
+    """
+    (count, ports, unique_ids) = aa_find_devices_ext(devices, devices)
+    return (count, ports)
+# end def
+
+def aa_find_devices_ext(devices, unique_ids):
+    """
+    Find the simulated aardvarks and their unique IDs
+    
+    @param[in]    devices:         the maximum number to find (int)
+    @param[in]    unique_ids:      the maximum number of IDs to return (int)
+    @return       (int, array, array) The number found, their ports and IDs
+    """
+    count = len(transport.unique_ids)
+    
+    # ports opened by this or another application are not free
+    used = transport.in_use + transport.open_ports.values()
+    
+    ports = array('H', [port | (AA_PORT_NOT_FREE*(port in used))
+                        for port in range(count)][:devices])
+    
+    return (count, ports, array('L', transport.unique_ids[:unique_ids]))
+# end def
+
+def aa_open(port_number):
+    """
+    Open a simulated aardvark
+    
+    @param[in]    port_number:     the port to open (int)
+    @return       (int)            The handle, negative if it cannot be opened
+    """
+    with transport.lock:
+        if (port_number >= len(transport.unique_ids)) or \
+           (port_number in transport.in_use) or \
+           (port_number in transport.open_ports.values()):
+            return AA_UNABLE_TO_OPEN
+        # end if
+        
+        handle = max(transport.open_ports.keys() + [0]) + 1
+        transport.open_ports[handle] = port_number
+    # end with
+    
+    return handle
+# end def
+
+def aa_close(aardvark):
+    """
+    Close a simulated aardvark
+    
+    @param[in]    aardvark:        the handle to close (int)
+    @return       (int)            The number of handles closed
+    """
+    with transport.lock:
+        transport.monitors.pop(aardvark, None)
+        return int(transport.open_ports.pop(aardvark, None) != None)
+    # end with
+# end def
+
+def aa_features(aardvark):
+    """
+    Get the features of a simulated aardvark
+    
+    @param[in]    aardvark:        the handle (int)
+    @return       (int)            The feature bits, negative if not open
+    """
+    if aardvark not in transport.open_ports:
+        return AA_INVALID_HANDLE
+    # end if
+    
+    return AA_FEATURE_SPI | AA_FEATURE_I2C | AA_FEATURE_I2C_MONITOR
+# end def
+
+def aa_configure(aardvark, config):
+    """
+    Configure a simulated aardvark, only I2C is simulated
+    """
+    return config
+# end def
+
+def aa_i2c_pullup(aardvark, pullup_mask):
+    """
+    Set the pullups of a simulated aardvark, they have no effect
+    """
+    return pullup_mask
+# end def
+
+def aa_i2c_bitrate(aardvark, bitrate_khz):
+    """
+    Set the I2C bitrate, which sets the time taken to move bytes
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    bitrate_khz:     the bitrate (int)
+    @return       (int)            The bitrate set
+    """
+    # the aardvark cannot go faster than 800 kHz
+    transport.bitrate = min(bitrate_khz, 800)
+    return transport.bitrate
+# end def
+
+def aa_i2c_free_bus(aardvark):
+    """
+    Free the simulated bus, it is never held
+    """
+    return AA_OK
+# end def
+
+def aa_sleep_ms(milliseconds):
+    """
+    Sleep for a scaled time
+    
+    @param[in]    milliseconds:    the time to sleep (int)
+    @return       (int)            The time slept
+    """
+    _sleep(milliseconds/1000.0)
+    return milliseconds
+# end def
+
+def aa_i2c_write(aardvark, slave_addr, flags, data_out):
+    """
+    Write a command to a simulated module
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    slave_addr:      the address of the module (int)
+    @param[in]    flags:           the I2C flags (int)
+    @param[in]    data_out:        the bytes to write (array or tuple of
+                                   array and length)
+    @return       (int)            The number of bytes written, negative on
+                                   error
+    """
+    (data_out, length) = _array_length(data_out)
+    
+    if aardvark not in transport.open_ports:
+        return AA_INVALID_HANDLE
+    # end if
+    
+    with transport.lock:
+        module = transport.module(slave_addr)
+    # end with
+    
+    # compared with 'is' as == looks up __eq__ and __cmp__ on the instance
+    if module is None:
+        # the address was not acknowledged
+        transport.transfer(1)
+        transport.monitor(slave_addr, False, data_out, False)
+        return 0
+    # end if
+    
+    transport.transfer(length + 1)
+    transport.monitor(slave_addr, False, data_out[:length], True)
+    
+    # the command is the bytes before the terminator
+    command = data_out[:length].tostring().split('\n', 1)[0]
+    
+    with transport.lock:
+        module.receive(command)
+    # end with
+    
+    return length
+# end def
+
+def aa_i2c_read(aardvark, slave_addr, flags, data_in):
+    """
+    Read the response from a simulated module
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    slave_addr:      the address of the module (int)
+    @param[in]    flags:           the I2C flags (int)
+    @param[in]    data_in:         array to read into, or its length
+                                   (array, tuple of array and length, or int)
+    @return       (int, array)     The number of bytes read, negative on
+                                   error, and the bytes read
+    """
+    if isinstance(data_in, (int, long)):
+        data_in = array('B', data_in*[0])
+    # end if
+    
+    (data_in, length) = _array_length(data_in)
+    
+    if aardvark not in transport.open_ports:
+        return (AA_INVALID_HANDLE, data_in)
+    # end if
+    
+    with transport.lock:
+        module = transport.module(slave_addr)
+    # end with
+    
+    if module is None:
+        # the address was not acknowledged
+        transport.transfer(1)
+        transport.monitor(slave_addr, True, data_in, False)
+        return (0, data_in)
+    # end if
+    
+    transport.transfer(length + 1)
+    
+    with transport.lock:
+        if _clock() < module.ready_time:
+            # the module has not finished so shows that it is not ready
+            response = array('B', [0])
+        
+        else:
+            response = module.response
+        # end if
+    # end with
+    
+    for i in range(length):
+        data_in[i] = response[i] if i < len(response) else 0
+    # end for
+    
+    if (transport.bitrate > transport.max_bitrate) and (length > 1):
+        # too fast for the bus so a bit is lost
+        with transport.lock:
+            data_in[transport.random.randrange(1, length)] ^= 0x01
+        # end with
+    # end if
+    
+    transport.monitor(slave_addr, True, data_in[:length], True)
+    
+    return (length, data_in)
+# end def
+
+def aa_i2c_write_read(aardvark, slave_addr, flags, out_data, in_data):
+    """
+    Write a command to a simulated module and read straight back
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    slave_addr:      the address of the module (int)
+    @param[in]    flags:           the I2C flags (int)
+    @param[in]    out_data:        the bytes to write (array)
+    @param[in]    in_data:         array to read into (array)
+    @return       (int, int, array, int) The status, the number of bytes
+                                   written, the bytes read and the number of
+                                   bytes read
+    """
+    (write_status, written) = aa_i2c_write_ext(aardvark, slave_addr, flags, 
+                                               out_data)
+    
+    if write_status != AA_I2C_STATUS_OK:
+        # the read is not attempted
+        return (write_status, written, in_data, 0)
+    # end if
+    
+    (read_status, in_data, count) = aa_i2c_read_ext(aardvark, slave_addr, 
+                                                    flags, in_data)
+    
+    if read_status < 0:
+        return (read_status, written, in_data, count)
+    # end if
+    
+    # the write status is in the low byte and the read status the high byte
+    return (read_status << 8, written, in_data, count)
+# end def
+
+def aa_i2c_write_ext(aardvark, slave_addr, flags, data_out):
+    """
+    Write a command to a simulated module, reporting the I2C status
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    slave_addr:      the address of the module (int)
+    @param[in]    flags:           the I2C flags (int)
+    @param[in]    data_out:        the bytes to write (array)
+    @return       (int, int)       The AA_I2C_STATUS, negative on error, and
+                                   the number of bytes written
+    """
+    written = aa_i2c_write(aardvark, slave_addr, flags, data_out)
+    
+    if written < 0:
+        return (written, 0)
+    
+    elif written == 0:
+        return (AA_I2C_STATUS_SLA_NACK, 0)
+    # end if
+    
+    return (AA_I2C_STATUS_OK, written)
+# end def
+
+def aa_i2c_read_ext(aardvark, slave_addr, flags, data_in):
+    """
+    Read the response from a simulated module, reporting the I2C status
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    slave_addr:      the address of the module (int)
+    @param[in]    flags:           the I2C flags (int)
+    @param[in]    data_in:         array to read into, or its length
+                                   (array or int)
+    @return       (int, array, int) The AA_I2C_STATUS, negative on error, the
+                                   bytes read and the number of bytes read
+    """
+    (count, data_in) = aa_i2c_read(aardvark, slave_addr, flags, data_in)
+    
+    if count < 0:
+        return (count, data_in, 0)
+    
+    elif count == 0:
+        return (AA_I2C_STATUS_SLA_NACK, data_in, 0)
+    # end if
+    
+    return (AA_I2C_STATUS_OK, data_in, count)
+# end def
+
+def aa_i2c_monitor_enable(aardvark):
+    """
+    Start monitoring the simulated bus
+    
+    @param[in]    aardvark:        the handle (int)
+    @return       (int)            AA_OK, negative if the handle is not open
+    """
+    with transport.lock:
+        if aardvark not in transport.open_ports:
+            return AA_INVALID_HANDLE
+        # end if
+        
+        transport.monitors[aardvark] = []
+    # end with
+    
+    return AA_OK
+# end def
+
+def aa_i2c_monitor_disable(aardvark):
+    """
+    Stop monitoring the simulated bus
+    
+    @param[in]    aardvark:        the handle (int)
+    @return       (int)            AA_OK
+    """
+    with transport.lock:
+        transport.monitors.pop(aardvark, None)
+    # end with
+    
+    return AA_OK
+# end def
+
+def aa_i2c_monitor_read(aardvark, data):
+    """
+    Read the words seen on the simulated bus
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    data:            the maximum number of words to read (int)
+    @return       (int, array)     The number of words read, negative if the
+                                   monitor is not enabled, and the words
+    """
+    with transport.lock:
+        if aardvark not in transport.monitors:
+            return (AA_I2C_MONITOR_NOT_ENABLED, array('H'))
+        # end if
+        
+        words = transport.monitors[aardvark][:data]
+        del transport.monitors[aardvark][:data]
+    # end with
+    
+    return (len(words), array('H', words))
+# end def
+
+def aa_async_poll(aardvark, timeout):
+    """
+    Wait for the simulated bus monitor to have data
+    
+    @param[in]    aardvark:        the handle (int)
+    @param[in]    timeout:         the time to wait in ms (int)
+    @return       (int)            AA_ASYNC_I2C_MONITOR if there is data, 
+                                   AA_ASYNC_NO_DATA if not
+    """
+    end = _clock() + max(timeout, 0)/1000.0
+    
+    while True:
+        if transport.monitors.get(aardvark):
+            return AA_ASYNC_I2C_MONITOR
+        
+        elif _clock() >= end:
+            return AA_ASYNC_NO_DATA
+        # end if
+        
+        time.sleep(0.001)
+    # end while
+# end def
+
+#
+# ----------------
+# Private Functions
+
+def _array_length(data):
+    """
+    Function to split an array argument into the array and the number of 
+    bytes to transfer, in the same way as aardvark_py
+    
+    @param[in]    data:            the array, or a tuple of the array and its
+                                   length
+    @return       (array, int)     The array and the number of bytes
+    """
+    if isinstance(data, tuple):
+        return (data[0], min(len(data[0]), int(data[1])))
+    # end if
+    
+    return (data, len(data))
+# end def
+
+def _clock():
+    """
+    Function to get the current time
+    
+    @return       (float)          The time in seconds
+    """
+    return time.time()
+# end def
+
+def _sleep(seconds):
+    """
+    Function to sleep for a scaled time
+    
+    @param[in]    seconds:         the unscaled time to sleep (float)
+    """
+    if transport.time_scale > 0:
+        time.sleep(seconds*transport.time_scale)
+    # end if
+# end def
+
+def _test():
+    """
+    Test code for this module.
+    """
+    import process_SCPI
+    
+    process_SCPI.set_transport(__import__(__name__))
+    
+    with process_SCPI.aardvark() as AARD:
+        print "SUP:TEL? 9,data"
+        print AARD.read_SCPI("SUP:TEL? 9,data", "0x5C", 'uint')
+        
+        print "\nBM2:TEL? 9,name"
+        print AARD.read_SCPI("BM2:TEL? 9,name", "0x5C", 'name')
+        
+        print "\nBM2:BQF READ_PAGE,0,1"
+        AARD.send_SCPI("BM2:BQF READ_PAGE,0,1", "0x5C")
+        print AARD.read_SCPI("BM2:TEL? 78,data", "0x5C", 33*['char'])
+    # end with
+    
+    process_SCPI.close_session()
+# end def
+
+# the simulation used by the aardvark functions
+transport = simulated_transport()
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
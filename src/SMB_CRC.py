@@ -41,15 +41,22 @@ def Calc_CRC_8(buf, length):
         crc = CRC_8_TABLE[buf[i] ^ crc]
     return crc
 
-print format(Calc_CRC_8([0x16, 0x0A, 0x17, 0x00, 0x00],5), '#04x') + ' = 0x51'
-
-
-print format(Calc_CRC_8([0x16, 0x77, 0x38, 0x00],4), '#04x') + ' = 0x33'
-
-print format(Calc_CRC_8([0x16, 0x78, 0x0A, 0x00, 0xFF, 0x00, 0x00, 0x00, 0x03],4), '#04x') + ' = 0x33'
-
-print format(Calc_CRC_8([0x16, 0x79, 0x17, 0xE4, 0xFF, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50],35), '#04x') + ' = 0x3B'
-
-
-
-
+def _test():
+    """
+    Test code for this module.
+    """
+    print format(Calc_CRC_8([0x16, 0x0A, 0x17, 0x00, 0x00],5), '#04x') + ' = 0x51'
+    
+    
+    print format(Calc_CRC_8([0x16, 0x77, 0x38, 0x00],4), '#04x') + ' = 0x33'
+    
+    print format(Calc_CRC_8([0x16, 0x78, 0x0A, 0x00, 0xFF, 0x00, 0x00, 0x00, 0x03],4), '#04x') + ' = 0x33'
+    
+    print format(Calc_CRC_8([0x16, 0x79, 0x17, 0xE4, 0xFF, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50, 0x50],35), '#04x') + ' = 0x3B'
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
@@ -57,30 +57,76 @@ AA_REQ_SW_VERSION = 0x050a   # v5.10
 import os
 import sys
 sys.path.insert(0, 'src/') # Added By David - Pumpkin Space Systems
-try:
-    import aardvark as api
-except ImportError, ex1:
+
+# The native library is loaded by the first call into the api rather than when
+# this module is imported, and the path it was found at is remembered in
+# _Path_cache so that later runs go straight to it.
+# Modified By David - Pumpkin Space Systems
+_Path_cache = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'aardvark_path.txt')
+
+api = None
+AA_SW_VERSION      = 0
+AA_REQ_API_VERSION = 0
+AA_LIBRARY_LOADED  = False
+
+def _find_library ():
     import imp, platform
     ext = platform.system() in ('Windows', 'Microsoft') and '.dll' or '.so'
+    
+    # try the path that worked last time first
+    try:
+        cache_file = open(_Path_cache)
+        path = cache_file.read().strip()
+        cache_file.close()
+        return (imp.load_dynamic('aardvark', path), None)
+    except (IOError, ImportError):
+        pass
+    
     try:
-        api = imp.load_dynamic('aardvark', 'src/' + 'aardvark' + ext) # Modified By David - Pumpkin Space Systems
-    except ImportError, ex2:
-        try: 
-            api = imp.load_dynamic('aardvark', 'aardvark' + ext) # Modified By David - Pumpkin Space Systems
-        except ImportError, ex2:  
-            try: 
-                api = imp.load_dynamic('aardvark', '../src/aardvark' + ext) # Modified By David - Pumpkin Space Systems
-            except ImportError, ex2:              
-                import_err_msg  = 'Error importing aardvark%s\n' % ext
-                import_err_msg += '  Architecture of aardvark%s may be wrong\n' % ext
-                import_err_msg += '%s\n%s' % (ex1, ex2)
-                raise ImportError(import_err_msg)
-
-AA_SW_VERSION      = api.py_version() & 0xffff
-AA_REQ_API_VERSION = (api.py_version() >> 16) & 0xffff
-AA_LIBRARY_LOADED  = \
-    ((AA_SW_VERSION >= AA_REQ_SW_VERSION) and \
-     (AA_API_VERSION >= AA_REQ_API_VERSION))
+        import aardvark
+        return (aardvark, getattr(aardvark, '__file__', None))
+    except ImportError, ex1:
+        pass
+    
+    for path in ['src/' + 'aardvark' + ext, 'aardvark' + ext,
+                 '../src/aardvark' + ext]:
+        try:
+            return (imp.load_dynamic('aardvark', path), path)
+        except ImportError, ex2:
+            pass
+    
+    import_err_msg  = 'Error importing aardvark%s\n' % ext
+    import_err_msg += '  Architecture of aardvark%s may be wrong\n' % ext
+    import_err_msg += '%s\n%s' % (ex1, ex2)
+    raise ImportError(import_err_msg)
+
+def _load_library ():
+    global api, AA_SW_VERSION, AA_REQ_API_VERSION, AA_LIBRARY_LOADED
+    
+    (api, path) = _find_library()
+    
+    if path != None:
+        # remember where the library was found for next time
+        try:
+            cache_file = open(_Path_cache, 'w')
+            cache_file.write(os.path.abspath(path))
+            cache_file.close()
+        except IOError:
+            pass
+    
+    AA_SW_VERSION      = api.py_version() & 0xffff
+    AA_REQ_API_VERSION = (api.py_version() >> 16) & 0xffff
+    AA_LIBRARY_LOADED  = \
+        ((AA_SW_VERSION >= AA_REQ_SW_VERSION) and \
+         (AA_API_VERSION >= AA_REQ_API_VERSION))
+    
+    return AA_LIBRARY_LOADED
+
+def _library_loaded ():
+    if api == None:
+        return _load_library()
+    return AA_LIBRARY_LOADED
 
 from array import array, ArrayType
 import struct
@@ -236,7 +282,7 @@ def aa_find_devices (devices):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # devices pre-processing
     __devices = isinstance(devices, int)
     if __devices:
@@ -277,7 +323,7 @@ def aa_find_devices_ext (devices, unique_ids):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # devices pre-processing
     __devices = isinstance(devices, int)
     if __devices:
@@ -319,7 +365,7 @@ def aa_find_devices_ext (devices, unique_ids):
 def aa_open (port_number):
     """usage: Aardvark return = aa_open(int port_number)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_open(port_number)
 
@@ -349,7 +395,7 @@ class AardvarkExt:
 def aa_open_ext (port_number):
     """usage: (Aardvark return, AardvarkExt aa_ext) = aa_open_ext(int port_number)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     (_ret_, c_aa_ext) = api.py_aa_open_ext(port_number)
     # aa_ext post-processing
@@ -362,7 +408,7 @@ def aa_open_ext (port_number):
 def aa_close (aardvark):
     """usage: int return = aa_close(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_close(aardvark)
 
@@ -373,7 +419,7 @@ def aa_close (aardvark):
 def aa_port (aardvark):
     """usage: int return = aa_port(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_port(aardvark)
 
@@ -387,7 +433,7 @@ AA_FEATURE_I2C_MONITOR = 0x00000010
 def aa_features (aardvark):
     """usage: int return = aa_features(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_features(aardvark)
 
@@ -399,7 +445,7 @@ def aa_features (aardvark):
 def aa_unique_id (aardvark):
     """usage: u32 return = aa_unique_id(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_unique_id(aardvark)
 
@@ -410,7 +456,7 @@ def aa_unique_id (aardvark):
 def aa_status_string (status):
     """usage: str return = aa_status_string(int status)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_status_string(status)
 
@@ -426,7 +472,7 @@ AA_LOG_STDERR = 2
 def aa_log (aardvark, level, handle):
     """usage: int return = aa_log(Aardvark aardvark, int level, int handle)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_log(aardvark, level, handle)
 
@@ -437,7 +483,7 @@ def aa_log (aardvark, level, handle):
 def aa_version (aardvark):
     """usage: (int return, AardvarkVersion version) = aa_version(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     (_ret_, c_version) = api.py_aa_version(aardvark)
     # version post-processing
@@ -460,7 +506,7 @@ AA_CONFIG_I2C_MASK = 0x00000002
 def aa_configure (aardvark, config):
     """usage: int return = aa_configure(Aardvark aardvark, AardvarkConfig config)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_configure(aardvark, config)
 
@@ -473,7 +519,7 @@ AA_TARGET_POWER_QUERY = 0x80
 def aa_target_power (aardvark, power_mask):
     """usage: int return = aa_target_power(Aardvark aardvark, u08 power_mask)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_target_power(aardvark, power_mask)
 
@@ -484,7 +530,7 @@ def aa_target_power (aardvark, power_mask):
 def aa_sleep_ms (milliseconds):
     """usage: u32 return = aa_sleep_ms(u32 milliseconds)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_sleep_ms(milliseconds)
 
@@ -506,7 +552,7 @@ AA_ASYNC_I2C_MONITOR = 0x00000008
 def aa_async_poll (aardvark, timeout):
     """usage: int return = aa_async_poll(Aardvark aardvark, int timeout)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_async_poll(aardvark, timeout)
 
@@ -519,7 +565,7 @@ def aa_async_poll (aardvark, timeout):
 def aa_i2c_free_bus (aardvark):
     """usage: int return = aa_i2c_free_bus(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_free_bus(aardvark)
 
@@ -530,7 +576,7 @@ def aa_i2c_free_bus (aardvark):
 def aa_i2c_bitrate (aardvark, bitrate_khz):
     """usage: int return = aa_i2c_bitrate(Aardvark aardvark, int bitrate_khz)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_bitrate(aardvark, bitrate_khz)
 
@@ -540,7 +586,7 @@ def aa_i2c_bitrate (aardvark, bitrate_khz):
 def aa_i2c_bus_timeout (aardvark, timeout_ms):
     """usage: int return = aa_i2c_bus_timeout(Aardvark aardvark, u16 timeout_ms)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_bus_timeout(aardvark, timeout_ms)
 
@@ -571,7 +617,7 @@ def aa_i2c_read (aardvark, slave_addr, flags, data_in):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_in pre-processing
     __data_in = isinstance(data_in, int)
     if __data_in:
@@ -618,7 +664,7 @@ def aa_i2c_read_ext (aardvark, slave_addr, flags, data_in):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_in pre-processing
     __data_in = isinstance(data_in, int)
     if __data_in:
@@ -646,7 +692,7 @@ def aa_i2c_write (aardvark, slave_addr, flags, data_out):
     intrinsic length is used as the argument to the underlying API
     function."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_out pre-processing
     (data_out, num_bytes) = isinstance(data_out, ArrayType) and (data_out, len(data_out)) or (data_out[0], min(len(data_out[0]), int(data_out[1])))
     if data_out.typecode != 'B':
@@ -670,7 +716,7 @@ def aa_i2c_write_ext (aardvark, slave_addr, flags, data_out):
     intrinsic length is used as the argument to the underlying API
     function."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_out pre-processing
     (data_out, num_bytes) = isinstance(data_out, ArrayType) and (data_out, len(data_out)) or (data_out[0], min(len(data_out[0]), int(data_out[1])))
     if data_out.typecode != 'B':
@@ -703,7 +749,7 @@ def aa_i2c_write_read (aardvark, slave_addr, flags, out_data, in_data):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # out_data pre-processing
     (out_data, out_num_bytes) = isinstance(out_data, ArrayType) and (out_data, len(out_data)) or (out_data[0], min(len(out_data[0]), int(out_data[1])))
     if out_data.typecode != 'B':
@@ -727,7 +773,7 @@ def aa_i2c_write_read (aardvark, slave_addr, flags, out_data, in_data):
 def aa_i2c_slave_enable (aardvark, addr, maxTxBytes, maxRxBytes):
     """usage: int return = aa_i2c_slave_enable(Aardvark aardvark, u08 addr, u16 maxTxBytes, u16 maxRxBytes)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_slave_enable(aardvark, addr, maxTxBytes, maxRxBytes)
 
@@ -735,7 +781,7 @@ def aa_i2c_slave_enable (aardvark, addr, maxTxBytes, maxRxBytes):
 def aa_i2c_slave_disable (aardvark):
     """usage: int return = aa_i2c_slave_disable(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_slave_disable(aardvark)
 
@@ -753,7 +799,7 @@ def aa_i2c_slave_set_response (aardvark, data_out):
     intrinsic length is used as the argument to the underlying API
     function."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_out pre-processing
     (data_out, num_bytes) = isinstance(data_out, ArrayType) and (data_out, len(data_out)) or (data_out[0], min(len(data_out[0]), int(data_out[1])))
     if data_out.typecode != 'B':
@@ -770,7 +816,7 @@ def aa_i2c_slave_set_response (aardvark, data_out):
 def aa_i2c_slave_write_stats (aardvark):
     """usage: int return = aa_i2c_slave_write_stats(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_slave_write_stats(aardvark)
 
@@ -793,7 +839,7 @@ def aa_i2c_slave_read (aardvark, data_in):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_in pre-processing
     __data_in = isinstance(data_in, int)
     if __data_in:
@@ -813,7 +859,7 @@ def aa_i2c_slave_read (aardvark, data_in):
 def aa_i2c_slave_write_stats_ext (aardvark):
     """usage: (int return, u16 num_written) = aa_i2c_slave_write_stats_ext(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_slave_write_stats_ext(aardvark)
 
@@ -835,7 +881,7 @@ def aa_i2c_slave_read_ext (aardvark, data_in):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_in pre-processing
     __data_in = isinstance(data_in, int)
     if __data_in:
@@ -856,7 +902,7 @@ def aa_i2c_slave_read_ext (aardvark, data_in):
 def aa_i2c_monitor_enable (aardvark):
     """usage: int return = aa_i2c_monitor_enable(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_monitor_enable(aardvark)
 
@@ -865,7 +911,7 @@ def aa_i2c_monitor_enable (aardvark):
 def aa_i2c_monitor_disable (aardvark):
     """usage: int return = aa_i2c_monitor_disable(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_monitor_disable(aardvark)
 
@@ -892,7 +938,7 @@ def aa_i2c_monitor_read (aardvark, data):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data pre-processing
     __data = isinstance(data, int)
     if __data:
@@ -916,7 +962,7 @@ AA_I2C_PULLUP_QUERY = 0x80
 def aa_i2c_pullup (aardvark, pullup_mask):
     """usage: int return = aa_i2c_pullup(Aardvark aardvark, u08 pullup_mask)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_i2c_pullup(aardvark, pullup_mask)
 
@@ -931,7 +977,7 @@ def aa_i2c_pullup (aardvark, pullup_mask):
 def aa_spi_bitrate (aardvark, bitrate_khz):
     """usage: int return = aa_spi_bitrate(Aardvark aardvark, int bitrate_khz)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_spi_bitrate(aardvark, bitrate_khz)
 
@@ -973,7 +1019,7 @@ AA_SPI_BITORDER_LSB = 1
 def aa_spi_configure (aardvark, polarity, phase, bitorder):
     """usage: int return = aa_spi_configure(Aardvark aardvark, AardvarkSpiPolarity polarity, AardvarkSpiPhase phase, AardvarkSpiBitorder bitorder)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_spi_configure(aardvark, polarity, phase, bitorder)
 
@@ -996,7 +1042,7 @@ def aa_spi_write (aardvark, data_out, data_in):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_out pre-processing
     (data_out, out_num_bytes) = isinstance(data_out, ArrayType) and (data_out, len(data_out)) or (data_out[0], min(len(data_out[0]), int(data_out[1])))
     if data_out.typecode != 'B':
@@ -1020,7 +1066,7 @@ def aa_spi_write (aardvark, data_out, data_in):
 def aa_spi_slave_enable (aardvark):
     """usage: int return = aa_spi_slave_enable(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_spi_slave_enable(aardvark)
 
@@ -1028,7 +1074,7 @@ def aa_spi_slave_enable (aardvark):
 def aa_spi_slave_disable (aardvark):
     """usage: int return = aa_spi_slave_disable(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_spi_slave_disable(aardvark)
 
@@ -1046,7 +1092,7 @@ def aa_spi_slave_set_response (aardvark, data_out):
     intrinsic length is used as the argument to the underlying API
     function."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_out pre-processing
     (data_out, num_bytes) = isinstance(data_out, ArrayType) and (data_out, len(data_out)) or (data_out[0], min(len(data_out[0]), int(data_out[1])))
     if data_out.typecode != 'B':
@@ -1073,7 +1119,7 @@ def aa_spi_slave_read (aardvark, data_in):
     arrays, whether passed in or generated, are passed back in the
     returned tuple."""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # data_in pre-processing
     __data_in = isinstance(data_in, int)
     if __data_in:
@@ -1101,7 +1147,7 @@ AA_SPI_SS_ACTIVE_HIGH = 1
 def aa_spi_master_ss_polarity (aardvark, polarity):
     """usage: int return = aa_spi_master_ss_polarity(Aardvark aardvark, AardvarkSpiSSPolarity polarity)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_spi_master_ss_polarity(aardvark, polarity)
 
@@ -1143,7 +1189,7 @@ AA_GPIO_DIR_OUTPUT = 1
 def aa_gpio_direction (aardvark, direction_mask):
     """usage: int return = aa_gpio_direction(Aardvark aardvark, u08 direction_mask)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_gpio_direction(aardvark, direction_mask)
 
@@ -1160,7 +1206,7 @@ AA_GPIO_PULLUP_ON = 1
 def aa_gpio_pullup (aardvark, pullup_mask):
     """usage: int return = aa_gpio_pullup(Aardvark aardvark, u08 pullup_mask)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_gpio_pullup(aardvark, pullup_mask)
 
@@ -1173,7 +1219,7 @@ def aa_gpio_pullup (aardvark, pullup_mask):
 def aa_gpio_get (aardvark):
     """usage: int return = aa_gpio_get(Aardvark aardvark)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_gpio_get(aardvark)
 
@@ -1187,7 +1233,7 @@ def aa_gpio_get (aardvark):
 def aa_gpio_set (aardvark, value):
     """usage: int return = aa_gpio_set(Aardvark aardvark, u08 value)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_gpio_set(aardvark, value)
 
@@ -1212,7 +1258,7 @@ def aa_gpio_set (aardvark, value):
 def aa_gpio_change (aardvark, timeout):
     """usage: int return = aa_gpio_change(Aardvark aardvark, u16 timeout)"""
 
-    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if not _library_loaded(): return AA_INCOMPATIBLE_LIBRARY
     # Call API function
     return api.py_aa_gpio_change(aardvark, timeout)
 
@@ -34,6 +34,9 @@ label_font = "Arial 10"
 button_font = "Arial 10 bold"
 text_font = "Arial 9"
 
+# time between updates of the recorded telemetry (ms)
+recorder_refresh = 1000
+
 #
 # -------
 # Classes
@@ -53,6 +56,12 @@ class process_window:
     @attribute back_state     (string)    State of the next button eg. 'disabled'
     @attribute useable_frame  (TK Frame)  Area into which processes can have GUI
     @attribute wait_label     (TK Label)  Please wait message
+    @attribute recorder       (telemetry_recorder) Recorder whose latest 
+                                          values are shown, None if there is 
+                                          not one
+    @attribute recorder_label (TK Label)  Displays the latest recorded values
+    @attribute finished       (bool)      True once the Finish button has been
+                                          pressed
     """     
     
     def __init__(self, input_struct):
@@ -81,6 +90,13 @@ class process_window:
         # copy the process steps into an attribute
         self.process = input_struct.process 
         
+        # no telemetry is shown until a recorder is given
+        self.recorder = None
+        self.recorder_label = None
+        
+        # the process has not been finished until Finish is pressed
+        self.finished = False
+        
         # create the title header of the process GUI
         Header = TK.Label(self.root, text = input_struct.properties.title)
         Header.config(font = title_font, bg = default_color)
@@ -164,6 +180,49 @@ class process_window:
         
     #end def
     
+    def show_recorder(self, recorder):
+        """
+        Show the latest values of a telemetry recorder below the buttons. The
+        values are taken from the recorder's ring buffer so the GUI never 
+        waits for the bus.
+        
+        @param[in]    recorder:     The recorder to show (telemetry_recorder)
+        """
+        self.recorder = recorder
+        
+        # make room for the values below the buttons
+        self.root.geometry('800x625')
+        self.root.rowconfigure(3, weight = 1, minsize = 25)
+        
+        self.recorder_label = TK.Label(self.root, text = '')
+        self.recorder_label.config(font = text_font, bg = default_color)
+        self.recorder_label.grid(row = 3, column = 0, sticky = 'nsew')
+        
+        self.root.after(recorder_refresh, self.refresh_recorder)
+    #end def
+    
+    def refresh_recorder(self):
+        """
+        Update the recorded values shown and schedule the next update
+        """
+        sample = self.recorder.latest()
+        
+        if self.recorder.message != '':
+            # the recorder can not sample
+            self.recorder_label.config(text = self.recorder.message)
+        
+        elif sample != None:
+            # the recorder only accepts numeric items
+            values = sample[1]
+            self.recorder_label.config(text = '   '.join(
+                [name + ': ' + ('--' if values[name] == None else 
+                                '%.4g' % values[name]) 
+                 for name in self.recorder.names]))
+        # end if
+        
+        self.root.after(recorder_refresh, self.refresh_recorder)
+    #end def
+    
     def initial_display(self):
         """
         Set up the first step in the process
@@ -301,9 +360,36 @@ class process_window:
         # terminate the current step
         self.process[self.current_step].close()
         
+        # the process ran to the end
+        self.finished = True
+        
         # close the GUI
         self.root.destroy()
     #end def
+    
+    def failures(self):
+        """
+        Find why the process did not pass
+        
+        @return       (list)      A message for each failure, empty if the 
+                                  process passed
+        """
+        failures = []
+        
+        if not self.finished:
+            failures.append('closed at step ' + str(self.current_step+1) + 
+                            '/' + str(self.total_steps))
+        # end if
+        
+        for (number, step) in enumerate(self.process):
+            if getattr(step, 'no_aardvark', False):
+                # the step could not talk to the module
+                failures.append('no aardvark at step ' + str(number+1))
+            # end if
+        # end for
+        
+        return failures
+    #end def
 # end class
 
 
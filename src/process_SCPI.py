@@ -21,10 +21,24 @@ __version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
 # -------
 # Imports
 
-import aardvark_py
+import process_stats
 import time
+import sys
+import os
+import gc
+import types
+import threading
 from array import array
-from struct import unpack
+from struct import Struct, pack_into
+from functools import partial
+
+# the transport to use, the simulator can be used in place of an aardvark
+if os.environ.get('SCPI_TRANSPORT') == 'simulator':
+    import SCPI_simulator as aardvark_py
+    
+else:
+    import aardvark_py
+# end if
 
 #
 # ---------
@@ -33,6 +47,138 @@ from struct import unpack
 # I2C Bitrate
 _Bitrate = 100
 
+# Bitrates to try when negotiating the fastest bitrate of a module (kHz)
+_Bitrates = [100, 400, 800]
+
+# Known answer reads made at each bitrate tried when negotiating
+_Known_answers = [('SUP:TEL? 9,data', 'uint'), ('SUP:TEL? 9,name', 'name')]
+
+# Number of times each known answer must be read correctly at a bitrate
+_Negotiation_reads = 5
+
+# True to negotiate the bitrate of each module when it is first used
+_Negotiate = False
+
+# The maximum number of aardvarks that can be found
+_Max_devices = 16
+
+# Delay after each transaction in the 'fixed' readiness mode (ms)
+_Fixed_delay = 100
+
+# Default readiness mode, 'fixed' or 'poll'
+_Ready_mode = 'fixed'
+
+# Time to wait for the module to become ready in the 'poll' mode (ms)
+_Poll_timeout = 1000
+
+# Time between readiness polls in the 'poll' mode (ms)
+_Poll_interval = 5
+
+# Factor to shrink a turnaround estimate by when the module was already ready
+_Poll_shrink = 0.9
+
+# Weight given to a new turnaround measurement when learning the estimate
+_Poll_weight = 0.25
+
+# Time to wait for a module to finish a command with no response (ms)
+_Completion_timeout = 2000
+
+# Default query mode, 'split' or 'fast'
+_Query_mode = 'split'
+
+# Turnaround below which the 'fast' query mode tries a write_read (ms)
+_Fast_threshold = 1
+
+# Default number of attempts at a transaction before it fails
+_Retry_attempts = 3
+
+# Delay before the first retry (ms), later retries wait _Retry_growth times 
+# longer than the one before
+_Retry_backoff = 10
+
+# Growth of the delay between each retry
+_Retry_growth = 2.0
+
+# Default time allowed for a transaction including all of its retries (ms)
+_Retry_deadline = 2000
+
+# Time in seconds that responses to each command are cached for, None for
+# responses that are kept while the aardvark is connected. Commands that are
+# not listed are not cached. The firmware version and serial number only 
+# change if the module is replaced, which takes it off the bus, or when the
+# serial number is written.
+_Cache_ttls = {'SUP:TEL? 0,data': None, 'SUP:TEL? 9,data': None}
+
+# telemetry fields that only change if the module is replaced
+_Static_fields = [',name', ',length']
+
+# Time in seconds that the responses of the _Static_fields are cached for
+_Static_ttl = None
+
+# the prefixes of the cached responses that each NVM or data flash command 
+# changes, by command prefix. An empty prefix is every response of the 
+# module. NVM settings take effect when the NVM is written, so the responses
+# they change are removed again by 'SUP:NVM WRITE'.
+_Cache_changes = {'SUP:NVM UNLOCK': [],
+                  'SUP:NVM WRITE': [],
+                  'SUP:NVM SERIAL': ['SUP:TEL? 9,'],
+                  'SUP:NVM OSCTUN': ['SUP:TEL? 11,'],
+                  'SUP:NVM I2C': [''],
+                  'BM2:NVM T_OFFSET': ['BM2:TEL? 75,'],
+                  'BM2:BQF WRITE': ['BM2:TEL? 78,']}
+
+# commands that change a module's settings, those not in _Cache_changes 
+# remove every cached response of the module
+_Cache_clearing = ['SUP:NVM', 'BM2:NVM', 'BQF WRITE']
+
+# what went wrong for each I2C status code
+_Status_kinds = {aardvark_py.AA_I2C_STATUS_BUS_ERROR: 'bus_error',
+                 aardvark_py.AA_I2C_STATUS_SLA_NACK: 'nack',
+                 aardvark_py.AA_I2C_STATUS_DATA_NACK: 'data_nack',
+                 aardvark_py.AA_I2C_STATUS_ARB_LOST: 'arb_lost',
+                 aardvark_py.AA_I2C_STATUS_BUS_LOCKED: 'bus_locked'}
+
+# transfer results that are worth trying again
+_Retryable = ['short', 'nack', 'data_nack', 'bus_error', 'arb_lost', 
+              'bus_locked', 'not_ready']
+
+# transfer results that need the bus to be freed before trying again
+_Bus_errors = ['bus_error', 'arb_lost', 'bus_locked']
+
+# struct codes of the fixed length response formats
+_Format_codes = {'int':'h', 'long':'l', 'long long':'q', 'uint':'H', 
+                 'double':'d', 'float':'f', 'char':'B', 'schar':'b', 'hex':'B'}
+
+# response formats that are decoded as strings
+_String_formats = ['name', 'ascii', 'string']
+
+# structs of the fixed length response formats
+_Format_structs = dict([(name, Struct('<' + code)) 
+                        for (name, code) in _Format_codes.items()])
+
+# hex representation of each byte value
+_Hex_bytes = ['%02X' % x for x in range(256)]
+
+# a single zero byte, repeated to make an empty buffer without building a list
+_Zero_byte = array('B', [0])
+
+# sizes of the buffers kept by the buffer pool, a transfer uses the smallest 
+# one that it fits in
+_Buffer_sizes = [16, 32, 64, 128, 256, 512]
+
+# number of commands kept by each command_template
+_Template_commands = 256
+
+# number of command keys remembered by _command_key
+_Command_keys = 1024
+
+# High resolution timer in seconds
+if sys.platform == 'win32':
+    _timer = time.clock
+else:
+    _timer = time.time
+# end if
+
 #
 # ---------
 # Classes
@@ -43,12 +189,36 @@ class aardvark:
     
     @attribute message      (string) Place to store error messages
     @attribute port         (Aardvark_py.Aardvark handle) 
-                                     The aardvark port in use
+                                     The aardvark port in use, shared with 
+                                     all other aardvark objects
     @attribute name_size    (int)    The length of a name request in bytes
     @attribute chksum_size  (int)    The length of the checksum in bytes
     @attribute wflag_size   (int)    The length of the write flag in bytes
     @attribute time_size    (int)    The length of the timestamp in bytes
     @attribute ascii_size   (int)    The length of an ascii read in bytes
+    @attribute ready_mode   (string) 'fixed' to wait a fixed delay after each
+                                     transaction, 'poll' to poll the module 
+                                     until its response is ready
+    @attribute poll_timeout (int)    Time to wait for a response when polling
+                                     in ms
+    @attribute poll_interval (int)   Time between polls in ms
+    @attribute query_mode   (string) 'split' to write and read in separate 
+                                     transactions, 'fast' to try a single
+                                     write_read transaction first
+    @attribute last_path    (string) The path taken by the last query, 
+                                     'write_read' or 'split'
+    @attribute errors       (dict)   The error message for each request that
+                                     failed in the last read_many batch, by
+                                     its position in the batch
+    @attribute last_write   (i2c_result) The result of the last write of the
+                                     current attempt, None if there was none
+    @attribute last_read    (i2c_result) The result of the last read of the 
+                                     current attempt, None if there was none,
+                                     its partial() response is kept if it 
+                                     failed part way through
+    @attribute resume       (tuple)  The (command, address) whose command was
+                                     received but whose response could not be
+                                     read, so only the read is retried
     """ 
     
     def __init__(self):
@@ -70,6 +240,26 @@ class aardvark:
         
         self.ascii_size = 128 
         
+        # define how to wait for the module to process commands
+        self.ready_mode = _Ready_mode
+        
+        self.poll_timeout = _Poll_timeout
+        
+        self.poll_interval = _Poll_interval
+        
+        # define how to perform queries
+        self.query_mode = _Query_mode
+        
+        self.last_path = ''
+        
+        self.errors = {}
+        
+        self.last_write = None
+        
+        self.last_read = None
+        
+        self.resume = None
+        
     #end def
     
     def __enter__(self):
@@ -81,280 +271,2162 @@ class aardvark:
     
     def __exit__(self, type, value, traceback):
         """
-        Ensures that the aardvark port is closed correctly
+        Releases the aardvark port back to the shared session. The port is 
+        left open so that the next user does not have to re-configure it, use
+        close_session() to close it.
         
         For use with the 'with' operator
         """      
-        if self.port != None:
-            aardvark_py.aa_close(self.port)
-        #end if
+        self.port = None
     #end def
     
+    def hold(self):
+        """
+        Function to get the lock of the shared bus so that a sequence of 
+        commands that belong together, eg. an NVM unlock, write and lock, is 
+        not interleaved with the commands of other threads such as the 
+        telemetry recorder. Use as 'with AARD.hold():'
+        
+        @return       (RLock)          the lock of the shared bus
+        """
+        return _session.lock
+    # end def
+    
     def configure_aardvark(self):
         """ 
-        Function to configure the aardvark for pySCPI operation if there is one
-        available.
+        Function to get the handle of the configured aardvark from the shared
+        session, opening and configuring the aardvark if there is one 
+        available and it is not already open.
         
         @return  (aardvark_py.aardvark)   The handle of the aardvark to be used
                                           'None' if there is not one available
         """
-        # define the handle to return
-        Aardvark_in_use = None
-        
-        # find all connected aardvarks
-        AA_Devices = aardvark_py.aa_find_devices(1)
+        # get the handle from the process-wide session
+        Aardvark_in_use = _session.acquire()
         
-        # define a port mask
-        Aardvark_port = 8<<7
+        # pass on any error message from the session
+        self.message = _session.message
         
-        # assume that an aardvark can be found until proved otherwise
-        Aardvark_free = True
+        return Aardvark_in_use
+    # end def        
+    
+    def send_SCPI(self, command, address):
+        """
+        Function to send a SCPI command to the slave device
         
-        # Check if there is an Aardvark present
-        if (AA_Devices[0] < 1):
-            # there is no aardvark to be found
-            self.message = '*** No Aardvark is present ***'
-            Aardvark_free = False
+        @param[in]    command:         the command to send (string or 
+                                       scpi_command)
+        @param[in]    address:         the decimal address to write to (int)
+        """  
+        with _session.lock:
+            _stats_begin(command)
             
-        else:
-            # there is an aardvark connected to select the first one if there
-            # are many
-            Aardvark_port = AA_Devices[1][0]
-        # end if
-        
-        
-        # If there is an Aardvark there is it free?
-        if Aardvark_port >= 8<<7 and Aardvark_free:
-            # the aardvark is not free
-            self.message = '*** Aardvark is being used, '\
-                           'disconnect other application or Aardvark device ***'
-            # close the aardvark
-            aardvark_py.aa_close(Aardvark_port)
-            Aardvark_free = False
+            changes = _cache_changes(command)
             
-        elif Aardvark_free:
-            # Aardvark is available so configure it
+            if changes != None:
+                # the module's settings may change
+                _session.cache.invalidate(address, changes, 
+                                          command.startswith('SUP:NVM WRITE'))
+            # end if
             
-            # open the connection with the aardvark
-            Aardvark_in_use = aardvark_py.aa_open(Aardvark_port)
+            # write the command, retrying if it is not acknowledged
+            written = self._retry(command, address, 
+                                  partial(self._write_command, command, 
+                                          address))
             
-            # set it up in teh mode we need for pumpkin modules
-            aardvark_py.aa_configure(Aardvark_in_use, 
-                                     aardvark_py.AA_CONFIG_SPI_I2C)
+            if self.ready_mode == 'poll':
+                # there is no response to poll so defer the delay until the 
+                # bus is next used rather than blocking now
+                _session.busy_until = _timer() + _Fixed_delay/1000.0
+                
+            else:
+                # pause
+                aardvark_py.aa_sleep_ms(_Fixed_delay)
+            # end if
             
-            # default to both pullups on
-            aardvark_py.aa_i2c_pullup(Aardvark_in_use, 
-                                      aardvark_py.AA_I2C_PULLUP_BOTH)
+            _stats_end(written)
+        # end with
+    # end def
+    
+    def send_and_wait(self, command, address, check, 
+                      timeout = _Completion_timeout):
+        """
+        Function to send a SCPI command to the slave device and wait until it
+        has taken effect, eg. a data flash write, rather than waiting a fixed 
+        time. The caller gives the check, as only it knows what to read back
+        to see the effect. The bus is held from the send to the end of the 
+        wait so that the checks are not upset by the commands of other 
+        threads. The time taken is recorded in the statistics as 
+        '<command> commit'.
+        
+        @param[in]    command:         the command to send (string)
+        @param[in]    address:         the decimal address to write to (int)
+        @param[in]    check:           called with no arguments until it 
+                                       returns True to show that the command
+                                       has taken effect (function)
+        @param[in]    timeout:         time allowed for the command from when
+                                       it was written in ms (int)
+        @return       (float)          the time the command took in ms, None
+                                       if it did not finish in time
+        """
+        with _session.lock:
+            self.send_SCPI(command, address)
             
-            # set the bit rate to be the default
-            aardvark_py.aa_i2c_bitrate(Aardvark_in_use, _Bitrate)
+            written = _session.write_time
             
-            # free the bus
-            aardvark_py.aa_i2c_free_bus(Aardvark_in_use)
+            done = False
             
-            # delay to allow the config to be registered
-            aardvark_py.aa_sleep_ms(200)    
+            while True:
+                if check():
+                    done = True
+                    break
+                # end if
+                
+                if (_timer() - written)*1000.0 >= timeout:
+                    break
+                # end if
+                
+                # wait before checking again
+                aardvark_py.aa_sleep_ms(self.poll_interval)
+            # end while
             
-        # end if    
-        
-        return Aardvark_in_use
-    # end def        
+            elapsed = (_timer() - written)*1000.0
+            
+            # the checks are timed as transactions of their own, so the 
+            # commit is recorded once they are over
+            _stats_begin(_command_key(command) + ' commit', written)
+            _stats_end(done)
+            
+            if not done:
+                self.message = '*** ' + command + ' did not complete' + \
+                               _failure_text(self) + ' ***'
+                return None
+            # end if
+            
+            return elapsed
+        # end with
+    # end def
     
-    def send_SCPI(self, command, address):
+    def _write_command(self, command, address):
         """
-        Function to send a SCPI command to the slave device
+        Function to write a SCPI command to the slave device without waiting
+        for it to be processed
         
         @param[in]    command:         the command to send (string)
         @param[in]    address:         the decimal address to write to (int)
-        """  
-        
-        # convert the data into a list of bytes and append the terminator
-        write_data = list(command)
-        write_data = [ord(item) for item in write_data]
-        write_data.append(0x0a)
+        @return       (bool)           True if all of the command was written
+        """
+        # wait for any previous command to finish being processed
+        self._wait_for_module()
         
         # convert to an array to be compiant with the aardvark
-        data = array('B', write_data)  
-        
+        data = _session.pool.encode(command)
         
         # Write the data to the slave device
-        aardvark_py.aa_i2c_write(self.port, int(address, 16), 
-                                 aardvark_py.AA_I2C_NO_FLAGS, data)
+        result = self._write(address, data)
         
-        # pause
-        aardvark_py.aa_sleep_ms(100)
+        # note when the command was written
+        _session.write_time = _timer()
         
+        return result.ok()
     # end def
     
-    def read_SCPI(self, command, address, return_format):
+    def _check_status(self, status):
         """
-        Function to send a SCPI command to the slave device
+        Function to check the status returned by an aardvark call, forgetting
+        the port if the session had to close it so that nothing more is sent
+        to the closed handle
+        
+        @param[in]    status:          the return of the aardvark call (int)
+        """
+        if status >= 0:
+            # the transfer happened, even if the module did not acknowledge
+            return
+        # end if
+        
+        _session.check_status(status)
+        
+        if _session.port == None:
+            self.port = None
+        # end if
+    # end def
+    
+    def _write(self, address, data):
+        """
+        Function to write bytes to the slave device
+        
+        @param[in]    address:         the address to write to (string)
+        @param[in]    data:            the bytes to write (tuple of array and 
+                                       length)
+        @return       (i2c_result)     the result of the write
+        """
+        flags = aardvark_py.AA_I2C_NO_FLAGS
+        
+        (status, count) = aardvark_py.aa_i2c_write_ext(self.port, 
+                                                       int(address, 16), 
+                                                       flags, data)
+        
+        # check that the aardvark is still healthy
+        self._check_status(status)
+        
+        self.last_write = i2c_result(status, count, data[1])
+        
+        return self.last_write
+    # end def
+    
+    def _read(self, address, read_length):
+        """
+        Function to read bytes from the slave device
+        
+        @param[in]    address:         the address to read from (string)
+        @param[in]    read_length:     the number of bytes to read (int)
+        @return       (i2c_result)     the result of the read
+        """
+        flags = aardvark_py.AA_I2C_NO_FLAGS
+        
+        (status, data, count) = aardvark_py.aa_i2c_read_ext(self.port, 
+                                                            int(address, 16), 
+                                                            flags, 
+                                            _session.pool.take(read_length))
+        
+        # check that the aardvark is still healthy
+        self._check_status(status)
+        
+        self.last_read = i2c_result(status, count, read_length, data)
+        
+        return self.last_read
+    # end def
+    
+    def _write_read_command(self, command, address, read_length):
+        """
+        Function to write a SCPI command and read its response in a single 
+        aardvark transaction, which only succeeds if the module is able to 
+        respond without any delay.
         
         @param[in]    command:         the command to send (string)
         @param[in]    address:         the decimal address to write to (int)
-        @param[out]   result:          the variable to store the data in
-        """  
-        # dictionary of acceptible data formats and their lengths
-        acceptible_formats = {'int':2, 'long':4, 'long long':8, 'uint':2, 
-                              'double':8, 'float':4, 'char':1, 'schar':1, 
-                              'hex':1, 'name':self.name_size, 
-                              'ascii':self.ascii_size, 'string':self.ascii_size}
+        @param[in]    read_length:     the number of bytes to read (int)
+        @return       (bool, array)    True if the command was written and the
+                                       response if it was ready, None if not
+        """
+        # wait for any previous command to finish being processed
+        self._wait_for_module()
         
-        # length of preamle
-        preamble_length = self.wflag_size + self.time_size + self.chksum_size
+        # convert to an array to be compiant with the aardvark
+        data = _session.pool.encode(command)
         
-        # define the read legth as 0
-        read_length = 0
+        # write the command and read straight back after a repeated start
+        result = aardvark_py.aa_i2c_write_read(self.port, int(address, 16),
+                                               aardvark_py.AA_I2C_NO_FLAGS, 
+                                               data, 
+                                               _session.pool.take(read_length))
         
-        # continuation flag
-        perform_read = True
+        # check that the aardvark is still healthy
+        self._check_status(result[0])
         
-        # determin the correct read length
-        if type(return_format) == list:
-            # retun type is a list of items so it has a preamble
-            read_length += preamble_length
-            
-            # add up all of the lengths of the list items
-            for item in return_format:
-                # ensure each format specifier is acceptible
-                if item in acceptible_formats:
-                    read_length += acceptible_formats[item]
-                    
-                else:
-                    # error
-                    self.message = '***'+ item + \
-                        " is an unacceptible format ***"
-                    perform_read = False
-                    break
-                # end if
-            # end for
+        # note when the command was written
+        _session.write_time = _timer()
+        
+        if result[0] < 0:
+            # the aardvark failed so neither half happened
+            self.last_write = i2c_result(result[0], 0, data[1])
+            self.last_read = i2c_result(result[0], 0, read_length)
             
-        elif return_format in acceptible_formats:
-            # return type is an acceptible format
+        else:
+            # the status of the write is in the low byte and the read in the 
+            # high byte
+            self.last_write = i2c_result(result[0] & 0xFF, result[1], 
+                                         data[1])
+            self.last_read = i2c_result((result[0] >> 8) & 0xFF, result[3], 
+                                        read_length, result[2])
+        # end if
+        
+        # the command is only written if all of it went out
+        written = self.last_write.ok()
+        
+        if written and self.last_read.ok() and (result[2][0] != 0):
+            # the write flag shows that the response was ready
+            return (True, result[2])
+        # end if
+        
+        return (written, None)
+    # end def
+    
+    def _wait_for_module(self):
+        """
+        Function to wait until the module has had time to process the last 
+        command sent without a response.
+        """
+        remaining = _session.busy_until - _timer()
+        if remaining > 0:
+            aardvark_py.aa_sleep_ms(int(remaining*1000))
+        # end if
+    # end def
+    
+    def _transact(self, command, address, read_length, has_flag, settle):
+        """
+        Function to write a command and read back the raw response.
+        
+        In the 'fast' query mode the command and response are first attempted
+        in a single write_read transaction, falling back to the split write, 
+        wait and read path if the module needs time to respond. The path used
+        is stored in last_path and counted by the session.
+        
+        @param[in]    command:         the command to send (string)
+        @param[in]    address:         the decimal address to write to (int)
+        @param[in]    read_length:     the number of bytes to read (int)
+        @param[in]    has_flag:        True if the response starts with a 
+                                       write flag (bool)
+        @param[in]    settle:          True to pause after the read in the 
+                                       'fixed' readiness mode (bool)
+        @return       (array)          the raw response, None if the module 
+                                       did not respond
+        """
+        key = _command_key(command)
+        
+        if has_flag and (self.ready_mode == 'poll'):
+            # the module answers its commands in order, so the write flag of
+            # a polled query is only set once the commands before it are 
+            # done and there is no need to wait out the deferred delay
+            _session.busy_until = 0.0
+        # end if
+        
+        # the command has already been received if only its read failed
+        resume = (self.resume != None) and (self.resume == (command, address))
+        self.resume = None
+        
+        # the command has not been written yet
+        written = resume
+        
+        if has_flag and not resume and (self.query_mode == 'fast') and \
+           (_session.turnaround.get(key, 0.0) < _Fast_threshold):
+            # try to get the response in a single transaction
+            (written, response) = self._write_read_command(command, address, 
+                                                           read_length)
             
-            # add preamble to data length if required
-            if return_format == 'ascii':
-                read_length = acceptible_formats['ascii']
+            if response != None:
+                self._count_path('write_read')
+                return response
                 
-            else:
-                read_length = preamble_length + acceptible_formats[return_format]
+            # the response will have to be read again
+            _stats_retry()
+            
+            if written and (self.ready_mode != 'poll') and \
+               (key not in _session.turnaround):
+                # the module needs time to respond to this command, polling 
+                # learns how long so otherwise assume the fixed delay
+                _session.turnaround[key] = _Fixed_delay
             # end if
+        # end if
         
-        else:
-            # format is not acceptible
-            self.message = '***'+ return_format + " is an unacceptible format ***"            
-            perform_read = False
+        self._count_path('split')
+        
+        if not written and not self._write_command(command, address):
+            # the command did not get to the module so there is no response
+            return None
         # end if
         
-        if perform_read:
-            self.send_SCPI(command, address)
+        if has_flag and (self.ready_mode == 'poll'):
+            # poll the module until the response is ready
+            return self._poll_response(command, address, read_length)
+        # end if
+        
+        if not resume:
+            # give the module time to process the command
+            aardvark_py.aa_sleep_ms(_Fixed_delay)
+        # end if
+        
+        # read from the slave device
+        result = self._read(address, read_length)
+        
+        if not result.ok():
+            if result.retryable():
+                # the module has the response so it only needs reading again
+                self.resume = (command, address)
+            # end if
             
-            # define array to read data into
-            data = array('B', [1]*read_length) 
+            return None
+        # end if
+        
+        # check the write flag
+        if has_flag and (result.data[0] == 0):
+            # the write flag indicates a failed transmission
+            result.kind = 'not_ready'
+            return None
+        # end if
+        
+        if settle:
+            # pause
+            aardvark_py.aa_sleep_ms(_Fixed_delay)
+        # end if
+        
+        return result.data
+    # end def
+    
+    def _count_path(self, path):
+        """
+        Function to record which path a query took
+        
+        @param[in]    path:            'write_read' or 'split' (string)
+        """
+        self.last_path = path
+        _session.path_counts[path] = _session.path_counts.get(path, 0) + 1
+    # end def
+    
+    def _poll_response(self, command, address, read_length):
+        """
+        Function to poll the slave device until the response to a command 
+        that has just been written is ready. Each poll is a full length read
+        so the poll that finds the module ready also returns the response.
+        
+        The first poll is delayed by the learned turnaround time of the 
+        command so that the bus is only used once the module should be ready.
+        
+        @param[in]    command:         the command that was sent (string)
+        @param[in]    address:         the decimal address to read from (int)
+        @param[in]    read_length:     the number of bytes to read (int)
+        @return       (array)          the raw response, None if the module 
+                                       did not become ready in time
+        """
+        key = _command_key(command)
+        
+        # wait for the learned turnaround time of this command
+        estimate = _session.turnaround.get(key, 0.0)
+        if int(estimate) > 0:
+            aardvark_py.aa_sleep_ms(int(min(estimate, self.poll_timeout)))
+        # end if
+        
+        polls = 0
+        
+        while True:
+            polls += 1
             
             # read from the slave device
-            read_data = aardvark_py.aa_i2c_read(self.port, int(address, 16), 
-                                                aardvark_py.AA_I2C_NO_FLAGS, 
-                                                data) 
+            result = self._read(address, read_length)
             
-            # convert data to alist
-            raw_data = list(read_data[1])
+            # time since the command was written in ms
+            elapsed = (_timer() - _session.write_time)*1000.0
             
-            # check the write flag
-            if raw_data[0] == 0:
-                # the write flag indicates a failed transmission
+            if result.ok() and (result.data[0] != 0):
+                # the write flag shows that the response is ready
+                break
+            
+            elif not (result.ok() or result.retryable()):
+                # the aardvark has failed
+                return None
+            
+            elif elapsed >= self.poll_timeout:
+                # the module never became ready
+                self.message = '*** ' + command + ' timed out ***'
                 return None
             # end if
             
-            # pause
-            aardvark_py.aa_sleep_ms(100)         
+            # the buffer of this poll can be used by the next
+            _session.pool.give(result.data)
             
-            # extract the data from the returned raw data
-            if type(return_format) == list:
-                # there are multiple items in the return list
-                return_list = []
-                
-                # remove the preamble
-                data = raw_data[preamble_length:]
-                
-                for item in return_format:
-                    # extract each item individually and append to list
-                    return_list = return_list + \
-                        [_extract_data(data[0:acceptible_formats[item]], item)]
-                    
-                    # shorten data list to what remains
-                    data = data[acceptible_formats[item]:]
-                # end for
-                
-                return return_list
-                    
-            else:
-                # extract the sole peice of data
-                if return_format != 'ascii':
-                    data = raw_data[preamble_length:]
-                # end if
-                return _extract_data(data, return_format)
-            #end if
+            # wait before polling again
+            aardvark_py.aa_sleep_ms(self.poll_interval)
+        # end while
+        
+        # learn the turnaround time of this command
+        if polls == 1 and estimate > 0:
+            # the module was already ready so the estimate may be too long
+            _session.turnaround[key] = estimate*_Poll_shrink
             
+        elif estimate > 0:
+            _session.turnaround[key] = estimate + \
+                _Poll_weight*(elapsed - estimate)
+            
+        else:
+            _session.turnaround[key] = elapsed
         # end if
         
-        # if you make it this far there was a problem with the format strings
-        return None
-    # end def    
-# end class
-       
+        return result.data
+    # end def
+    
+    def _retry(self, command, address, attempt):
+        """
+        Function to make a transaction, repeating it according to the retry 
+        policy of the session until it succeeds.
         
-#
-# ----------------
-# Private Functions 
+        A failed attempt is repeated after a delay that grows with each retry
+        until the attempts or the deadline of the command run out, or until 
+        an attempt fails in a way that is not retryable. If the bus reports 
+        an error it is freed before the next attempt. If the command was 
+        received but its response could not be read only the read is 
+        repeated. A module that has not acknowledged any attempt is marked as
+        dead and is only tried once from then on, until it responds again.
+        
+        The buffers lent by the pool for the previous attempt or transaction 
+        are returned before each attempt, so the response returned is only 
+        valid until the next transaction starts.
+        
+        @param[in]    command:         the command of the transaction (string)
+        @param[in]    address:         the address of the module (string)
+        @param[in]    attempt:         makes one attempt, returning None or 
+                                       False if it failed (function)
+        @return       (variable)       the result of the successful attempt, 
+                                       or of the last attempt if none were
+        """
+        policy = _session.policy
+        
+        start = _timer()
+        
+        if _Negotiate and (address not in _session.bitrates) and \
+           (address not in _session.dead) and (self.port != None):
+            # find the fastest bitrate of this module the first time it is used
+            self.negotiate_bitrate(address)
+        # end if
+        
+        _session.use_bitrate(address)
+        
+        if address in _session.dead:
+            # fail fast, the module did not respond last time
+            attempts = 1
+            
+        else:
+            attempts = policy.attempts
+        # end if
+        
+        # assume the module never acknowledges until proved otherwise
+        acknowledged = False
+        
+        # nothing is left over from a previous transaction
+        self.resume = None
+        
+        for tries in xrange(attempts):
+            if tries > 0:
+                delay = policy.delay(tries)
+                
+                if (_timer() - start)*1000.0 + delay > policy.deadline(command):
+                    # there is no time left to try again
+                    break
+                # end if
+                
+                # wait before trying again
+                _stats_retry()
+                aardvark_py.aa_sleep_ms(delay)
+            # end if
+            
+            self.last_write = None
+            self.last_read = None
+            
+            # the buffers of the last attempt or transaction are finished with
+            _session.pool.release()
+            
+            result = attempt()
+            
+            if (result != None) and (result is not False):
+                # the attempt succeeded
+                _session.dead.discard(address)
+                return result
+            # end if
+            
+            transfers = [item for item in [self.last_write, self.last_read] 
+                         if item != None]
+            
+            if [item for item in transfers if item.count > 0]:
+                # the module is there even if the transfer failed
+                acknowledged = True
+            # end if
+            
+            if self.port == None:
+                # the aardvark was closed so there is nothing to retry with
+                break
+            # end if
+            
+            if [item for item in transfers 
+                if (item.kind != 'ok') and not item.retryable()]:
+                # trying again will not help
+                acknowledged = True
+                break
+            # end if
+            
+            if [item for item in transfers if item.kind in _Bus_errors]:
+                # recover a bus that may be held by the module
+                aardvark_py.aa_i2c_free_bus(self.port)
+            # end if
+            
+            # errors may be caused by a bitrate that is too fast
+            _session.fall_back(address)
+        # end for
+        
+        if not acknowledged:
+            # no module responded at this address, if one is connected later
+            # it may not be the same module
+            _session.dead.add(address)
+            _session.cache.clear(address)
+            self.message = '*** No module responded at ' + address + ' ***'
+        # end if
+        
+        return result
+    # end def
+    
+    def negotiate_bitrate(self, address):
+        """
+        Function to find the fastest bitrate a module can be used at. The 
+        bitrate is stepped up through _Bitrates and at each one the known 
+        answer reads must all match the answers read at the default bitrate.
+        The fastest bitrate passed is used for the module for the rest of the 
+        session, falling back to slower ones if there are errors.
+        
+        @param[in]    address:         the address of the module (string)
+        @return       (int)            the bitrate chosen (kHz)
+        """
+        with _session.lock:
+            # read the answers at the default bitrate
+            _session.bitrates[address] = _Bitrate
+            _session.use_bitrate(address)
+            
+            answers = [self._read_known(address, command, return_format) 
+                       for (command, return_format) in _Known_answers]
+            
+            if None in answers:
+                # the module cannot be tested so stay at the default
+                return _Bitrate
+            # end if
+            
+            for bitrate in [rate for rate in _Bitrates if rate > _Bitrate]:
+                # the aardvark returns the bitrate it was able to set
+                actual = aardvark_py.aa_i2c_bitrate(self.port, bitrate)
+                _session.bitrate = actual
+                
+                if actual < bitrate:
+                    # the aardvark cannot go any faster
+                    break
+                # end if
+                
+                # the answers must be read correctly every time
+                passed = True
+                
+                for i in range(_Negotiation_reads):
+                    for ((command, return_format), answer) in \
+                        zip(_Known_answers, answers):
+                        if self._read_known(address, command, 
+                                            return_format) != answer:
+                            passed = False
+                        # end if
+                    # end for
+                # end for
+                
+                if not passed:
+                    break
+                # end if
+                
+                _session.bitrates[address] = bitrate
+            # end for
+            
+            _session.use_bitrate(address)
+            
+            return _session.bitrates[address]
+        # end with
+    # end def
+    
+    def _read_known(self, address, command, return_format):
+        """
+        Function to read a known answer once, without the cache or retries
+        
+        @param[in]    address:         the address of the module (string)
+        @param[in]    command:         the command to send (string)
+        @param[in]    return_format:   the format of the response (string)
+        @return       (variable)       the response, None if there was an 
+                                       error
+        """
+        plan = _compile_format(return_format, 
+                               self.wflag_size + self.time_size + 
+                               self.chksum_size, 
+                               self.name_size, self.ascii_size)
+        
+        # the buffers of the last read are finished with
+        _session.pool.release()
+        
+        read_data = self._transact(command, address, plan.read_length, True, 
+                                   False)
+        
+        if read_data == None:
+            return None
+        # end if
+        
+        return plan.decode(read_data)
+    # end def
+    
+    def read_SCPI(self, command, address, return_format):
+        """
+        Function to send a SCPI command to the slave device
+        
+        @param[in]    command:         the command to send (string or 
+                                       scpi_command)
+        @param[in]    address:         the decimal address to write to (int)
+        @param[out]   result:          the variable to store the data in
+        """  
+        with _session.lock:
+            _stats_begin(command)
+            
+            result = self._read_SCPI(command, address, return_format, True)
+            
+            _stats_end(result != None)
+            
+            return result
+        # end with
+    # end def
+    
+    def read_many(self, requests, address):
+        """
+        Function to read several items from the slave device in one batch.
+        
+        The requests are sent back to back without the settling pause that 
+        read_SCPI leaves after each read, as the next command is followed by
+        its own wait anyway. A request that fails does not stop the rest of 
+        the batch, its value is None and the reason is stored in errors.
+        The same command may be requested more than once, eg. with different
+        formats, as the values are returned in the order of the requests.
+        
+        @param[in]    requests:        the (command, format) of each item to 
+                                       read (list of tuples)
+        @param[in]    address:         the decimal address to write to (int)
+        @return       (list)           the value read for each request, in 
+                                       the order of the requests
+        """
+        results = [None]*len(requests)
+        
+        # clear the errors from any previous batch
+        self.errors = {}
+        
+        # hold the bus for the whole batch
+        with _session.lock:
+            for index in range(len(requests)):
+                (command, return_format) = requests[index]
+                
+                # only settle after the last request in the batch
+                settle = (index == len(requests) - 1)
+                
+                self.message = ''
+                
+                _stats_begin(command)
+                
+                try:
+                    results[index] = self._read_SCPI(command, address, 
+                                                     return_format, settle)
+                    
+                except Exception, error:
+                    # the read failed part way through
+                    results[index] = None
+                    self.message = '*** ' + command + ' failed: ' + \
+                        str(error) + ' ***'
+                # end try
+                
+                _stats_end(results[index] != None)
+                
+                if results[index] == None:
+                    # record why this item failed
+                    if self.message == '':
+                        self.message = '*** ' + command + ' did not respond' + \
+                                       _failure_text(self) + ' ***'
+                    # end if
+                    self.errors[index] = self.message
+                # end if
+            # end for
+        # end with
+        
+        return results
+    # end def
+    
+    def _read_SCPI(self, command, address, return_format, settle):
+        """
+        Function to send a SCPI command to the slave device and read the 
+        response
+        
+        @param[in]    command:         the command to send (string)
+        @param[in]    address:         the decimal address to write to (int)
+        @param[in]    return_format:   the format of the response (string or 
+                                       list)
+        @param[in]    settle:          True to pause after the read in the 
+                                       'fixed' readiness mode (bool)
+        @return       (variable)       the response, None if there was an 
+                                       error
+        """  
+        # use the cached response if there is one
+        (cached, value) = _session.cache.get(address, command, return_format)
+        if cached:
+            return value
+        # end if
+        
+        # length of preamle
+        preamble_length = self.wflag_size + self.time_size + self.chksum_size
+        
+        # get the compiled plan for this format
+        try:
+            plan = _compile_format(return_format, preamble_length, 
+                                   self.name_size, self.ascii_size)
+            
+        except ValueError, error:
+            # the format is not acceptible
+            self.message = str(error)
+            return None
+        # end try
+        
+        # send the command and read the response, ascii responses have no
+        # write flag
+        read_data = self._retry(command, address, 
+                                partial(self._transact, command, address, 
+                                        plan.read_length, 
+                                        return_format != 'ascii', settle))
+        
+        if read_data == None:
+            # the module did not respond
+            return None
+        # end if
+        
+        # extract the data from the returned raw data
+        value = plan.decode(read_data)
+        
+        _session.cache.put(address, command, return_format, value)
+        
+        return value
+    # end def    
+# end class
+       
+        
+class scpi_command(str):
+    """
+    Class for a SCPI command that is used repeatedly. It is a string, so it 
+    can be used anywhere a command string is accepted, but the bytes to write
+    including the terminator are encoded once when it is created rather than
+    every time it is sent.
+    
+    @attribute payload      (array)  The bytes to write
+    """
+    
+    def __new__(cls, text):
+        """
+        Create the command
+        
+        @param[in]    text:            the SCPI command (string)
+        """
+        command = str.__new__(cls, text)
+        
+        command.payload = array('B', text + '\n')
+        
+        return command
+    # end def
+# end class
+
+
+class command_template:
+    """
+    Class for a SCPI command with parameters that change from call to call,
+    eg. 'BM2:BQF READ_PAGE,{id},{page}'. The commands it makes are kept so 
+    that the same parameters give the same scpi_command without encoding it
+    again.
+    
+    @attribute text         (string) The command with {name} in place of each
+                                     parameter
+    @attribute commands     (dict)   The commands already made, by parameters
+    """
+    
+    def __init__(self, text):
+        """
+        Initialise the template
+        
+        @param[in]    text:            the command with {name} in place of 
+                                       each parameter (string)
+        """
+        self.text = text
+        
+        self.commands = {}
+    # end def
+    
+    def fill(self, **parameters):
+        """
+        Make the command for a set of parameters
+        
+        @param[in]    parameters:      the value of each parameter
+        @return       (scpi_command)   The command
+        """
+        key = tuple(sorted(parameters.items()))
+        
+        command = self.commands.get(key)
+        
+        if command == None:
+            if len(self.commands) >= _Template_commands:
+                # do not keep every command ever made
+                self.commands.clear()
+            # end if
+            
+            command = scpi_command(self.text.format(**parameters))
+            self.commands[key] = command
+        # end if
+        
+        return command
+    # end def
+# end class
+
+
+class format_plan:
+    """
+    Class that holds a response format compiled into a single struct so that
+    a response can be decoded with one unpack.
+    
+    @attribute structure    (struct.Struct) Unpacks all items in the response
+    @attribute offset       (int)    Offset of the first item in the response
+    @attribute read_length  (int)    The number of bytes to read
+    @attribute kinds        (list)   The format of each item
+    @attribute is_list      (bool)   True if the items are returned as a list
+    @attribute unpacked     (bool)   True if the items are returned as they 
+                                     are unpacked, with no strings to 
+                                     terminate or bytes to show as hex
+    """
+    
+    def __init__(self, return_format, preamble_length, name_size, ascii_size):
+        """
+        Compile the response format
+        
+        @param[in]    return_format:   the format of the response, a format 
+                                       name or a list of format names
+        @param[in]    preamble_length: length of the response preamble (int)
+        @param[in]    name_size:       length of a name response (int)
+        @param[in]    ascii_size:      length of an ascii response (int)
+        """
+        self.is_list = (type(return_format) == list)
+        
+        if self.is_list:
+            self.kinds = list(return_format)
+            
+        else:
+            self.kinds = [return_format]
+        # end if
+        
+        # lengths of the string formats
+        string_sizes = {'name':name_size, 'ascii':ascii_size, 
+                        'string':ascii_size}
+        
+        # build the struct format string
+        codes = '<'
+        for item in self.kinds:
+            if item in _Format_codes:
+                codes += _Format_codes[item]
+                
+            elif item in string_sizes:
+                codes += str(string_sizes[item]) + 's'
+                
+            else:
+                # error
+                raise ValueError('***'+ str(item) + 
+                                 " is an unacceptible format ***")
+            # end if
+        # end for
+        
+        self.structure = Struct(codes)
+        
+        # ascii responses are the only ones without a preamble
+        if return_format == 'ascii':
+            self.offset = 0
+            
+        else:
+            self.offset = preamble_length
+        # end if
+        
+        self.read_length = self.offset + self.structure.size
+        
+        self.unpacked = not [item for item in self.kinds 
+                             if (item in _String_formats) or (item == 'hex')]
+    # end def
+    
+    def decode(self, raw_data):
+        """
+        Decode a response
+        
+        @param[in]    raw_data:        the response read from the module 
+                                       (array)
+        @return       (variable)       the decoded item or list of items
+        """
+        values = self.structure.unpack_from(raw_data, self.offset)
+        
+        if self.unpacked:
+            # the values need no more work
+            if self.is_list:
+                return list(values)
+                
+            else:
+                return values[0]
+            # end if
+        # end if
+        
+        return_list = []
+        
+        for (item, value) in zip(self.kinds, values):
+            if item in _String_formats:
+                # terminate the string at the null terminator
+                end = value.find('\0')
+                if end >= 0:
+                    value = value[:end]
+                # end if
+                
+            elif item == 'hex':
+                value = _Hex_bytes[value]
+            # end if
+            
+            return_list.append(value)
+        # end for
+        
+        if self.is_list:
+            return return_list
+            
+        else:
+            return return_list[0]
+        # end if
+    # end def
+# end class
+
+
+class i2c_result:
+    """
+    Class that holds the outcome of a single I2C transfer
+    
+    @attribute status       (int)    The AA_I2C_STATUS code of the transfer, 
+                                     or a negative aardvark error
+    @attribute count        (int)    The number of bytes transferred
+    @attribute expected     (int)    The number of bytes that should have been
+    @attribute data         (array)  The bytes read, None for a write
+    @attribute kind         (string) What happened: 'ok', 'short', 'nack', 
+                                     'data_nack', 'bus_error', 'arb_lost', 
+                                     'bus_locked', 'not_ready' or 'adapter'
+    """
+    
+    def __init__(self, status, count, expected, data = None):
+        """
+        Initialise the result and classify it
+        
+        @param[in]    status:          the status of the transfer (int)
+        @param[in]    count:           the bytes transferred (int)
+        @param[in]    expected:        the bytes that should have been (int)
+        @param[in]    data:            the bytes read (array)
+        """
+        self.status = status
+        
+        self.count = max(count, 0)
+        
+        self.expected = expected
+        
+        self.data = data
+        
+        if status < 0:
+            # the aardvark itself failed
+            self.kind = 'adapter'
+            
+        elif status == aardvark_py.AA_I2C_STATUS_OK:
+            self.kind = 'ok' if self.count == expected else 'short'
+            
+        else:
+            self.kind = _Status_kinds.get(status, 'bus_error')
+        # end if
+    # end def
+    
+    def ok(self):
+        """
+        Determine if the whole transfer succeeded
+        
+        @return       (bool)           True if it succeeded
+        """
+        return self.kind == 'ok'
+    # end def
+    
+    def retryable(self):
+        """
+        Determine if the transfer might succeed if it is tried again
+        
+        @return       (bool)           True if it is worth trying again
+        """
+        return self.kind in _Retryable
+    # end def
+    
+    def partial(self):
+        """
+        Get the bytes that were read before the transfer failed
+        
+        @return       (array)          The bytes read, None for a write
+        """
+        if self.data == None:
+            return None
+        # end if
+        
+        return self.data[:self.count]
+    # end def
+# end class
+
+
+class response_cache:
+    """
+    Class that holds recent responses to commands whose response does not 
+    change quickly, so that they are not read again. Entries are keyed by 
+    address, command and format and expire after the time to live of their 
+    command. A copy of a cached list is returned so that the cached value 
+    cannot be changed by the caller.
+    
+    @attribute ttls         (dict)   The time to live in seconds of each 
+                                     command, None if it never changes
+    @attribute command_ttls (dict)   The time to live found for each command
+                                     that has been used, so that it is only 
+                                     looked up once
+    @attribute entries      (dict)   The (value, expiry time) of each cached 
+                                     response, by (address, command, format)
+    @attribute pending      (dict)   The prefixes of the responses changed 
+                                     by each module's settings that are not 
+                                     yet written to its NVM, by address
+    @attribute hits         (int)    The number of reads that were cached
+    """
+    
+    def __init__(self, ttls):
+        """
+        Initialise the empty cache
+        
+        @param[in]    ttls:            the time to live of each command (dict)
+        """
+        self.ttls = dict(ttls)
+        
+        self.command_ttls = {}
+        
+        self.entries = {}
+        
+        self.pending = {}
+        
+        self.hits = 0
+    # end def
+    
+    def set_ttl(self, command, ttl):
+        """
+        Set the time to live of the responses to a command, or to every 
+        field of an item
+        
+        @param[in]    command:         the command or its prefix (string)
+        @param[in]    ttl:             the time to live in seconds, None if 
+                                       the response never changes or 0 to 
+                                       stop caching it (float)
+        """
+        self.ttls[command] = ttl
+        
+        # the commands may now have a different time to live
+        self.command_ttls.clear()
+        self.clear()
+    # end def
+    
+    def ttl(self, command):
+        """
+        Get the time to live of the response to a command
+        
+        @param[in]    command:         the command (string)
+        @return       (float)          The time to live in seconds, None if 
+                                       the response never changes or 0 if it
+                                       is not cached
+        """
+        if command in self.command_ttls:
+            return self.command_ttls[command]
+        # end if
+        
+        if len(self.command_ttls) >= _Command_keys:
+            # do not keep every command ever sent
+            self.command_ttls.clear()
+        # end if
+        
+        if command in self.ttls:
+            ttl = self.ttls[command]
+            
+        elif [field for field in _Static_fields if command.endswith(field)]:
+            ttl = _Static_ttl
+            
+        else:
+            ttl = self.ttls.get(_command_key(command), 0)
+        # end if
+        
+        self.command_ttls[command] = ttl
+        
+        return ttl
+    # end def
+    
+    def get(self, address, command, return_format):
+        """
+        Look up a cached response
+        
+        @param[in]    address:         the address of the module (string)
+        @param[in]    command:         the command (string)
+        @param[in]    return_format:   the format of the response
+        @return       (bool, variable) True and the response if it is cached,
+                                       False and None if it is not
+        """
+        if self.ttl(command) == 0:
+            # this command is not cached
+            return (False, None)
+        # end if
+        
+        key = (address, command, _format_key(return_format))
+        
+        if key not in self.entries:
+            return (False, None)
+        # end if
+        
+        (value, expiry) = self.entries[key]
+        
+        if (expiry != None) and (_timer() >= expiry):
+            # the response is too old to use
+            del self.entries[key]
+            return (False, None)
+        # end if
+        
+        self.hits += 1
+        
+        if isinstance(value, list):
+            return (True, list(value))
+        # end if
+        
+        return (True, value)
+    # end def
+    
+    def put(self, address, command, return_format, value):
+        """
+        Cache a response if its command is cached
+        
+        @param[in]    address:         the address of the module (string)
+        @param[in]    command:         the command (string)
+        @param[in]    return_format:   the format of the response
+        @param[in]    value:           the response
+        """
+        ttl = self.ttl(command)
+        
+        if ttl == 0:
+            # this command is not cached
+            return
+        # end if
+        
+        if isinstance(value, list):
+            # keep a copy that the caller cannot change
+            value = list(value)
+        # end if
+        
+        expiry = None if ttl == None else _timer() + ttl
+        
+        self.entries[(address, command, _format_key(return_format))] = \
+            (value, expiry)
+    # end def
+    
+    def invalidate(self, address, prefixes, written):
+        """
+        Remove the cached responses of a module that a command changes
+        
+        @param[in]    address:         the address of the module (string)
+        @param[in]    prefixes:        the prefixes of the commands whose 
+                                       responses are changed (list)
+        @param[in]    written:         True if the command writes the 
+                                       settings to the NVM (bool)
+        """
+        # the settings changed before the NVM is written apply again when 
+        # it is
+        pending = self.pending.pop(address, set()) | set(prefixes)
+        
+        for key in self.entries.keys():
+            if (key[0] == address) and \
+               [prefix for prefix in pending if key[1].startswith(prefix)]:
+                del self.entries[key]
+            # end if
+        # end for
+        
+        if pending and not written:
+            self.pending[address] = pending
+        # end if
+    # end def
+    
+    def clear(self, address = None):
+        """
+        Remove the cached responses of a module
+        
+        @param[in]    address:         the address of the module, None for 
+                                       every module (string)
+        """
+        if address == None:
+            self.entries.clear()
+            self.pending.clear()
+            return
+        # end if
+        
+        if address in self.pending:
+            del self.pending[address]
+        # end if
+        
+        for key in self.entries.keys():
+            if (address == None) or (key[0] == address):
+                del self.entries[key]
+            # end if
+        # end for
+    # end def
+# end class
+
+
+class retry_policy:
+    """
+    Class that describes how failed transactions are retried
+    
+    @attribute attempts     (int)    The number of attempts at a transaction
+    @attribute backoff      (int)    The delay before the first retry in ms
+    @attribute growth       (float)  The growth of the delay between retries
+    @attribute deadlines    (dict)   The time in ms allowed for all of the 
+                                     attempts of a command, by command prefix
+    @attribute default_deadline (int) The time in ms allowed for commands 
+                                     that are not in deadlines
+    """
+    
+    def __init__(self, attempts, backoff, growth, deadline, deadlines):
+        """
+        Initialise the policy
+        
+        @param[in]    attempts:        the number of attempts (int)
+        @param[in]    backoff:         the first retry delay in ms (int)
+        @param[in]    growth:          the growth of the delay (float)
+        @param[in]    deadline:        the default deadline in ms (int)
+        @param[in]    deadlines:       the deadline in ms of each command 
+                                       prefix (dict)
+        """
+        self.attempts = max(int(attempts), 1)
+        
+        self.backoff = backoff
+        
+        self.growth = growth
+        
+        self.default_deadline = deadline
+        
+        self.deadlines = dict(deadlines)
+    # end def
+    
+    def delay(self, tries):
+        """
+        Get the delay before a retry
+        
+        @param[in]    tries:           the number of attempts already made 
+                                       (int)
+        @return       (int)            The delay in ms
+        """
+        return int(self.backoff*self.growth**(tries - 1))
+    # end def
+    
+    def deadline(self, command):
+        """
+        Get the time allowed for all of the attempts of a command
+        
+        @param[in]    command:         the command (string)
+        @return       (int)            The deadline in ms
+        """
+        return self.deadlines.get(_command_key(command), 
+                                  self.default_deadline)
+    # end def
+# end class
+
+
+class buffer_pool:
+    """
+    Class that keeps preallocated byte arrays for the transfers so that they
+    are used again rather than allocated for every transfer. The buffers are
+    kept in buckets of the sizes in _Buffer_sizes, and a transfer gets the 
+    smallest buffer it fits in along with the number of bytes to transfer, 
+    which aardvark_py accepts in place of an array. 
+    
+    Buffers are lent to the transaction in progress and are all returned by
+    release() when the next transaction starts. The pool is only used while
+    the session lock is held.
+    
+    @attribute sizes        (list)   The sizes of the buckets, smallest first
+    @attribute free         (dict)   The free buffers of each size
+    @attribute lent         (list)   The buffers lent since the last release
+    @attribute encoders     (dict)   The struct that packs a command and its 
+                                     terminator, by the length of the command
+    @attribute allocations  (int)    The number of buffers ever allocated
+    """
+    
+    def __init__(self, sizes):
+        """
+        Initialise the pool with no buffers
+        
+        @param[in]    sizes:           the sizes of the buckets (list of int)
+        """
+        self.sizes = sorted(sizes)
+        
+        self.free = dict([(size, []) for size in sizes])
+        
+        self.lent = []
+        
+        self.encoders = {}
+        
+        self.allocations = 0
+    # end def
+    
+    def take(self, length):
+        """
+        Borrow a buffer
+        
+        @param[in]    length:          the number of bytes needed (int)
+        @return       (array, int)     The buffer and the number of bytes to
+                                       transfer
+        """
+        # find the smallest bucket, or an exact size if it fits none
+        size = length
+        for bucket in self.sizes:
+            if bucket >= length:
+                size = bucket
+                break
+            # end if
+        # end for
+        
+        if self.free.get(size):
+            block = self.free[size].pop()
+            
+        else:
+            block = _Zero_byte*size
+            self.allocations += 1
+        # end if
+        
+        self.lent.append(block)
+        
+        return (block, length)
+    # end def
+    
+    def encode(self, command):
+        """
+        Borrow a buffer holding a SCPI command and its terminator. A 
+        scpi_command is already encoded so its own payload is used.
+        
+        @param[in]    command:         the command (string or scpi_command)
+        @return       (array, int)     The buffer and the number of bytes to
+                                       write
+        """
+        if type(command) == scpi_command:
+            return (command.payload, len(command.payload))
+        # end if
+        
+        (block, length) = self.take(len(command) + 1)
+        
+        encoder = self.encoders.get(len(command))
+        
+        if encoder == None:
+            # first command of this length
+            encoder = Struct(str(len(command)) + 'sB')
+            self.encoders[len(command)] = encoder
+        # end if
+        
+        encoder.pack_into(block, 0, command, 0x0a)
+        
+        return (block, length)
+    # end def
+    
+    def give(self, block):
+        """
+        Return a buffer before the next release
+        
+        @param[in]    block:           the buffer (array or tuple of array and
+                                       length)
+        """
+        if type(block) == tuple:
+            block = block[0]
+        # end if
+        
+        for index in range(len(self.lent)):
+            if self.lent[index] is block:
+                del self.lent[index]
+                
+                if len(block) in self.free:
+                    # a buffer that fits no bucket is not kept
+                    self.free[len(block)].append(block)
+                # end if
+                
+                return
+            # end if
+        # end for
+    # end def
+    
+    def release(self):
+        """
+        Return every buffer that has been lent
+        """
+        for block in self.lent:
+            if len(block) in self.free:
+                # a buffer that fits no bucket is not kept
+                self.free[len(block)].append(block)
+            # end if
+        # end for
+        
+        del self.lent[:]
+    # end def
+# end class
+
+
+class aardvark_session:
+    """
+    Class that owns the aardvark handle for the whole process so that the 
+    aardvark is only opened and configured once and then shared by every 
+    aardvark object.
+    
+    @attribute message      (string) Place to store error messages
+    @attribute port         (Aardvark_py.Aardvark handle) 
+                                     The aardvark port in use, None if closed
+    @attribute turnaround   (dict)   Learned time in ms for the module to 
+                                     respond to each command
+    @attribute write_time   (float)  Time that the last command was written
+    @attribute busy_until   (float)  Time until which the module is assumed to
+                                     be busy processing the last command
+    @attribute path_counts  (dict)   Number of queries that took each path
+    @attribute lock         (RLock)  Held while a thread is using the bus
+    @attribute unique_id    (int)    The unique ID of the aardvark to use, 
+                                     None to use the first one found
+    @attribute policy       (retry_policy) How failed transactions are retried
+    @attribute dead         (set)    Addresses where no module responded
+    @attribute cache        (response_cache) Recent responses that can be 
+                                     used again
+    @attribute bitrate      (int)    The bitrate the aardvark is set to (kHz)
+    @attribute bitrates     (dict)   The negotiated bitrate of each module 
+                                     address (kHz)
+    @attribute pool         (buffer_pool) The buffers used for the transfers
+    """
+    
+    def __init__(self):
+        """
+        Initialise the session with no aardvark open
+        """
+        self.message = ''
+        
+        self.port = None
+        
+        self.unique_id = None
+        
+        self.turnaround = {}
+        
+        self.write_time = 0.0
+        
+        self.busy_until = 0.0
+        
+        self.path_counts = {}
+        
+        self.policy = retry_policy(_Retry_attempts, _Retry_backoff, 
+                                   _Retry_growth, _Retry_deadline, {})
+        
+        self.dead = set()
+        
+        self.cache = response_cache(_Cache_ttls)
+        
+        self.bitrate = _Bitrate
+        
+        self.bitrates = {}
+        
+        self.pool = buffer_pool(_Buffer_sizes)
+        
+        self.lock = threading.RLock()
+    # end def
+    
+    def acquire(self):
+        """
+        Get the handle of the configured aardvark, configuring an aardvark if
+        one is not already open or if the open one is no longer healthy.
+        
+        @return  (aardvark_py.aardvark)   The handle of the aardvark to be used
+                                          'None' if there is not one available
+        """
+        # another thread may be part way through opening the aardvark
+        with self.lock:
+            if (self.port != None) and not self.is_healthy():
+                # the aardvark has failed so close it and reconnect
+                self.close()
+            # end if
+            
+            if self.port == None:
+                # there is no open aardvark so configure one
+                self.message = ''
+                self.port = self.configure_aardvark()
+            # end if
+            
+            return self.port
+        # end with
+    # end def
+    
+    def use_bitrate(self, address):
+        """
+        Set the aardvark to the bitrate of a module if it is not already set
+        
+        @param[in]    address:         the address of the module (string)
+        """
+        bitrate = self.bitrates.get(address, _Bitrate)
+        
+        if (self.port != None) and (bitrate != self.bitrate):
+            aardvark_py.aa_i2c_bitrate(self.port, bitrate)
+            self.bitrate = bitrate
+        # end if
+    # end def
+    
+    def fall_back(self, address):
+        """
+        Drop a module to the next slower bitrate after an error
+        
+        @param[in]    address:         the address of the module (string)
+        @return       (bool)           True if the bitrate was lowered
+        """
+        bitrate = self.bitrates.get(address, _Bitrate)
+        
+        if bitrate <= _Bitrate:
+            # already at the default bitrate
+            return False
+        # end if
+        
+        slower = [rate for rate in _Bitrates if rate < bitrate]
+        self.bitrates[address] = max(slower + [_Bitrate])
+        
+        self.use_bitrate(address)
+        
+        return True
+    # end def
+    
+    def is_healthy(self):
+        """
+        Check that the open aardvark handle still responds.
+        
+        @return  (bool)   True if the aardvark can still be used
+        """
+        # the features request fails with an error code for a bad handle
+        features = aardvark_py.aa_features(self.port)
+        
+        return (features >= 0) and bool(features & aardvark_py.AA_FEATURE_I2C)
+    # end def
+    
+    def check_status(self, status):
+        """
+        Check the status returned by an aardvark call and mark the handle as 
+        failed if the status indicates that the aardvark has been lost, it 
+        will then be re-opened the next time it is acquired.
+        
+        @param[in]    status:          the return of the aardvark call (int)
+        """
+        # the general error codes (-1 to -99) are aardvark faults, I2C errors
+        # (-100 and below) are faults of the module and not the aardvark
+        if (status < 0) and (status > aardvark_py.AA_I2C_NOT_AVAILABLE):
+            self.message = '*** Aardvark error: ' + str(status) + ' ***'
+            self.close()
+        # end if
+    # end def
+    
+    def close(self):
+        """
+        Close the aardvark if it is open, the responses are only cached while
+        it is connected
+        """
+        if self.port != None:
+            aardvark_py.aa_close(self.port)
+            self.port = None
+        # end if
+        
+        # a different module may be connected by the time it is reopened
+        self.cache.clear()
+    # end def
+    
+    def configure_aardvark(self):
+        """ 
+        Function to configure the aardvark for pySCPI operation if there is one
+        available.
+        
+        @return  (aardvark_py.aardvark)   The handle of the aardvark to be used
+                                          'None' if there is not one available
+        """
+        # define the handle to return
+        Aardvark_in_use = None
+        
+        # find all connected aardvarks
+        AA_Devices = find_aardvarks()
+        
+        if self.unique_id != None:
+            # only the aardvark bound to this session can be used
+            AA_Devices = [device for device in AA_Devices 
+                          if device[1] == self.unique_id]
+        # end if
+        
+        # assume that an aardvark can be found until proved otherwise
+        Aardvark_present = True
+        
+        # Check if there is an Aardvark present
+        if len(AA_Devices) < 1:
+            # there is no aardvark to be found
+            self.message = '*** No Aardvark is present ***'
+            Aardvark_present = False
+            
+        else:
+            # there is an aardvark connected to select the first one if there
+            # are many
+            (Aardvark_port, unique_id, Aardvark_free) = AA_Devices[0]
+        # end if
+        
+        
+        # If there is an Aardvark there is it free?
+        if Aardvark_present and not Aardvark_free:
+            # the aardvark is not free
+            self.message = '*** Aardvark is being used, '\
+                           'disconnect other application or Aardvark device ***'
+            
+        elif Aardvark_present:
+            # Aardvark is available so configure it
+            
+            # open the connection with the aardvark
+            Aardvark_in_use = aardvark_py.aa_open(Aardvark_port)
+            
+            if Aardvark_in_use <= 0:
+                # the aardvark could not be opened
+                self.message = '*** Aardvark could not be opened ***'
+                return None
+            # end if
+            
+            # set it up in teh mode we need for pumpkin modules
+            aardvark_py.aa_configure(Aardvark_in_use, 
+                                     aardvark_py.AA_CONFIG_SPI_I2C)
+            
+            # default to both pullups on
+            aardvark_py.aa_i2c_pullup(Aardvark_in_use, 
+                                      aardvark_py.AA_I2C_PULLUP_BOTH)
+            
+            # set the bit rate to be the default
+            aardvark_py.aa_i2c_bitrate(Aardvark_in_use, _Bitrate)
+            self.bitrate = _Bitrate
+            
+            # free the bus
+            aardvark_py.aa_i2c_free_bus(Aardvark_in_use)
+            
+            # delay to allow the config to be registered
+            aardvark_py.aa_sleep_ms(200)    
+            
+        # end if    
+        
+        return Aardvark_in_use
+    # end def
+# end class
+    
+
+
+#
+# -------
+# Session
 
-        
-def _extract_data(data, format_string):
+# the aardvark session shared by the whole process
+_session = aardvark_session()
+
+# the statistics recorder, None if statistics are not enabled
+_stats = None
+
+# the file to export the statistics to when the session is closed
+_stats_file = None
+
+# the compiled response formats
+_format_plans = {}
+
+# the key of each command that has been used, by command
+_command_keys = {}
+
+#
+# ----------------
+# Public Functions
+
+def close_session():
+    """
+    Close the aardvark held by the shared session, to be called when the 
+    program exits.
     """
-    Function to parse data recieved from a SCPI command
+    _session.close()
+    
+    if _stats != None:
+        # report where the time went
+        print _stats.summary()
+        
+        if _stats_file != None:
+            _stats.export(_stats_file)
+        # end if
+    # end if
+# end def
 
-    @param[in]    data:            The data to parse (list of bytes)
-    @param[in]    format_string    The format to parse it as (string)
-    """      
-    if format_string in ['ascii', 'string', 'name']:
-        if 0 in data:
-            # terminate printing at the null terminator 
-            # of the string
-            return ''.join([chr(x) for x in data[0:data.index(0)]])
-        else:
-            # no null terminator
-            return ''.join([chr(x) for x in data])
-        # end if        
-    elif format_string == 'int':
-        return unpack('<h', ''.join([chr(x) for x in data]))[0]
+def enable_stats(file_name = None):
+    """
+    Start recording the time taken by every SCPI transaction, split into the
+    time spent in aardvark transfers and sleeping, grouped by command prefix.
+    The summary is printed when the session is closed.
+    
+    @param[in]    file_name:       the csv file to export the summary to when 
+                                   the session is closed, None to only print 
+                                   it (string)
+    @return       (stats_recorder) The recorder of the statistics
+    """
+    global _stats, _stats_file, aardvark_py
+    
+    with _session.lock:
+        if _stats == None:
+            _stats = process_stats.stats_recorder()
+            aardvark_py = process_stats.instrumented_transport(aardvark_py, 
+                                                               _stats)
+        # end if
         
-    elif format_string == 'long':
-        return unpack('<l', ''.join([chr(x) for x in data]))[0]
+        _stats_file = file_name
+    # end with
+    
+    return _stats
+# end def
+
+def find_aardvarks():
+    """
+    Find all of the aardvarks that are connected.
+    
+    @return       (list)           The (port, unique ID, free) of each 
+                                   aardvark, where free is False if another 
+                                   application is using it
+    """
+    # find the ports and unique IDs of the connected aardvarks
+    (count, ports, unique_ids) = aardvark_py.aa_find_devices_ext(_Max_devices,
+                                                                 _Max_devices)
+    
+    AA_Devices = []
+    
+    for i in range(min(max(count, 0), len(ports))):
+        # the port number is flagged if the aardvark is in use
+        free = not (ports[i] & aardvark_py.AA_PORT_NOT_FREE)
         
-    elif format_string == 'long long':
-        return unpack('<q', ''.join([chr(x) for x in data]))[0]        
+        AA_Devices.append((ports[i] & ~aardvark_py.AA_PORT_NOT_FREE, 
+                           unique_ids[i], free))
+    # end for
+    
+    return AA_Devices
+# end def
+
+def bind_aardvark(unique_id):
+    """
+    Bind the session to the aardvark with the given unique ID so that only it
+    is used by this process, for running several stations on one computer.
+    
+    @param[in]    unique_id:       The unique ID of the aardvark, None to use
+                                   the first one found (int)
+    """
+    with _session.lock:
+        if unique_id != _session.unique_id:
+            # stop using any other aardvark
+            _session.close()
+            _session.unique_id = unique_id
+        # end if
+    # end with
+# end def
+
+def set_transport(transport):
+    """
+    Set the module used to talk to the aardvark, so that a simulator with 
+    the same interface as aardvark_py can be used in place of the hardware.
+    
+    @param[in]    transport:       the module to use, eg. SCPI_simulator
+    """
+    global aardvark_py
+    
+    with _session.lock:
+        # the open aardvark belongs to the old transport
+        _session.close()
         
-    elif format_string == 'uint':
-        return unpack('<H', ''.join([chr(x) for x in data]))[0] 
+        if _stats != None:
+            # keep timing the new transport
+            transport = process_stats.instrumented_transport(transport, 
+                                                             _stats)
+        # end if
         
-    elif format_string == 'double':
-        return unpack('<d', ''.join([chr(x) for x in data]))[0]
+        aardvark_py = transport
+    # end with
+# end def
+
+def set_ready_mode(mode, timeout = _Poll_timeout, interval = _Poll_interval):
+    """
+    Set how aardvark objects created from now on wait for the module to 
+    process each command.
+    
+    @param[in]    mode:            'fixed' to wait a fixed delay after each
+                                   transaction, 'poll' to poll the module until
+                                   its response is ready (string)
+    @param[in]    timeout:         Time to wait for a response when polling in
+                                   ms (int)
+    @param[in]    interval:        Time between polls in ms (int)
+    """
+    global _Ready_mode, _Poll_timeout, _Poll_interval
+    
+    if mode not in ['fixed', 'poll']:
+        raise ValueError(str(mode) + ' is not a readiness mode')
+    # end if
+    
+    _Ready_mode = mode
+    _Poll_timeout = timeout
+    _Poll_interval = interval
+# end def
+
+def set_retry_policy(attempts = _Retry_attempts, backoff = _Retry_backoff,
+                     growth = _Retry_growth, deadline = _Retry_deadline, 
+                     deadlines = {}):
+    """
+    Set how failed transactions are retried.
+    
+    @param[in]    attempts:        the number of attempts at a transaction, 1 
+                                   to never retry (int)
+    @param[in]    backoff:         the delay before the first retry in ms (int)
+    @param[in]    growth:          the factor the delay grows by for each 
+                                   retry (float)
+    @param[in]    deadline:        the time allowed for all of the attempts of
+                                   a command in ms (int)
+    @param[in]    deadlines:       the deadline of particular commands by 
+                                   command prefix eg. 
+                                   {'BM2:BQF READ_PAGE': 500} (dict)
+    """
+    with _session.lock:
+        _session.policy = retry_policy(attempts, backoff, growth, deadline, 
+                                       deadlines)
         
-    elif format_string == 'float':
-        return unpack('<f', ''.join([chr(x) for x in data]))[0]                
+        # give every module another chance
+        _session.dead.clear()
+    # end with
+# end def
+
+def set_cache_ttl(command, ttl):
+    """
+    Set how long the responses to a command are cached for. Responses are 
+    removed from the cache when the aardvark is closed, when their module 
+    stops responding, or when a write in _Cache_changes that changes them is
+    sent to their module.
+    
+    @param[in]    command:         the full command eg. 'SUP:TEL? 9,data', or 
+                                   its prefix eg. 'SUP:TEL? 9' for every 
+                                   field of the item (string)
+    @param[in]    ttl:             the time to keep responses in seconds, 
+                                   None if the response never changes or 0 to
+                                   stop caching it (float)
+    """
+    with _session.lock:
+        _session.cache.set_ttl(command, ttl)
+    # end with
+# end def
+
+def clear_cache(address = None):
+    """
+    Clear the cached responses, eg. when a module is replaced.
+    
+    @param[in]    address:         the address of the module to clear, None 
+                                   for every module (string)
+    """
+    with _session.lock:
+        _session.cache.clear(address)
+    # end with
+# end def
+
+def set_bitrate_negotiation(enabled):
+    """
+    Set whether the fastest bitrate of each module is negotiated when it is 
+    first used. Previously negotiated bitrates are forgotten.
+    
+    @param[in]    enabled:         True to negotiate bitrates (bool)
+    """
+    global _Negotiate
+    
+    with _session.lock:
+        _Negotiate = enabled
+        _session.bitrates = {}
+    # end with
+# end def
+
+def set_query_mode(mode):
+    """
+    Set how aardvark objects created from now on perform queries.
+    
+    @param[in]    mode:            'split' to write and read in separate 
+                                   transactions, 'fast' to try a single 
+                                   write_read transaction first (string)
+    """
+    global _Query_mode
+    
+    if mode not in ['split', 'fast']:
+        raise ValueError(str(mode) + ' is not a query mode')
+    # end if
+    
+    _Query_mode = mode
+# end def
+
+def path_counts():
+    """
+    Get the number of queries that have taken each path so that the saving 
+    of the 'fast' query mode can be measured.
+    
+    @return       (dict)           Number of queries per path, 'write_read' 
+                                   or 'split'
+    """
+    return dict(_session.path_counts)
+# end def
+
+def buffer_allocations():
+    """
+    Get the number of transfer buffers that have been allocated, which stops
+    increasing once the pool has a buffer for every transfer being made.
+    
+    @return       (int)            The number of buffers allocated
+    """
+    return _session.pool.allocations
+# end def
+
+def is_numeric(return_format):
+    """
+    Determine if a response format is decoded as a single number
+    
+    @param[in]    return_format:   the format of the response (string or 
+                                   list)
+    @return       (bool)           True if the response is a single number
+    """
+    return (type(return_format) != list) and \
+           (return_format in _Format_codes) and (return_format != 'hex')
+# end def
+
+#
+# ----------------
+# Private Functions 
+
+
+def _compile_format(return_format, preamble_length, name_size, ascii_size):
+    """
+    Function to get the compiled plan for a response format, compiling it 
+    the first time that it is used.
+
+    @param[in]    return_format:   the format of the response, a format name 
+                                   or a list of format names
+    @param[in]    preamble_length: length of the response preamble (int)
+    @param[in]    name_size:       length of a name response (int)
+    @param[in]    ascii_size:      length of an ascii response (int)
+    @return       (format_plan)    the compiled format
+    """
+    if type(return_format) == list:
+        key = (tuple(return_format), preamble_length, name_size, ascii_size)
         
-    elif format_string == 'char':
-        return unpack('<B', ''.join([chr(x) for x in data]))[0]
+    else:
+        key = (return_format, preamble_length, name_size, ascii_size)
+    # end if
     
-    elif format_string == 'schar':
-        return unpack('<b', ''.join([chr(x) for x in data]))[0]    
+    plan = _format_plans.get(key)
     
-    elif format_string == 'hex':
-        return ' '.join(['%02X' % x for x in data])  
+    # compared with 'is' as comparing an instance with == looks up __eq__ 
+    # and __cmp__, making an exception and its message every time
+    if plan is None:
+        # first use of this format so compile it
+        plan = format_plan(return_format, preamble_length, name_size, 
+                           ascii_size)
+        _format_plans[key] = plan
     # end if
     
+    return plan
 #end def
+
+def _stats_begin(command, start = None):
+    """
+    Function to start timing a transaction if statistics are enabled
+    
+    @param[in]    command:         the command of the transaction (string)
+    @param[in]    start:           the time the transaction started, None for 
+                                   now (float)
+    """
+    if _stats is not None:
+        _stats.begin(_command_key(command), start)
+    # end if
+# end def
+
+def _stats_end(success):
+    """
+    Function to finish timing a transaction if statistics are enabled
+    
+    @param[in]    success:         False if the transaction failed (bool)
+    """
+    if _stats is not None:
+        _stats.end(success)
+    # end if
+# end def
+
+def _stats_retry():
+    """
+    Function to count an extra attempt if statistics are enabled
+    """
+    if _stats is not None:
+        _stats.retry()
+    # end if
+# end def
+
+def _failure_text(AARD):
+    """
+    Function to describe why the last attempt of a transaction failed
+    
+    @param[in]    AARD:            the aardvark object that made the attempt
+    @return       (string)         The reason in brackets, empty if there is 
+                                   not one
+    """
+    for result in [AARD.last_read, AARD.last_write]:
+        if (result != None) and (result.kind != 'ok'):
+            return ' (' + result.kind + ')'
+        # end if
+    # end for
+    
+    return ''
+# end def
+
+def _cache_changes(command):
+    """
+    Function to determine which of a module's responses a command can change
+    
+    @param[in]    command:         the command (string)
+    @return       (list)           The prefixes of the commands whose cached 
+                                   responses must be removed, None if the 
+                                   command does not change any
+    """
+    for name in _Cache_changes:
+        if command.startswith(name):
+            return _Cache_changes[name]
+        # end if
+    # end for
+    
+    for name in _Cache_clearing:
+        if name in command:
+            # an unknown setting so any response may change
+            return ['']
+        # end if
+    # end for
+    
+    return None
+# end def
+
+def _format_key(return_format):
+    """
+    Function to make a response format usable as a dictionary key
+    
+    @param[in]    return_format:   the format (string or list)
+    @return       (string or tuple) The format as a key
+    """
+    if isinstance(return_format, list):
+        return tuple(return_format)
+    # end if
+    
+    return return_format
+# end def
+
+def _command_key(command):
+    """
+    Function to get the key that identifies a command regardless of its 
+    parameters, eg. 'SUP:TEL? 9,data' -> 'SUP:TEL? 9'. The key of each 
+    command is remembered so that the command is only split the first time.
+
+    @param[in]    command:         The SCPI command (string)
+    @return       (string)         The command without its parameters
+    """
+    key = _command_keys.get(command)
+    
+    if key == None:
+        if len(_command_keys) >= _Command_keys:
+            # do not keep every command ever sent
+            _command_keys.clear()
+        # end if
+        
+        key = command.split(',', 1)[0]
+        _command_keys[command] = key
+    # end if
     
+    return key
+#end def
+        
 def _test():
     """
     Test code for this module.
@@ -393,10 +2465,314 @@ def _test():
     
     # end with
     
+    # close the aardvark
+    close_session()
+    
+# end def
+
+def _benchmark(responses = 1000):
+    """
+    Microbenchmark of the read path. The original read_SCPI (copy the 
+    response to a list, slice it for each item and join its characters) is
+    compared with the current read_SCPI, and with each of the layers that 
+    read_SCPI is built from so that the cost of each layer can be seen:
+    
+    transfers   the write and read of the simulator on their own
+    _transact   the transfers, write flag and buffers of one attempt
+    _retry      the retry policy around the attempt
+    _read_SCPI  the format plan and response cache
+    read_SCPI   the session lock and statistics
+    
+    The decoding of each read path is also measured on its own. The reads go
+    to the simulator without any delays so that only the work of this 
+    module, and of the simulator, is measured.
+    
+    Reports the time per response, the objects tracked by the garbage 
+    collector that are created per response, and the strings and arrays 
+    created per response.
+    
+    @param[in]    responses:       The number of responses to read (int)
+    """
+    import timeit
+    import SCPI_simulator
+    from struct import unpack
+    
+    set_transport(SCPI_simulator)
+    SCPI_simulator.configure(time_scale = 0)
+    
+    # the reads made by the steps
+    reads = [('BM2:TEL? 9,data', 'uint'), ('BM2:TEL? 78,data', 33*['char']), 
+             ('BM2:TEL? 75,data', 6*['float']), ('BM2:TEL? 9,name', 'name')]
+    
+    sizes = {'uint':2, 'char':1, 'float':4, 'name':32}
+    
+    def original_extract(data, format_string):
+        # _extract_data before it decoded from the buffer
+        if format_string == 'name':
+            if 0 in data:
+                return ''.join([chr(x) for x in data[0:data.index(0)]])
+            
+            else:
+                return ''.join([chr(x) for x in data])
+            # end if
+        # end if
+        
+        return unpack('<' + _Format_codes[format_string], 
+                      ''.join([chr(x) for x in data]))[0]
+    # end def
+    
+    def original_decode(read_data, return_format):
+        # the decoding in read_SCPI before format plans were introduced
+        raw_data = list(read_data)
+        
+        if type(return_format) == list:
+            return_list = []
+            data = raw_data[5:]
+            
+            for item in return_format:
+                return_list = return_list + \
+                    [original_extract(data[0:sizes[item]], item)]
+                data = data[sizes[item]:]
+            # end for
+            
+            return return_list
+        # end if
+        
+        return original_extract(raw_data[5:], return_format)
+    # end def
+    
+    def original_read(AARD, command, return_format, read_length):
+        # the transfers made by the original read_SCPI
+        write_data = [ord(item) for item in list(command)]
+        write_data.append(0x0a)
+        
+        aardvark_py.aa_i2c_write(AARD.port, 0x5C, 
+                                 aardvark_py.AA_I2C_NO_FLAGS, 
+                                 array('B', write_data))
+        
+        read_data = aardvark_py.aa_i2c_read(AARD.port, 0x5C, 
+                                            aardvark_py.AA_I2C_NO_FLAGS, 
+                                            array('B', [1]*read_length))
+        
+        return original_decode(read_data[1], return_format)
+    # end def
+    
+    def transfers(AARD, command, read_length):
+        # the transfers made by read_SCPI, without any of its layers
+        _session.pool.release()
+        
+        aardvark_py.aa_i2c_write_ext(AARD.port, 0x5C, 
+                                     aardvark_py.AA_I2C_NO_FLAGS, 
+                                     _session.pool.encode(command))
+        
+        return aardvark_py.aa_i2c_read_ext(AARD.port, 0x5C, 
+                                           aardvark_py.AA_I2C_NO_FLAGS, 
+                                           _session.pool.take(read_length))
+    # end def
+    
+    def transact(AARD, command, plan):
+        # a single attempt
+        _session.pool.release()
+        
+        return plan.decode(AARD._transact(command, '0x5C', plan.read_length, 
+                                          True, True))
+    # end def
+    
+    def retry(AARD, command, plan):
+        # the attempts made under the retry policy
+        return plan.decode(AARD._retry(command, '0x5C', 
+                                       partial(AARD._transact, command, 
+                                               '0x5C', plan.read_length, 
+                                               True, True)))
+    # end def
+    
+    print '%-8s %-16s %10s %8s %8s %8s' % ('format', 'path', 'time', 
+                                           'objects', 'strings', 'arrays')
+    
+    with aardvark() as AARD:
+        for (command, return_format) in reads:
+            plan = _compile_format(return_format, 5, 32, 128)
+            
+            # a response to decode on its own
+            AARD._write_command(command, '0x5C')
+            raw = AARD._read('0x5C', plan.read_length).data[:plan.read_length]
+            
+            if type(return_format) == list:
+                label = str(len(return_format)) + '*' + return_format[0]
+                
+            else:
+                label = return_format
+            # end if
+            
+            for (name, read) in [
+                ('original decode', lambda: original_decode(raw, 
+                                                            return_format)),
+                ('plan decode', lambda: plan.decode(raw)),
+                ('original read', lambda: original_read(AARD, command, 
+                                                        return_format, 
+                                                        plan.read_length)),
+                ('transfers', lambda: transfers(AARD, command, 
+                                                plan.read_length)),
+                ('_transact', lambda: transact(AARD, command, plan)),
+                ('_retry', lambda: retry(AARD, command, plan)),
+                ('_read_SCPI', lambda: (_session.cache.clear(), 
+                                        AARD._read_SCPI(command, '0x5C', 
+                                                        return_format, 
+                                                        True))),
+                ('read_SCPI', lambda: (_session.cache.clear(), 
+                                       AARD.read_SCPI(command, '0x5C', 
+                                                      return_format)))]:
+                # time the reads
+                seconds = timeit.timeit(read, number = responses)
+                
+                print '%-8s %-16s %7.2f us %8d %8.1f %8.1f' % \
+                    (label, name, seconds*1e6/responses, 
+                     _count_objects(read), _count_frees(read, str), 
+                     _count_frees(read, array))
+            # end for
+        # end for
+    # end with
+    
+    close_session()
+# end def
+
+def _count_objects(function):
+    """
+    Function to count the objects created by a call, for the benchmark. 
+    Python 2.7 has no allocation counter, so the objects tracked by the 
+    garbage collector are listed at every call and return made during the 
+    call, and each new object is kept so that its memory can not be reused 
+    by a later one. Strings, arrays and numbers are not tracked so are not 
+    counted, see _count_frees, nor are the objects made by the listing 
+    itself.
+    
+    @param[in]    function:        the function to call
+    @return       (int)            The number of objects created
+    """
+    created = []
+    listings = []
+    
+    def sample(frame, event, argument):
+        objects = gc.get_objects()
+        
+        # keep the listing, and the locals that the profiler makes into a 
+        # dict, so that their memory is not reused
+        listings.extend([objects, frame.f_locals])
+        known.update([id(objects), id(frame.f_locals)])
+        
+        # index the list so that the sampling creates no iterator
+        for index in xrange(len(objects)):
+            item = objects[index]
+            
+            if (id(item) in known) or (type(item) == types.FrameType):
+                continue
+            
+            elif (type(item) == tuple) and (len(item) == 3) and \
+                 (type(item[0]) == types.FrameType):
+                # the arguments of this function
+                continue
+            # end if
+            
+            known.add(id(item))
+            created.append(item)
+        # end for
+    # end def
+    
+    gc.collect()
+    known = set(map(id, gc.get_objects()))
+    known.add(id(known))
+    
+    sys.setprofile(sample)
+    function()
+    sys.setprofile(None)
+    
+    return len(created)
 # end def
 
+def _count_frees(function, kind, calls = 100):
+    """
+    Function to count the objects of a type that are created by a call, for
+    the benchmark, for the types such as strings and arrays that the garbage
+    collector does not track. The type's tp_free slot is pointed at a 
+    counter while the function is called repeatedly. Once the calls are in 
+    a steady state every object a call creates is freed by the end of the 
+    next call, so the objects freed per call are the objects created per 
+    call. Objects kept in a free list, eg. ints and floats, are not counted.
+    
+    @param[in]    function:        the function to call
+    @param[in]    kind:            the type to count, which must be freed 
+                                   through its tp_free slot, eg. str or array
+    @param[in]    calls:           the number of calls to average over (int)
+    @return       (float)          The number of objects created per call
+    """
+    import ctypes
+    
+    # the start of PyTypeObject up to tp_free
+    pointer = ctypes.c_void_p
+    size = ctypes.c_ssize_t
+    fields = [('ob_refcnt', size), ('ob_type', pointer), ('ob_size', size),
+              ('tp_name', pointer), ('tp_basicsize', size), 
+              ('tp_itemsize', size)]
+    fields += [(name, pointer) for name in 
+               ['tp_dealloc', 'tp_print', 'tp_getattr', 'tp_setattr', 
+                'tp_compare', 'tp_repr', 'tp_as_number', 'tp_as_sequence',
+                'tp_as_mapping', 'tp_hash', 'tp_call', 'tp_str', 
+                'tp_getattro', 'tp_setattro', 'tp_as_buffer']]
+    fields += [('tp_flags', ctypes.c_long)]
+    fields += [(name, pointer) for name in 
+               ['tp_doc', 'tp_traverse', 'tp_clear', 'tp_richcompare']]
+    fields += [('tp_weaklistoffset', size)]
+    fields += [(name, pointer) for name in 
+               ['tp_iter', 'tp_iternext', 'tp_methods', 'tp_members', 
+                'tp_getset', 'tp_base', 'tp_dict', 'tp_descr_get', 
+                'tp_descr_set']]
+    fields += [('tp_dictoffset', size)]
+    fields += [(name, pointer) for name in 
+               ['tp_init', 'tp_alloc', 'tp_new', 'tp_free']]
+    
+    type_object = type('type_object', (ctypes.Structure,), 
+                       {'_fields_': fields}).from_address(id(kind))
+    
+    # the free function is called holding the interpreter lock
+    free_function = ctypes.PYFUNCTYPE(None, pointer)
+    
+    original = type_object.tp_free
+    free = free_function(original)
+    
+    freed = [0]
+    
+    def counter(address):
+        freed[0] += 1
+        free(address)
+    # end def
+    
+    hook = free_function(counter)
+    
+    # reach a steady state
+    for call in xrange(5):
+        function()
+    # end for
+    
+    type_object.tp_free = ctypes.cast(hook, pointer).value
+    
+    try:
+        for call in xrange(calls):
+            function()
+        # end for
+        
+    finally:
+        type_object.tp_free = original
+    # end try
+    
+    return freed[0]/float(calls)
+# end def
 
 if __name__ == '__main__':
     # if this code is not running as an imported module run test code
-    _test()
+    if 'benchmark' in sys.argv:
+        _benchmark()
+        
+    else:
+        _test()
+    # end if
 # end if
\ No newline at end of file
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package process_async
+Module to provide an asynchronous front end to process_SCPI. All of the
+aardvark I/O is performed by a single dedicated thread so that the caller,
+be it an asyncio event loop or the Tk thread, is never blocked while a
+module is busy.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import process_SCPI
+import threading
+import Queue
+
+# asyncio is only available on newer pythons, trollius provides it for 2.7
+try:
+    import asyncio
+
+except ImportError:
+    try:
+        import trollius as asyncio
+    
+    except ImportError:
+        asyncio = None
+    # end try
+# end try
+
+#
+# ---------
+# Classes
+
+class SCPI_future:
+    """
+    Class that holds the result of a request made to the I/O thread when no
+    event loop is in use.
+    
+    @attribute event       (threading.Event) Set when the request completes
+    @attribute value       (variable)        The result of the request
+    @attribute error       (Exception)       The error raised by the request
+    @attribute callbacks   (list)            Functions to call on completion
+    """
+    
+    def __init__(self):
+        """
+        Initialise the incomplete future
+        """
+        self.event = threading.Event()
+        
+        self.value = None
+        
+        self.error = None
+        
+        self.callbacks = []
+        
+        self.lock = threading.Lock()
+    # end def
+    
+    def done(self):
+        """
+        Determine if the request has completed
+        
+        @return  (bool)   True if the request has completed
+        """
+        return self.event.is_set()
+    # end def
+    
+    def result(self, timeout = None):
+        """
+        Wait for the request to complete and get its result
+        
+        @param   timeout   (float)     Time to wait in seconds, None for ever
+        @return  (variable)            The result of the request
+        """
+        if not self.event.wait(timeout):
+            raise RuntimeError('The SCPI request did not complete in time')
+        # end if
+        
+        if self.error != None:
+            raise self.error
+        # end if
+        
+        return self.value
+    # end def
+    
+    def add_done_callback(self, callback):
+        """
+        Add a function to call with this future once the request completes,
+        it is called on the I/O thread.
+        
+        @param   callback  (function)  The function to call
+        """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+            # end if
+        # end with
+        
+        # the request has already completed
+        callback(self)
+    # end def
+    
+    def set_result(self, value):
+        """
+        Complete the request successfully
+        
+        @param   value     (variable)  The result of the request
+        """
+        self.value = value
+        self._complete()
+    # end def
+    
+    def set_exception(self, error):
+        """
+        Complete the request with an error
+        
+        @param   error     (Exception) The error raised by the request
+        """
+        self.error = error
+        self._complete()
+    # end def
+    
+    def _complete(self):
+        """
+        Mark the request as complete and call the callbacks
+        """
+        with self.lock:
+            self.event.set()
+            callbacks = self.callbacks
+            self.callbacks = []
+        # end with
+        
+        for callback in callbacks:
+            callback(self)
+        # end for
+    # end def
+# end class
+
+
+class SCPI_bus:
+    """
+    Class that performs SCPI requests on a dedicated I/O thread, which owns
+    the use of the aardvark.
+    
+    Every request returns a future immediately. If an event loop is given
+    the futures are asyncio futures, so they can be awaited
+    (eg. value = await bus.query(command, address, format)), otherwise they
+    are SCPI_futures whose result() waits for the request.
+    
+    @attribute loop        (asyncio loop)      The event loop to report to,
+                                               None if there is not one
+    @attribute requests    (Queue.Queue)       Requests waiting for the thread
+    @attribute thread      (threading.Thread)  The I/O thread
+    @attribute message     (string)            Place to store error messages
+    """
+    
+    def __init__(self, loop = None):
+        """
+        Initialise the bus and start its I/O thread
+        
+        @param   loop      (asyncio loop)  The event loop that will await the
+                                           requests, None to use SCPI_futures
+        """
+        if (loop != None) and (asyncio == None):
+            raise RuntimeError('asyncio is not available')
+        # end if
+        
+        self.loop = loop
+        
+        self.message = ''
+        
+        self.requests = Queue.Queue()
+        
+        # start the I/O thread
+        self.thread = threading.Thread(target = self._run, name = 'SCPI I/O')
+        self.thread.daemon = True
+        self.thread.start()
+    # end def
+    
+    def __enter__(self):
+        """
+        For use with the 'with' operator
+        """
+        return self
+    # end def
+    
+    def __exit__(self, type, value, traceback):
+        """
+        Ensures that the I/O thread is stopped
+        
+        For use with the 'with' operator
+        """
+        self.close()
+    # end def
+    
+    def query(self, command, address, return_format):
+        """
+        Send a SCPI command and read the response.
+        
+        @param[in]    command:         the command to send (string)
+        @param[in]    address:         the address to write to (string)
+        @param[in]    return_format:   the format of the response (string or
+                                       list)
+        @return       (future)         resolves to the response
+        """
+        return self._submit('read_SCPI', (command, address, return_format))
+    # end def
+    
+    def query_many(self, requests, address):
+        """
+        Read several items in one batch.
+        
+        @param[in]    requests:        the (command, format) of each item to
+                                       read (list of tuples)
+        @param[in]    address:         the address to write to (string)
+        @return       (future)         resolves to the list of responses, in
+                                       the order of the requests
+        """
+        return self._submit('read_many', (requests, address))
+    # end def
+    
+    def send(self, command, address):
+        """
+        Send a SCPI command that has no response.
+        
+        @param[in]    command:         the command to send (string)
+        @param[in]    address:         the address to write to (string)
+        @return       (future)         resolves once the command is sent
+        """
+        return self._submit('send_SCPI', (command, address))
+    # end def
+    
+    def sleep(self, seconds):
+        """
+        Wait without blocking the caller, in place of time.sleep between
+        requests.
+        
+        @param[in]    seconds:         the time to wait (float)
+        @return       (future)         resolves once the time has passed
+        """
+        if self.loop != None:
+            return asyncio.ensure_future(asyncio.sleep(seconds),
+                                         loop = self.loop)
+        # end if
+        
+        future = SCPI_future()
+        
+        timer = threading.Timer(seconds, future.set_result, [None])
+        timer.daemon = True
+        timer.start()
+        
+        return future
+    # end def
+    
+    def close(self):
+        """
+        Stop the I/O thread once the outstanding requests are complete.
+        """
+        if self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
+        # end if
+    # end def
+    
+    def _submit(self, method, args):
+        """
+        Queue a request for the I/O thread
+        
+        @param[in]    method:          the aardvark method to call (string)
+        @param[in]    args:            the arguments to call it with (tuple)
+        @return       (future)         resolves to the result of the call
+        """
+        if self.loop != None:
+            if hasattr(self.loop, 'create_future'):
+                future = self.loop.create_future()
+            
+            else:
+                future = asyncio.Future(loop = self.loop)
+            # end if
+        
+        else:
+            future = SCPI_future()
+        # end if
+        
+        self.requests.put((future, method, args))
+        
+        return future
+    # end def
+    
+    def _resolve(self, future, value, error):
+        """
+        Complete a request, passing the result to the event loop's thread if
+        there is an event loop.
+        
+        @param[in]    future:          the future of the request
+        @param[in]    value:           the result of the request
+        @param[in]    error:           the error raised, None if there was none
+        """
+        if self.loop != None:
+            self.loop.call_soon_threadsafe(_complete_future, future, value,
+                                           error)
+        
+        else:
+            _complete_future(future, value, error)
+        # end if
+    # end def
+    
+    def _run(self):
+        """
+        The I/O thread, performs the queued requests in order
+        """
+        with process_SCPI.aardvark() as AARD:
+            while True:
+                request = self.requests.get()
+                
+                if request == None:
+                    # the bus has been closed
+                    break
+                # end if
+                
+                (future, method, args) = request
+                
+                try:
+                    if AARD.port == None:
+                        # try to connect to an aardvark again
+                        AARD.port = AARD.configure_aardvark()
+                    # end if
+                    
+                    if AARD.port == None:
+                        # no aardvark was found
+                        self.message = AARD.message
+                        raise IOError('No Aardvark Connected')
+                    # end if
+                    
+                    value = getattr(AARD, method)(*args)
+                    
+                    self._resolve(future, value, None)
+                
+                except Exception, error:
+                    self._resolve(future, None, error)
+                # end try
+            # end while
+        # end with
+    # end def
+# end class
+
+#
+# ----------------
+# Private Functions
+
+def _complete_future(future, value, error):
+    """
+    Function to complete a future unless it has been cancelled
+    
+    @param[in]    future:          the future to complete
+    @param[in]    value:           the result of the request
+    @param[in]    error:           the error raised, None if there was none
+    """
+    if hasattr(future, 'cancelled') and future.cancelled():
+        return
+    # end if
+    
+    if error != None:
+        future.set_exception(error)
+    
+    else:
+        future.set_result(value)
+    # end if
+#end def
+
+def _test():
+    """
+    Test code for this module.
+    """
+    if asyncio != None:
+        # read through an event loop
+        loop = asyncio.new_event_loop()
+        
+        with SCPI_bus(loop) as bus:
+            print "SUP:TEL? 9,data"
+            print loop.run_until_complete(bus.query("SUP:TEL? 9,data",
+                                                    "0x54", 'uint'))
+        # end with
+        
+        loop.close()
+    
+    else:
+        # read through the I/O thread directly
+        with SCPI_bus() as bus:
+            print "SUP:TEL? 9,data"
+            print bus.query("SUP:TEL? 9,data", "0x54", 'uint').result()
+        # end with
+    # end if
+    
+    process_SCPI.close_session()
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
@@ -0,0 +1,571 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package process_capture
+Module to passively capture the I2C bus with a second aardvark in its bus
+monitor mode, and to decode the capture back into SCPI commands and
+responses so that the time spent transferring can be compared with the time
+the bus is idle.
+
+The capture log is binary, it starts with _Magic and then holds one record
+per transfer: the time (double), the 7 bit address (byte), the flags (byte,
+bit 0 set for a read and bit 1 set if the address was not acknowledged), the
+number of bytes (unsigned short) and then the bytes. The monitor does not
+time stamp the bus so each transfer is stamped with the time that it was
+collected from the aardvark, which is polled every few milliseconds.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import process_SCPI
+import threading
+import struct
+import time
+import sys
+
+#
+# ---------
+# Constants
+
+# identifies a capture log
+_Magic = 'SCPICAP1'
+
+# the header of each capture record
+_Record = struct.Struct('<dBBH')
+
+# record flags
+_Read_flag = 0x01
+_Nack_flag = 0x02
+
+# time to wait for the monitor to collect data (ms)
+_Poll_time = 5
+
+# number of monitor words to read at once
+_Read_words = 4096
+
+# idle time that is reported as a gap (ms)
+_Gap_threshold = 10.0
+
+# timer with the best resolution on this platform
+if sys.platform == 'win32':
+    _timer = time.clock
+else:
+    _timer = time.time
+# end if
+
+#
+# ---------
+# Classes
+
+class capture_record:
+    """
+    Class to hold one transfer seen on the bus
+    
+    @attribute time        (float)   The time the transfer was collected (s)
+    @attribute address     (int)     The 7 bit I2C address
+    @attribute read        (bool)    True for a read, False for a write
+    @attribute nack        (bool)    True if the address was not acknowledged
+    @attribute data        (string)  The bytes transferred
+    """
+    
+    def __init__(self, time, address, read, nack, data):
+        """
+        Initialise the record
+        """
+        self.time = time
+        
+        self.address = address
+        
+        self.read = read
+        
+        self.nack = nack
+        
+        self.data = data
+    # end def
+    
+    def duration(self, bitrate):
+        """
+        Estimate the time the transfer took on the bus, 9 bits per byte
+        including the address
+        
+        @param[in]    bitrate:         the I2C bitrate (kHz)
+        @return       (float)          The duration in seconds
+        """
+        return (len(self.data) + 1)*9.0/(bitrate*1000.0)
+    # end def
+# end class
+
+
+class bus_capture:
+    """
+    Class that captures the bus with an aardvark in its monitor mode. The
+    aardvark used must not be the one used by process_SCPI.
+    
+    @attribute file_name   (string)  The capture log being written
+    @attribute unique_id   (int)     The unique ID of the monitor aardvark
+    @attribute excluded    (list)    The unique IDs of the aardvarks that 
+                                     must not be used to monitor, eg. those 
+                                     bound to station slots
+    @attribute port        (handle)  The monitor aardvark, None if not open
+    @attribute message     (string)  Place to store error messages
+    @attribute running     (bool)    True while the capture is running
+    @attribute thread      (Thread)  The thread collecting the transfers
+    @attribute count       (int)     The number of transfers captured
+    """
+    
+    def __init__(self, file_name, unique_id = None, excluded = []):
+        """
+        Initialise the capture
+        
+        @param[in]    file_name:       the capture log to write (string)
+        @param[in]    unique_id:       the unique ID of the aardvark to
+                                       monitor with, None to use any free one
+                                       (int)
+        @param[in]    excluded:        the unique IDs of the aardvarks that 
+                                       must not be used when any free one is
+                                       used (list)
+        """
+        self.file_name = file_name
+        
+        self.unique_id = unique_id
+        
+        self.excluded = list(excluded)
+        
+        self.port = None
+        
+        self.message = ''
+        
+        self.running = False
+        
+        self.thread = None
+        
+        self.count = 0
+    # end def
+    
+    def __enter__(self):
+        """
+        Starts the capture
+        
+        For use with the 'with' operator
+        """
+        self.start()
+        return self
+    # end def
+    
+    def __exit__(self, type, value, traceback):
+        """
+        Stops the capture
+        
+        For use with the 'with' operator
+        """
+        self.stop()
+    # end def
+    
+    def start(self):
+        """
+        Open the monitor aardvark and start capturing
+        
+        @return       (bool)           True if the capture started
+        """
+        transport = process_SCPI.aardvark_py
+        
+        # open the log before taking an aardvark that would then need closing
+        try:
+            log_file = open(self.file_name, 'wb')
+        
+        except IOError, error:
+            self.message = '*** Cannot open ' + self.file_name + ': ' + \
+                           str(error) + ' ***'
+            return False
+        # end try
+        
+        # make sure the session has its aardvark before taking another one
+        with process_SCPI.aardvark():
+            if self.unique_id == None:
+                # any free aardvark that is not set aside for something else
+                devices = [device for device in process_SCPI.find_aardvarks()
+                           if device[2] and (device[1] not in self.excluded)]
+            
+            else:
+                devices = [device for device in process_SCPI.find_aardvarks()
+                           if device[2] and (device[1] == self.unique_id)]
+            # end if
+        # end with
+        
+        if len(devices) < 1:
+            self.message = '*** No Aardvark is free to monitor the bus ***'
+            log_file.close()
+            return False
+        # end if
+        
+        self.port = transport.aa_open(devices[0][0])
+        
+        if self.port <= 0:
+            self.message = '*** Aardvark could not be opened ***'
+            self.port = None
+            log_file.close()
+            return False
+        # end if
+        
+        if transport.aa_i2c_monitor_enable(self.port) < 0:
+            self.message = '*** Aardvark cannot monitor the bus ***'
+            transport.aa_close(self.port)
+            self.port = None
+            log_file.close()
+            return False
+        # end if
+        
+        self.running = True
+        
+        self.thread = threading.Thread(target = self._run,
+                                       args = (log_file,),
+                                       name = 'I2C capture')
+        self.thread.daemon = True
+        self.thread.start()
+        
+        return True
+    # end def
+    
+    def stop(self):
+        """
+        Stop capturing and close the monitor aardvark. The aardvark is closed
+        even if the capture has already stopped because it failed.
+        """
+        self.running = False
+        
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        # end if
+        
+        if self.port != None:
+            transport = process_SCPI.aardvark_py
+            transport.aa_i2c_monitor_disable(self.port)
+            transport.aa_close(self.port)
+            self.port = None
+        # end if
+    # end def
+    
+    def _run(self, log_file):
+        """
+        The capture thread, collects the monitor words and writes a record
+        for each transfer
+        
+        @param[in]    log_file:        the open capture log (file)
+        """
+        transport = process_SCPI.aardvark_py
+        
+        log_file.write(_Magic)
+        
+        # the transfer in progress, the time, address byte and data
+        transfer = None
+        
+        # keep reading until stopped and the monitor is empty
+        while True:
+            pending = transport.aa_async_poll(self.port, _Poll_time)
+            
+            if pending < 0:
+                # the monitor aardvark has failed so nothing more will arrive
+                self.message = '*** Aardvark error: ' + str(pending) + ' ***'
+                self.running = False
+                break
+            
+            elif not pending & transport.AA_ASYNC_I2C_MONITOR:
+                if not self.running:
+                    break
+                # end if
+                
+                continue
+            # end if
+            
+            (count, words) = transport.aa_i2c_monitor_read(self.port,
+                                                           _Read_words)
+            now = _timer()
+            
+            if count < 0:
+                self.message = '*** Aardvark error: ' + str(count) + ' ***'
+                self.running = False
+                break
+            # end if
+            
+            for word in words[:count]:
+                if word == transport.AA_I2C_MONITOR_CMD_START:
+                    # a start or repeated start ends any transfer in progress
+                    self._write(log_file, transfer)
+                    transfer = [now, None, []]
+                
+                elif word == transport.AA_I2C_MONITOR_CMD_STOP:
+                    self._write(log_file, transfer)
+                    transfer = None
+                
+                elif transfer != None:
+                    if transfer[1] == None:
+                        transfer[1] = word
+                    else:
+                        transfer[2].append(word &
+                                           transport.AA_I2C_MONITOR_DATA)
+                    # end if
+                # end if
+            # end for
+        # end while
+        
+        self._write(log_file, transfer)
+        log_file.close()
+    # end def
+    
+    def _write(self, log_file, transfer):
+        """
+        Write a record of a transfer to the log
+        
+        @param[in]    log_file:        the open capture log (file)
+        @param[in]    transfer:        the time, address word and data of the
+                                       transfer, None if there is not one
+                                       (list)
+        """
+        if (transfer == None) or (transfer[1] == None):
+            return
+        # end if
+        
+        (time_seen, address_word, data) = transfer
+        
+        flags = (address_word & 0x01)*_Read_flag
+        if address_word & process_SCPI.aardvark_py.AA_I2C_MONITOR_NACK:
+            flags |= _Nack_flag
+        # end if
+        
+        log_file.write(_Record.pack(time_seen, (address_word >> 1) & 0x7F,
+                                    flags, len(data)))
+        log_file.write(struct.pack(str(len(data)) + 'B', *data))
+        
+        self.count += 1
+    # end def
+# end class
+
+
+class capture_analysis:
+    """
+    Class that decodes a capture into SCPI transactions and measures the
+    time the bus spent transferring and idle.
+    
+    @attribute lines       (list)    A line of text describing each transfer
+    @attribute duration    (float)   The time from the first to the last
+                                     transfer (s)
+    @attribute busy_time   (float)   The estimated time spent transferring (s)
+    @attribute gaps        (list)    The (start time, length in s, command
+                                     before) of each idle gap
+    """
+    
+    def __init__(self, records, bitrate = 100, gap_threshold = _Gap_threshold):
+        """
+        Decode the records of a capture
+        
+        @param[in]    records:         the transfers (list of capture_record)
+        @param[in]    bitrate:         the I2C bitrate used (kHz)
+        @param[in]    gap_threshold:   the idle time to report as a gap (ms)
+        """
+        self.lines = []
+        
+        self.gaps = []
+        
+        self.busy_time = 0.0
+        
+        self.duration = 0.0
+        
+        if len(records) == 0:
+            return
+        # end if
+        
+        start = records[0].time
+        
+        # the last command written to each address
+        commands = {}
+        
+        previous_end = start
+        
+        for record in records:
+            # measure the idle time since the last transfer finished
+            idle = record.time - previous_end
+            if idle*1000.0 > gap_threshold:
+                self.gaps.append((previous_end - start, idle,
+                                  commands.get(record.address, '')))
+            # end if
+            
+            self.busy_time += record.duration(bitrate)
+            previous_end = max(previous_end, record.time) + \
+                record.duration(bitrate)
+            
+            self.lines.append('%10.4f 0x%02X %s' %
+                              (record.time - start, record.address,
+                               self._describe(record, commands)))
+        # end for
+        
+        self.duration = previous_end - start
+    # end def
+    
+    def _describe(self, record, commands):
+        """
+        Describe a transfer as SCPI
+        
+        @param[in]    record:          the transfer (capture_record)
+        @param[in]    commands:        the last command written to each
+                                       address, updated by writes (dict)
+        @return       (string)         The description
+        """
+        if record.nack:
+            return ('R' if record.read else 'W') + ' NACK'
+        # end if
+        
+        if not record.read:
+            # commands are text ending in a new line
+            command = record.data.split('\n', 1)[0]
+            commands[record.address] = command
+            return 'W ' + command
+        # end if
+        
+        command = commands.get(record.address, '?')
+        
+        if command.endswith(',ascii'):
+            # ascii responses have no preamble
+            return 'R ' + command + ' -> ' + record.data.split('\0', 1)[0]
+        # end if
+        
+        if (len(record.data) == 0) or (record.data[0] == '\0'):
+            return 'R ' + command + ' -> not ready'
+        # end if
+        
+        return 'R ' + command + ' -> ' + \
+            ' '.join(['%02X' % ord(byte) for byte in record.data[5:]])
+    # end def
+    
+    def report(self, gaps = 10):
+        """
+        Summarise the capture
+        
+        @param[in]    gaps:            the number of longest gaps to list (int)
+        @return       (string)         The summary
+        """
+        idle = self.duration - self.busy_time
+        
+        lines = ['Captured %d transfers over %.3f s' %
+                 (len(self.lines), self.duration),
+                 'Transferring %.3f s (%.1f%%), idle %.3f s (%.1f%%)' %
+                 (self.busy_time, 100.0*self.busy_time/max(self.duration, 1e-9),
+                  idle, 100.0*idle/max(self.duration, 1e-9)),
+                 'Longest idle gaps:']
+        
+        for (at, length, command) in sorted(self.gaps,
+                                            key = lambda gap: -gap[1])[:gaps]:
+            lines.append('  %8.1f ms at %10.4f s after %s' %
+                         (length*1000.0, at, command))
+        # end for
+        
+        return '\n'.join(lines)
+    # end def
+# end class
+
+#
+# ----------------
+# Public Functions
+
+def read_capture(file_name):
+    """
+    Read the records of a capture log
+    
+    @param[in]    file_name:       the capture log (string)
+    @return       (list)           The transfers (list of capture_record)
+    """
+    with open(file_name, 'rb') as log_file:
+        contents = log_file.read()
+    # end with
+    
+    if not contents.startswith(_Magic):
+        raise ValueError(file_name + ' is not a capture log')
+    # end if
+    
+    records = []
+    
+    offset = len(_Magic)
+    
+    while offset + _Record.size <= len(contents):
+        (time_seen, address, flags, length) = _Record.unpack_from(contents,
+                                                                  offset)
+        offset += _Record.size
+        
+        records.append(capture_record(time_seen, address,
+                                      bool(flags & _Read_flag),
+                                      bool(flags & _Nack_flag),
+                                      contents[offset:offset+length]))
+        offset += length
+    # end while
+    
+    return records
+# end def
+
+def decode_capture(file_name, bitrate = 100, gap_threshold = _Gap_threshold):
+    """
+    Decode a capture log
+    
+    @param[in]    file_name:       the capture log (string)
+    @param[in]    bitrate:         the I2C bitrate used (kHz)
+    @param[in]    gap_threshold:   the idle time to report as a gap (ms)
+    @return       (capture_analysis) The decoded capture
+    """
+    return capture_analysis(read_capture(file_name), bitrate, gap_threshold)
+# end def
+
+#
+# ----------------
+# Private Functions
+
+def _test():
+    """
+    Test code for this module.
+    """
+    import SCPI_simulator
+    
+    # the capture needs a second aardvark
+    SCPI_simulator.configure(adapters = 2)
+    process_SCPI.set_transport(SCPI_simulator)
+    
+    with bus_capture('capture.bin') as capture:
+        with process_SCPI.aardvark() as AARD:
+            AARD.read_SCPI("SUP:TEL? 9,data", "0x5C", 'uint')
+            AARD.send_SCPI("BM2:BQF READ_PAGE,0,1", "0x5C")
+            AARD.read_SCPI("BM2:TEL? 78,data", "0x5C", 33*['char'])
+        # end with
+    # end with
+    
+    process_SCPI.close_session()
+    
+    analysis = decode_capture('capture.bin')
+    print '\n'.join(analysis.lines)
+    print analysis.report()
+# end def
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) > 2) and (sys.argv[1] == 'decode'):
+        # decode a capture log given on the command line
+        analysis = decode_capture(sys.argv[2])
+        print '\n'.join(analysis.lines)
+        print analysis.report()
+    
+    else:
+        # if this code is not running as an imported module run test code
+        _test()
+    # end if
+# end if
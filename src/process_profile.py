@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package process_profile
+Module to measure how long a script takes to start. Once start_import_profile()
+is called every module that is imported is timed, so that the slow imports can
+be found and tracked as the scripts change. The time of a module includes the
+time of the modules it imports.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import __builtin__
+import time
+import sys
+
+#
+# ---------
+# Constants
+
+# timer with the best resolution on this platform
+if sys.platform == 'win32':
+    _timer = time.clock
+else:
+    _timer = time.time
+# end if
+
+# the import function to restore when profiling stops
+_Original_import = __builtin__.__import__
+
+# the time profiling started, None if it has not
+_Start = None
+
+# the time taken to import each module (s), in the order they were imported
+_Import_times = []
+
+# the depth of the import in progress
+_Depth = [0]
+
+#
+# ----------------
+# Public Functions
+
+def start_import_profile():
+    """
+    Start timing every module that is imported
+    """
+    global _Start
+    
+    _Start = _timer()
+    
+    __builtin__.__import__ = _timed_import
+# end def
+
+def stop_import_profile():
+    """
+    Stop timing the imports
+    """
+    __builtin__.__import__ = _Original_import
+# end def
+
+def startup_time():
+    """
+    Get the time since profiling started
+    
+    @return       (float)          The time since start_import_profile() (s),
+                                   None if profiling was not started
+    """
+    if _Start == None:
+        return None
+    # end if
+    
+    return _timer() - _Start
+# end def
+
+def import_report(limit = 15):
+    """
+    Make a table of the slowest imports
+    
+    @param[in]    limit:           the number of imports to list (int)
+    @return       (string)         The report
+    """
+    lines = ['%-32s %9s' % ('Module', 'Import ms')]
+    
+    slowest = sorted(_Import_times, key = lambda item: -item[1])[:limit]
+    
+    for (name, duration, depth) in slowest:
+        lines.append('%-32s %9.1f' % ((depth*' ' + name)[:32], 
+                                      duration*1000.0))
+    # end for
+    
+    if _Start != None:
+        lines.append('%-32s %9.1f' % ('Startup', startup_time()*1000.0))
+    # end if
+    
+    return '\n'.join(lines)
+# end def
+
+#
+# ----------------
+# Private Functions
+
+def _timed_import(name, *args, **kwargs):
+    """
+    Replacement for __import__ that times the first import of each module
+    
+    @param[in]    name:            the module to import (string)
+    @return       (module)         The imported module
+    """
+    if name in sys.modules:
+        # already imported so there is nothing to time
+        return _Original_import(name, *args, **kwargs)
+    # end if
+    
+    start = _timer()
+    _Depth[0] += 1
+    
+    try:
+        return _Original_import(name, *args, **kwargs)
+    
+    finally:
+        _Depth[0] -= 1
+        _Import_times.append((name, _timer() - start, _Depth[0]))
+    # end try
+# end def
+
+def _test():
+    """
+    Test code for this module.
+    """
+    start_import_profile()
+    
+    import process_SCPI
+    import process_GUI
+    
+    stop_import_profile()
+    
+    print import_report()
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package process_recorder
+Module to record telemetry continuously in the background, eg. to watch the 
+voltage, current and temperatures of a unit while it soaks. A set of items 
+from a telemetry_map is sampled at a target rate into a fixed size ring 
+buffer, from which the GUI can take the latest values without waiting for 
+the bus, and is streamed to a log by a second thread.
+
+The log is binary, it starts with _Magic, the number of items (unsigned 
+short) and the name of each item (length byte then the name), and then holds
+one record per sample: the time (double) and the value of each item (double,
+NaN if the item could not be read). If the log cannot keep up the sampling 
+waits for it rather than letting the samples pile up in memory.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import process_SCPI
+import threading
+import Queue
+import struct
+import time
+
+#
+# ---------
+# Constants
+
+# identifies a telemetry log
+_Magic = 'SCPITEL1'
+
+# number of samples kept in the ring buffer
+_Ring_size = 1000
+
+# number of samples waiting to be logged before sampling waits for the log
+_Queue_size = 256
+
+# time to wait for space in the log queue before checking for a stop (s)
+_Queue_wait = 0.1
+
+# the value logged for an item that could not be read
+_Missing = float('nan')
+
+#
+# ---------
+# Classes
+
+class telemetry_recorder:
+    """
+    Class that samples telemetry in a background thread
+    
+    @attribute telemetry   (telemetry_map class) The map of the module
+    @attribute address     (string)  The address of the module
+    @attribute names       (list)    The names of the items to sample
+    @attribute rate        (float)   The requested samples per second
+    @attribute file_name   (string)  The log to write, None to not log
+    @attribute message     (string)  Place to store error messages, set while
+                                     sampling is paused as there is no 
+                                     aardvark
+    @attribute running     (bool)    True while the recorder is running
+    @attribute ring        (list)    The most recent (time, values) samples
+    @attribute count       (int)     The number of samples taken
+    @attribute overruns    (int)     The number of samples that were late 
+                                     because a sample took too long
+    @attribute stalls      (int)     The number of times sampling waited for
+                                     the log
+    @attribute start_time  (float)   The time the recorder started
+    @attribute lock        (Lock)    Protects the ring buffer
+    @attribute queue       (Queue)   The samples waiting to be logged
+    @attribute threads     (list)    The sampling and logging threads
+    """
+    
+    def __init__(self, telemetry, address, names, rate, file_name = None, 
+                 size = _Ring_size):
+        """
+        Initialise the recorder
+        
+        @param[in]    telemetry:       the map of the module 
+                                       (telemetry_map class)
+        @param[in]    address:         the address of the module (string)
+        @param[in]    names:           the names of the items to sample, each
+                                       must be a single number (list)
+        @param[in]    rate:            the samples per second (float)
+        @param[in]    file_name:       the log to write, None to not log 
+                                       (string)
+        @param[in]    size:            the number of samples to keep (int)
+        """
+        for name in names:
+            if name not in telemetry.items:
+                raise ValueError(name + ' is not a telemetry item')
+            
+            elif type(telemetry.items[name].format) == list:
+                raise ValueError(name + ' is not a single value')
+            
+            elif not process_SCPI.is_numeric(telemetry.items[name].format):
+                raise ValueError(name + ' is not a number')
+            # end if
+        # end for
+        
+        self.telemetry = telemetry
+        
+        self.address = address
+        
+        self.names = list(names)
+        
+        self.rate = float(rate)
+        
+        self.file_name = file_name
+        
+        self.message = ''
+        
+        self.running = False
+        
+        self.ring = size*[None]
+        
+        self.count = 0
+        
+        self.overruns = 0
+        
+        self.stalls = 0
+        
+        self.start_time = None
+        
+        self.lock = threading.Lock()
+        
+        self.queue = Queue.Queue(_Queue_size)
+        
+        self.threads = []
+    # end def
+    
+    def __enter__(self):
+        """
+        Starts the recorder
+        
+        For use with the 'with' operator
+        """
+        self.start()
+        return self
+    # end def
+    
+    def __exit__(self, type, value, traceback):
+        """
+        Stops the recorder
+        
+        For use with the 'with' operator
+        """
+        self.stop()
+    # end def
+    
+    def start(self):
+        """
+        Start sampling, and logging if there is a log
+        
+        @return       (bool)           True if the recorder started
+        """
+        if self.file_name != None:
+            try:
+                log_file = open(self.file_name, 'wb')
+            
+            except IOError, error:
+                self.message = '*** Cannot open ' + self.file_name + ': ' + \
+                               str(error) + ' ***'
+                return False
+            # end try
+            
+            self.threads.append(threading.Thread(target = self._log, 
+                                                 args = (log_file,),
+                                                 name = 'Telemetry log'))
+        # end if
+        
+        self.threads.append(threading.Thread(target = self._sample, 
+                                             name = 'Telemetry recorder'))
+        
+        self.running = True
+        self.start_time = time.time()
+        
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        # end for
+        
+        return True
+    # end def
+    
+    def stop(self):
+        """
+        Stop sampling and finish writing the log
+        """
+        self.running = False
+        
+        for thread in self.threads:
+            thread.join()
+        # end for
+        
+        self.threads = []
+    # end def
+    
+    def latest(self):
+        """
+        Get the most recent sample without waiting for the bus, so that it 
+        can be called from the GUI
+        
+        @return       (float, dict)    The time of the sample and the value 
+                                       of each item, None if there are no 
+                                       samples yet
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            # end if
+            
+            (sample_time, values) = self.ring[(self.count - 1) % 
+                                              len(self.ring)]
+        # end with
+        
+        return (sample_time, dict(zip(self.names, values)))
+    # end def
+    
+    def samples(self):
+        """
+        Get the samples held in the ring buffer
+        
+        @return       (list)           The (time, values) of each sample, 
+                                       oldest first
+        """
+        with self.lock:
+            if self.count < len(self.ring):
+                return self.ring[:self.count]
+            # end if
+            
+            index = self.count % len(self.ring)
+            
+            return self.ring[index:] + self.ring[:index]
+        # end with
+    # end def
+    
+    def achieved_rate(self):
+        """
+        Get the samples per second actually taken
+        
+        @return       (float)          The achieved rate, 0 if the recorder 
+                                       has not started
+        """
+        if (self.start_time == None) or (self.count == 0):
+            return 0.0
+        # end if
+        
+        elapsed = self.latest()[0] - self.start_time
+        
+        if elapsed <= 0:
+            return 0.0
+        # end if
+        
+        # the first sample is taken at the start
+        return (self.count - 1)/elapsed
+    # end def
+    
+    def report(self):
+        """
+        Summarise the recording
+        
+        @return       (string)         The summary
+        """
+        report = '%d samples of %s\nRequested %.2f/s, achieved %.2f/s, ' \
+                 '%d late, %d waits for the log' % \
+                 (self.count, ', '.join(self.names), self.rate, 
+                  self.achieved_rate(), self.overruns, self.stalls)
+        
+        if self.message != '':
+            report += '\n' + self.message
+        # end if
+        
+        return report
+    # end def
+    
+    def _sample(self):
+        """
+        The sampling thread, reads the items at the requested rate
+        """
+        period = 1.0/self.rate
+        
+        next_time = time.time()
+        
+        while self.running:
+            # only hold the bus for the batch so the steps can use it between
+            # samples
+            with process_SCPI.aardvark() as AARD:
+                if AARD.port != None:
+                    self.message = ''
+                    values = self.telemetry(AARD, self.address).read_many(
+                        self.names)
+                    
+                else:
+                    # no aardvark was found, pause until there is one rather
+                    # than reading without it and marking the module dead
+                    self.message = '*** No Aardvark Connected, ' \
+                                   'recording paused ***'
+                    values = None
+                # end if
+            # end with
+            
+            if values != None:
+                sample = (time.time(), tuple([values[name] 
+                                              for name in self.names]))
+                
+                with self.lock:
+                    self.ring[self.count % len(self.ring)] = sample
+                    self.count += 1
+                # end with
+                
+                if self.file_name != None:
+                    self._queue(sample)
+                # end if
+            # end if
+            
+            next_time += period
+            
+            delay = next_time - time.time()
+            
+            if delay > 0:
+                time.sleep(delay)
+            
+            elif delay < -period:
+                # a whole sample was missed so start again from now rather 
+                # than sampling as fast as possible to catch up
+                self.overruns += 1
+                next_time = time.time()
+            # end if
+        # end while
+        
+        if self.file_name != None:
+            # tell the log that there are no more samples
+            self.queue.put(None)
+        # end if
+    # end def
+    
+    def _queue(self, sample):
+        """
+        Pass a sample to the log, waiting while the log is behind
+        
+        @param[in]    sample:          the (time, values) sample (tuple)
+        """
+        while True:
+            try:
+                self.queue.put(sample, True, _Queue_wait)
+                return
+            
+            except Queue.Full:
+                self.stalls += 1
+                
+                if not self.running:
+                    # stopping so do not wait any longer
+                    return
+                # end if
+            # end try
+        # end while
+    # end def
+    
+    def _log(self, log_file):
+        """
+        The logging thread, writes the samples to the log
+        
+        @param[in]    log_file:        the open log (file)
+        """
+        record = struct.Struct('<d' + len(self.names)*'d')
+        
+        log_file.write(_Magic)
+        log_file.write(struct.pack('<H', len(self.names)))
+        
+        for name in self.names:
+            log_file.write(struct.pack('B', len(name)) + name)
+        # end for
+        
+        while True:
+            sample = self.queue.get()
+            
+            if sample == None:
+                break
+            # end if
+            
+            (sample_time, values) = sample
+            
+            log_file.write(record.pack(sample_time, 
+                                       *[_Missing if value == None else value 
+                                         for value in values]))
+            
+            if self.queue.empty():
+                # write out everything so far while there is nothing to do
+                log_file.flush()
+            # end if
+        # end while
+        
+        log_file.close()
+    # end def
+# end class
+
+#
+# ----------------
+# Public Functions
+
+def read_log(file_name):
+    """
+    Read a telemetry log
+    
+    @param[in]    file_name:       the log to read (string)
+    @return       (list, list)     The names of the items and the (time, 
+                                   values) of each sample, None for a value
+                                   that could not be read
+    """
+    with open(file_name, 'rb') as log_file:
+        contents = log_file.read()
+    # end with
+    
+    if not contents.startswith(_Magic):
+        raise ValueError(file_name + ' is not a telemetry log')
+    # end if
+    
+    offset = len(_Magic)
+    
+    (count,) = struct.unpack_from('<H', contents, offset)
+    offset += 2
+    
+    names = []
+    
+    for i in range(count):
+        length = ord(contents[offset])
+        names.append(contents[offset + 1:offset + 1 + length])
+        offset += length + 1
+    # end for
+    
+    record = struct.Struct('<d' + count*'d')
+    
+    samples = []
+    
+    # ignore a record that was only partly written
+    while offset + record.size <= len(contents):
+        values = record.unpack_from(contents, offset)
+        offset += record.size
+        
+        samples.append((values[0], tuple([None if value != value else value 
+                                          for value in values[1:]])))
+    # end while
+    
+    return (names, samples)
+# end def
+
+#
+# ----------------
+# Private Functions
+
+def _test():
+    """
+    Test code for this module.
+    """
+    import telemetry_map
+    
+    recorder = telemetry_recorder(telemetry_map.bm2_telemetry, "0x5C", 
+                                  ['voltage', 'discharge_current', 
+                                   'temperature'], 
+                                  5.0, 'telemetry_test.tel')
+    
+    with recorder:
+        time.sleep(3)
+        print recorder.latest()
+    # end with
+    
+    print recorder.report()
+    
+    (names, samples) = read_log('telemetry_test.tel')
+    print names, len(samples), 'samples logged'
+    
+    process_SCPI.close_session()
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
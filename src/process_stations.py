@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package process_stations
+Module to run a process on several modules at once from one computer. Each
+aardvark that is connected is bound to a station slot, and each slot runs the
+process in its own worker process bound to its aardvark.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import process_SCPI
+import subprocess
+import sys
+import csv
+import os
+
+#
+# -------
+# Constants
+
+# file that records which aardvark is used for each slot
+_Slot_file = 'station_slots.csv'
+
+# folder for the log and result of each slot
+_Log_folder = 'logs'
+
+# the first line of a result file when the process passed
+_Pass = 'PASS'
+
+#
+# ---------
+# Classes
+
+class station:
+    """
+    Class to hold a station slot and the worker running in it
+    
+    @attribute slot        (int)     The number of the slot
+    @attribute unique_id   (int)     The unique ID of the slot's aardvark
+    @attribute log_name    (string)  The file the worker's output is logged to
+    @attribute result_name (string)  The file the worker writes its process
+                                     result to
+    @attribute worker      (Popen)   The worker process, None if not started
+    @attribute exit_code   (int)     The exit code of the worker, None if it
+                                     is still running
+    @attribute passed      (bool)    True if the process passed in this slot,
+                                     None if the worker is still running
+    @attribute result      (string)  The process result the worker wrote,
+                                     None if it is still running
+    """
+    
+    def __init__(self, slot, unique_id):
+        """
+        Initialise the station
+        
+        @param[in]    slot:            the number of the slot (int)
+        @param[in]    unique_id:       the unique ID of its aardvark (int)
+        """
+        self.slot = slot
+        
+        self.unique_id = unique_id
+        
+        self.log_name = os.path.join(_Log_folder, 'slot_' + str(slot) + '.log')
+        
+        self.result_name = os.path.join(_Log_folder, 
+                                        'slot_' + str(slot) + '.result')
+        
+        self.worker = None
+        
+        self.exit_code = None
+        
+        self.passed = None
+        
+        self.result = None
+    # end def
+    
+    def start(self, script, arguments = [], file_options = []):
+        """
+        Start a worker process to run the script bound to this slot's aardvark
+        
+        @param[in]    script:          the script to run (string)
+        @param[in]    arguments:       the other arguments to give the 
+                                       script (list)
+        @param[in]    file_options:    the options in arguments that name a 
+                                       file each slot needs its own copy 
+                                       of (list)
+        """
+        if not os.path.isdir(_Log_folder):
+            os.makedirs(_Log_folder)
+        # end if
+        
+        if os.path.isfile(self.result_name):
+            # do not mistake the last run's result for this one
+            os.remove(self.result_name)
+        # end if
+        
+        log_file = open(self.log_name, 'w')
+        
+        self.worker = subprocess.Popen([sys.executable, script] + 
+                                       slot_arguments(arguments, self.slot, 
+                                                      file_options) + 
+                                       ['--slot', str(self.slot),
+                                        '--aardvark', str(self.unique_id),
+                                        '--result', self.result_name],
+                                       stdout = log_file,
+                                       stderr = subprocess.STDOUT)
+        
+        # the worker has its own copy of the file
+        log_file.close()
+    # end def
+    
+    def wait(self):
+        """
+        Wait for the worker to finish and read the result of its process
+        
+        @return       (bool)           True if the process passed
+        """
+        if self.worker != None:
+            self.exit_code = self.worker.wait()
+            
+            self.result = read_result(self.result_name)
+            
+            if self.result == None:
+                # the worker stopped before the process could finish
+                self.result = 'FAIL: no result, exit code ' + \
+                              str(self.exit_code)
+            # end if
+            
+            self.passed = (self.result == _Pass)
+        # end if
+        
+        return self.passed
+    # end def
+# end class
+
+#
+# ----------------
+# Public Functions
+
+def slot_arguments(arguments, slot, file_options):
+    """
+    Give each file named in the arguments a name of its own for a slot, so
+    the workers do not write over each other's files
+    
+    @param[in]    arguments:       the arguments to give a worker (list)
+    @param[in]    slot:            the number of the slot (int)
+    @param[in]    file_options:    the options that name a file (list)
+    @return       (list)           The arguments for the worker in the slot
+    """
+    slot_args = []
+    
+    rename = False
+    
+    for argument in arguments:
+        (option, equals, value) = argument.partition('=')
+        
+        if rename:
+            # the file named after the option
+            argument = slot_file_name(argument, slot)
+            
+        elif equals and (option in file_options):
+            # the file is given with the option
+            argument = option + '=' + slot_file_name(value, slot)
+        # end if
+        
+        rename = (argument in file_options)
+        
+        slot_args.append(argument)
+    # end for
+    
+    return slot_args
+# end def
+
+def slot_file_name(file_name, slot):
+    """
+    Add the slot number to a file name, before its extension
+    
+    @param[in]    file_name:       the file name to add the slot to (string)
+    @param[in]    slot:            the number of the slot (int)
+    @return       (string)         The file name for the slot
+    """
+    (root, extension) = os.path.splitext(file_name)
+    
+    return root + '_slot' + str(slot) + extension
+# end def
+
+def write_result(failures, file_name):
+    """
+    Store the result of a process for the station that started it
+    
+    @param[in]    failures:        why the process failed, empty if it 
+                                   passed (list)
+    @param[in]    file_name:       the file to store the result in (string)
+    """
+    with open(file_name, 'w') as result_file:
+        if failures:
+            result_file.write('FAIL: ' + '; '.join(failures) + '\n')
+            
+        else:
+            result_file.write(_Pass + '\n')
+        # end if
+    # end with
+# end def
+
+def read_result(file_name):
+    """
+    Read the result of a process written by write_result
+    
+    @param[in]    file_name:       the file the result is stored in (string)
+    @return       (string)         The result, None if there is not one
+    """
+    if not os.path.isfile(file_name):
+        return None
+    # end if
+    
+    with open(file_name, 'r') as result_file:
+        result = result_file.readline().strip()
+    # end with
+    
+    return result if result else None
+# end def
+
+def read_slots(file_name = _Slot_file):
+    """
+    Read the aardvark bound to each slot
+    
+    @param[in]    file_name:       the file the slots are stored in (string)
+    @return       (dict)           The unique ID of the aardvark for each slot
+    """
+    slots = {}
+    
+    if os.path.isfile(file_name):
+        with open(file_name, 'rb') as slot_file:
+            for row in csv.reader(slot_file):
+                if (len(row) < 2) or row[0].startswith('#'):
+                    # skip comments and blank lines
+                    continue
+                # end if
+                
+                slots[int(row[0])] = int(row[1])
+            # end for
+        # end with
+    # end if
+    
+    return slots
+# end def
+
+def write_slots(slots, file_name = _Slot_file):
+    """
+    Store the aardvark bound to each slot
+    
+    @param[in]    slots:           the unique ID for each slot (dict)
+    @param[in]    file_name:       the file to store the slots in (string)
+    """
+    with open(file_name, 'wb') as slot_file:
+        writer = csv.writer(slot_file)
+        writer.writerow(['# Slot', 'Aardvark unique ID'])
+        
+        for slot in sorted(slots.keys()):
+            writer.writerow([slot, slots[slot]])
+        # end for
+    # end with
+# end def
+
+def assign_slots(file_name = _Slot_file):
+    """
+    Bind each connected aardvark to a slot. An aardvark keeps the slot it was
+    given before, and a new aardvark is given the next unused slot.
+    
+    @param[in]    file_name:       the file the slots are stored in (string)
+    @return       (list)           The stations that have a free aardvark
+    """
+    slots = read_slots(file_name)
+    
+    stations = []
+    
+    for (port, unique_id, free) in process_SCPI.find_aardvarks():
+        if unique_id not in slots.values():
+            # a new aardvark so give it the next slot
+            slots[max(slots.keys() + [0]) + 1] = unique_id
+        # end if
+        
+        if free:
+            slot = [key for key in slots if slots[key] == unique_id][0]
+            stations.append(station(slot, unique_id))
+        # end if
+    # end for
+    
+    write_slots(slots, file_name)
+    
+    stations.sort(key = lambda item: item.slot)
+    
+    return stations
+# end def
+
+def run_stations(script, arguments = [], file_options = []):
+    """
+    Run the script on every connected aardvark at once and wait for them all
+    to finish.
+    
+    @param[in]    script:          the script to run (string)
+    @param[in]    arguments:       the other arguments to give the 
+                                   script (list)
+    @param[in]    file_options:    the options in arguments that name a 
+                                   file each slot needs its own copy 
+                                   of (list)
+    @return       (dict)           True for each slot whose process passed
+    """
+    stations = assign_slots()
+    
+    for each_station in stations:
+        print 'Slot', each_station.slot, 'using aardvark', \
+              each_station.unique_id, 'logging to', each_station.log_name
+        each_station.start(script, arguments, file_options)
+    # end for
+    
+    results = {}
+    
+    for each_station in stations:
+        results[each_station.slot] = each_station.wait()
+        print 'Slot', each_station.slot, 'finished with', \
+              each_station.result
+    # end for
+    
+    return results
+# end def
+
+#
+# ----------------
+# Private Functions
+
+def _test():
+    """
+    Test code for this module.
+    """
+    # list the stations without starting them
+    for each_station in assign_slots():
+        print each_station.slot, each_station.unique_id, each_station.log_name
+    # end for
+    
+    # each slot writes to its own copy of a file
+    print slot_arguments(['--stats', 'stats.csv', '--record=rec.csv', '-v'],
+                         1, ['--stats', '--record'])
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package process_stats
+Module to record where the time goes on the I2C bus. When enabled through
+process_SCPI.enable_stats() every SCPI transaction is timed and the time is
+split into the time spent in aardvark transfers and the time spent sleeping.
+The results are grouped by command prefix, eg. 'BM2:BQF READ_PAGE' or
+'SUP:TEL? 9', with a histogram of the wall time of each group.
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import threading
+import time
+import sys
+import csv
+
+#
+# ---------
+# Constants
+
+# timer with the best resolution on this platform
+if sys.platform == 'win32':
+    _timer = time.clock
+else:
+    _timer = time.time
+# end if
+
+# upper limits of the wall time histogram buckets (ms), the last bucket holds
+# everything longer
+_Buckets = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048]
+
+# the aardvark functions that move data over the bus
+_Transfers = ['aa_i2c_write', 'aa_i2c_read', 'aa_i2c_write_ext', 
+              'aa_i2c_read_ext', 'aa_i2c_write_read']
+
+#
+# ---------
+# Classes
+
+class command_stats:
+    """
+    Class to hold the totals of every transaction with one command prefix
+    
+    @attribute count       (int)     The number of transactions
+    @attribute failures    (int)     The number of transactions that failed
+    @attribute retries     (int)     The number of extra attempts made
+    @attribute written     (int)     The number of bytes written
+    @attribute read        (int)     The number of bytes read
+    @attribute wall_time   (float)   The total time of the transactions (s)
+    @attribute bus_time    (float)   The time spent in aardvark transfers (s)
+    @attribute sleep_time  (float)   The time spent sleeping (s)
+    @attribute histogram   (list)    The number of transactions whose wall
+                                     time fell in each of the _Buckets
+    """
+    
+    def __init__(self):
+        """
+        Initialise the empty totals
+        """
+        self.count = 0
+        
+        self.failures = 0
+        
+        self.retries = 0
+        
+        self.written = 0
+        
+        self.read = 0
+        
+        self.wall_time = 0.0
+        
+        self.bus_time = 0.0
+        
+        self.sleep_time = 0.0
+        
+        self.histogram = (len(_Buckets) + 1)*[0]
+    # end def
+    
+    def add(self, record):
+        """
+        Add a completed transaction to the totals
+        
+        @param[in]    record:          the transaction (transaction_record)
+        """
+        self.count += 1
+        self.failures += int(not record.success)
+        self.retries += record.retries
+        self.written += record.written
+        self.read += record.read
+        self.wall_time += record.wall_time
+        self.bus_time += record.bus_time
+        self.sleep_time += record.sleep_time
+        
+        # find the bucket for this transaction
+        bucket = 0
+        while (bucket < len(_Buckets)) and \
+              (record.wall_time*1000.0 > _Buckets[bucket]):
+            bucket += 1
+        # end while
+        
+        self.histogram[bucket] += 1
+    # end def
+# end class
+
+
+class transaction_record:
+    """
+    Class to hold the measurements of the transaction in progress
+    
+    @attribute prefix      (string)  The command prefix of the transaction
+    @attribute start       (float)   The time the transaction started
+    @attribute success     (bool)    False if the transaction failed
+    @attribute retries     (int)     The number of extra attempts made
+    @attribute written     (int)     The number of bytes written
+    @attribute read        (int)     The number of bytes read
+    @attribute wall_time   (float)   The total time of the transaction (s)
+    @attribute bus_time    (float)   The time spent in aardvark transfers (s)
+    @attribute sleep_time  (float)   The time spent sleeping (s)
+    """
+    
+    def __init__(self, prefix, start = None):
+        """
+        Start timing a transaction
+        
+        @param[in]    prefix:          the command prefix (string)
+        @param[in]    start:           the time the transaction started, None
+                                       for now (float)
+        """
+        self.prefix = prefix
+        
+        self.start = _timer() if start == None else start
+        
+        self.success = True
+        
+        self.retries = 0
+        
+        self.written = 0
+        
+        self.read = 0
+        
+        self.wall_time = 0.0
+        
+        self.bus_time = 0.0
+        
+        self.sleep_time = 0.0
+    # end def
+# end class
+
+
+class stats_recorder:
+    """
+    Class that collects the transaction measurements. A transaction is the
+    work done by one send_SCPI or read_SCPI, the aardvark calls made while it
+    is in progress on the same thread are counted against it.
+    
+    @attribute commands    (dict)    The command_stats of each command prefix
+    @attribute local       (local)   The transaction in progress on each thread
+    @attribute lock        (Lock)    Protects the totals
+    """
+    
+    def __init__(self):
+        """
+        Initialise the recorder with no transactions
+        """
+        self.commands = {}
+        
+        self.local = threading.local()
+        
+        self.lock = threading.Lock()
+    # end def
+    
+    def begin(self, prefix, start = None):
+        """
+        Start a transaction
+        
+        @param[in]    prefix:          the command prefix (string)
+        @param[in]    start:           the time the transaction started, None
+                                       for now (float)
+        """
+        self.local.record = transaction_record(prefix, start)
+    # end def
+    
+    def end(self, success):
+        """
+        Finish the transaction in progress and add it to the totals
+        
+        @param[in]    success:         False if the transaction failed (bool)
+        """
+        record = getattr(self.local, 'record', None)
+        
+        if record == None:
+            return
+        # end if
+        
+        self.local.record = None
+        
+        record.success = success
+        record.wall_time = _timer() - record.start
+        
+        with self.lock:
+            if record.prefix not in self.commands:
+                self.commands[record.prefix] = command_stats()
+            # end if
+            
+            self.commands[record.prefix].add(record)
+        # end with
+    # end def
+    
+    def current(self):
+        """
+        Get the transaction in progress on this thread
+        
+        @return       (transaction_record) The transaction, None if there is
+                                       not one
+        """
+        return getattr(self.local, 'record', None)
+    # end def
+    
+    def retry(self):
+        """
+        Count an extra attempt in the transaction in progress
+        """
+        record = self.current()
+        
+        if record != None:
+            record.retries += 1
+        # end if
+    # end def
+    
+    def summary(self):
+        """
+        Make a table of the totals of each command prefix, slowest first
+        
+        @return       (string)         The summary
+        """
+        lines = ['%-24s %6s %5s %5s %9s %9s %9s %9s %8s' %
+                 ('Command', 'Count', 'Fail', 'Retry', 'Wall ms', 'Bus ms',
+                  'Sleep ms', 'Mean ms', 'Bytes')]
+        
+        with self.lock:
+            prefixes = sorted(self.commands.keys(),
+                              key = lambda p: -self.commands[p].wall_time)
+            
+            for prefix in prefixes:
+                stats = self.commands[prefix]
+                lines.append('%-24s %6d %5d %5d %9.1f %9.1f %9.1f %9.2f %8d' %
+                             (prefix[:24], stats.count, stats.failures,
+                              stats.retries, stats.wall_time*1000.0,
+                              stats.bus_time*1000.0, stats.sleep_time*1000.0,
+                              stats.wall_time*1000.0/stats.count,
+                              stats.written + stats.read))
+            # end for
+        # end with
+        
+        return '\n'.join(lines)
+    # end def
+    
+    def export(self, file_name):
+        """
+        Write the totals and histogram of each command prefix to a csv file
+        
+        @param[in]    file_name:       the file to write (string)
+        """
+        with open(file_name, 'wb') as stats_file:
+            writer = csv.writer(stats_file)
+            
+            writer.writerow(['# Published through process_stats.py'])
+            writer.writerow(['Command', 'Count', 'Failures', 'Retries',
+                             'Bytes written', 'Bytes read', 'Wall ms',
+                             'Bus ms', 'Sleep ms'] +
+                            ['<=' + str(limit) + ' ms' for limit in _Buckets] +
+                            ['>' + str(_Buckets[-1]) + ' ms'])
+            
+            with self.lock:
+                for prefix in sorted(self.commands.keys()):
+                    stats = self.commands[prefix]
+                    writer.writerow([prefix, stats.count, stats.failures,
+                                     stats.retries, stats.written, stats.read,
+                                     '%.3f' % (stats.wall_time*1000.0),
+                                     '%.3f' % (stats.bus_time*1000.0),
+                                     '%.3f' % (stats.sleep_time*1000.0)] +
+                                    stats.histogram)
+                # end for
+            # end with
+        # end with
+    # end def
+# end class
+
+
+class instrumented_transport:
+    """
+    Class that wraps an aardvark_py like module to time its transfers and
+    sleeps. Everything else is passed straight through to the module.
+    
+    @attribute transport   (module)          The wrapped module
+    @attribute recorder    (stats_recorder)  Where the times are recorded
+    """
+    
+    def __init__(self, transport, recorder):
+        """
+        Wrap the transport
+        
+        @param[in]    transport:       the module to wrap
+        @param[in]    recorder:        where to record the times
+                                       (stats_recorder)
+        """
+        self.transport = transport
+        
+        self.recorder = recorder
+    # end def
+    
+    def __getattr__(self, name):
+        """
+        Look up an attribute of the wrapped module, wrapping the transfer
+        functions so that they are timed.
+        
+        @param[in]    name:            the attribute (string)
+        @return       (variable)       The attribute
+        """
+        attribute = getattr(self.transport, name)
+        
+        if name in _Transfers:
+            return _timed_transfer(self.recorder, name, attribute)
+        # end if
+        
+        return attribute
+    # end def
+    
+    def aa_sleep_ms(self, milliseconds):
+        """
+        Sleep and count the time against the transaction in progress
+        
+        @param[in]    milliseconds:    the time to sleep (int)
+        @return       (int)            The result of the wrapped function
+        """
+        start = _timer()
+        
+        result = self.transport.aa_sleep_ms(milliseconds)
+        
+        record = self.recorder.current()
+        if record != None:
+            record.sleep_time += _timer() - start
+        # end if
+        
+        return result
+    # end def
+# end class
+
+#
+# ----------------
+# Private Functions
+
+def _timed_transfer(recorder, name, function):
+    """
+    Function to make a timed version of an aardvark transfer function
+    
+    @param[in]    recorder:        where to record the times (stats_recorder)
+    @param[in]    name:            the name of the function (string)
+    @param[in]    function:        the function to time
+    @return       (function)       The timed function
+    """
+    def timed(*args):
+        start = _timer()
+        
+        result = function(*args)
+        
+        record = recorder.current()
+        if record != None:
+            record.bus_time += _timer() - start
+            
+            # count the bytes that were moved
+            if name == 'aa_i2c_write':
+                record.written += max(result, 0)
+            
+            elif name == 'aa_i2c_read':
+                record.read += max(result[0], 0)
+            
+            elif name == 'aa_i2c_write_ext':
+                record.written += result[1]
+            
+            elif name == 'aa_i2c_read_ext':
+                record.read += result[2]
+            
+            else:
+                record.written += result[1]
+                record.read += result[3]
+            # end if
+        # end if
+        
+        return result
+    # end def
+    
+    return timed
+# end def
+
+def _test():
+    """
+    Test code for this module.
+    """
+    import process_SCPI
+    import SCPI_simulator
+    
+    process_SCPI.set_transport(SCPI_simulator)
+    process_SCPI.enable_stats()
+    
+    with process_SCPI.aardvark() as AARD:
+        for i in range(5):
+            AARD.read_SCPI("SUP:TEL? 9,data", "0x5C", 'uint')
+            AARD.send_SCPI("BM2:BQF READ_PAGE,0,1", "0x5C")
+            AARD.read_SCPI("BM2:TEL? 78,data", "0x5C", 33*['char'])
+        # end for
+    # end with
+    
+    process_SCPI.close_session()
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+################################################################################
+#(C) Copyright Pumpkin, Inc. All Rights Reserved.
+#
+#This file may be distributed under the terms of the License
+#Agreement provided with this software.
+#
+#THIS FILE IS PROVIDED AS IS WITH NO WARRANTY OF ANY KIND,
+#INCLUDING THE WARRANTY OF DESIGN, MERCHANTABILITY AND
+#FITNESS FOR A PARTICULAR PURPOSE.
+################################################################################
+"""
+@package telemetry_map
+Module that declares the telemetry of the SupMCU and BM2 modules in one place.
+Each item has a name, the command that reads it, its format on the wire, the
+scale applied to the raw value and its units. A map of the items is read 
+through an aardvark with an accessor for each item, eg.
+    
+    bm2 = telemetry_map.bm2_telemetry(AARD, "0x5C")
+    voltage = bm2.voltage()
+    values = bm2.read_many(['voltage', 'temperature'])
+"""
+
+__author__ = 'David Wright (david@asteriaec.com)'
+__version__ = '0.1.0' #Versioning: http://www.python.org/dev/peps/pep-0386/
+
+#
+# -------
+# Imports
+
+import process_SCPI
+
+#
+# ---------
+# Constants
+
+# the telemetry of every SupMCU module, the name, command, format, scale, units
+# and description of each item
+_SUP_items = [
+    ('firmware_version', 'SUP:TEL? 0,data', 'name', None, '',
+     'The firmware version of the module'),
+    ('serial_number', 'SUP:TEL? 9,data', 'uint', None, '',
+     'The serial number of the module'),
+    ('tuning', 'SUP:TEL? 11,data', 'schar', None, '',
+     'The oscillator tuning parameter')]
+
+# the telemetry of the BM2
+_BM2_items = _SUP_items + [
+    ('temperature', 'BM2:TEL? 8,data', 'uint', 0.01, 'degC',
+     'The battery temperature'),
+    ('voltage', 'BM2:TEL? 9,data', 'uint', 0.001, 'V',
+     'The battery voltage'),
+    ('discharge_current', 'BM2:TEL? 10,data', 'int', -0.001, 
+     'A', 'The current drawn from the battery'),
+    ('state_of_charge', 'BM2:TEL? 13,data', 'char', None, '%',
+     'The battery state of charge'),
+    ('temperature_1', 'BM2:TEL? 50,data', 'uint', None, 
+     '0.1 K', 'Temperature sensor 1'),
+    ('temperature_2', 'BM2:TEL? 51,data', 'uint', None, 
+     '0.1 K', 'Temperature sensor 2'),
+    ('temperature_3', 'BM2:TEL? 71,data', 'uint', None, 
+     '0.1 K', 'Temperature sensor 3'),
+    ('temperature_4', 'BM2:TEL? 72,data', 'uint', None, 
+     '0.1 K', 'Temperature sensor 4'),
+    ('temperature_5', 'BM2:TEL? 73,data', 'uint', None, 
+     '0.1 K', 'Temperature sensor 5'),
+    ('temperature_6', 'BM2:TEL? 74,data', 'uint', None, 
+     '0.1 K', 'Temperature sensor 6'),
+    ('temperature_offsets', 'BM2:TEL? 75,data', 6*['float'], 
+     None, '0.1 K', 'The offsets of the six temperature sensors'),
+    ('flash_page', 'BM2:TEL? 78,data', 33*['char'], None, '',
+     'The length and data of the last data flash page read')]
+
+# the temperature sensors in the order they are calibrated
+BM2_TEMPERATURES = ['temperature_1', 'temperature_2', 'temperature_3', 
+                    'temperature_4', 'temperature_5', 'temperature_6']
+
+#
+# ---------
+# Classes
+
+class telemetry_item:
+    """
+    Class that declares a single telemetry item
+    
+    @attribute name        (string)        The name of the item
+    @attribute command     (scpi_command)  The command that reads the item
+    @attribute format      (string or list) The format of the response
+    @attribute scale       (float)         The value of one count of the raw 
+                                           value, None to use the raw value
+    @attribute units       (string)        The units of the scaled value
+    @attribute description (string)        What the item is
+    @attribute convert     (function)      Converts the raw value to the 
+                                           scaled value
+    """
+    
+    def __init__(self, name, command, format, scale, units, description):
+        """
+        Declare the item
+        
+        @param[in]    name:            the name of the item (string)
+        @param[in]    command:         the command that reads it (string)
+        @param[in]    format:          the format of the response (string or
+                                       list)
+        @param[in]    scale:           the value of one count, None for the 
+                                       raw value (float)
+        @param[in]    units:           the units of the value (string)
+        @param[in]    description:     what the item is (string)
+        """
+        self.name = name
+        
+        self.command = process_SCPI.scpi_command(command)
+        
+        self.format = format
+        
+        self.scale = scale
+        
+        self.units = units
+        
+        self.description = description
+        
+        # choose the conversion once rather than on every read
+        if scale == None:
+            self.convert = lambda value: value
+        
+        elif type(format) == list:
+            self.convert = lambda value: [item*scale for item in value]
+        
+        else:
+            self.convert = lambda value: value*scale
+        # end if
+    # end def
+    
+    def decode(self, value):
+        """
+        Convert a raw value that has been read
+        
+        @param[in]    value:           the raw value, None if the read failed
+        @return       (variable)       The scaled value, None if the read 
+                                       failed
+        """
+        if value == None:
+            return None
+        # end if
+        
+        return self.convert(value)
+    # end def
+# end class
+
+
+class telemetry_map:
+    """
+    Class to read the telemetry items of a module by name. Subclasses are 
+    given their items and an accessor method for each item by
+    _add_accessors().
+    
+    @attribute AARD        (process_SCPI.aardvark) The aardvark to read with
+    @attribute address     (string)        The address of the module
+    """
+    
+    # the items of the module, by name
+    items = {}
+    
+    def __init__(self, AARD, address):
+        """
+        Initialise the map
+        
+        @param[in]    AARD:            the aardvark to read with 
+                                       (process_SCPI.aardvark)
+        @param[in]    address:         the address of the module (string)
+        """
+        self.AARD = AARD
+        
+        self.address = address
+    # end def
+    
+    def read(self, name):
+        """
+        Read an item
+        
+        @param[in]    name:            the name of the item (string)
+        @return       (variable)       The scaled value, None if the read 
+                                       failed
+        """
+        item = self.items[name]
+        
+        return item.decode(self.AARD.read_SCPI(item.command, self.address,
+                                               item.format))
+    # end def
+    
+    def read_many(self, names):
+        """
+        Read several items in one batch
+        
+        @param[in]    names:           the names of the items (list)
+        @return       (dict)           The scaled value of each item, None if
+                                       its read failed
+        """
+        items = [self.items[name] for name in names]
+        
+        values = self.AARD.read_many([(item.command, item.format) 
+                                      for item in items], self.address)
+        
+        return dict([(item.name, item.decode(value)) 
+                     for (item, value) in zip(items, values)])
+    # end def
+    
+    def cache(self, name, ttl):
+        """
+        Keep the responses to an item for a time so that reading it again 
+        does not use the bus
+        
+        @param[in]    name:            the name of the item (string)
+        @param[in]    ttl:             the time to keep the responses (s), 
+                                       None to keep them while the aardvark 
+                                       is connected, 0 to stop caching the 
+                                       item
+        """
+        process_SCPI.set_cache_ttl(self.items[name].command, ttl)
+    # end def
+# end class
+
+
+class sup_telemetry(telemetry_map):
+    """
+    Class to read the telemetry common to every SupMCU module
+    """
+    items = {}
+# end class
+
+
+class bm2_telemetry(telemetry_map):
+    """
+    Class to read the telemetry of a BM2
+    """
+    items = {}
+# end class
+
+#
+# ----------------
+# Private Functions
+
+def _accessor(item):
+    """
+    Function to make the accessor method of an item
+    
+    @param[in]    item:            the item (telemetry_item)
+    @return       (function)       The method
+    """
+    def accessor(self):
+        return self.read(item.name)
+    # end def
+    
+    accessor.__name__ = item.name
+    accessor.__doc__ = '\n        ' + item.description + \
+        (' (' + item.units + ')' if item.units else '') + '\n        '
+    
+    return accessor
+# end def
+
+def _add_accessors(map_class, items):
+    """
+    Function to add the items and an accessor for each item to a map class
+    
+    @param[in]    map_class:       the class (telemetry_map subclass)
+    @param[in]    items:           the declaration of each item (list of 
+                                   tuples)
+    """
+    for declaration in items:
+        item = telemetry_item(*declaration)
+        map_class.items[item.name] = item
+        setattr(map_class, item.name, _accessor(item))
+    # end for
+# end def
+
+# give the maps their items
+_add_accessors(sup_telemetry, _SUP_items)
+_add_accessors(bm2_telemetry, _BM2_items)
+
+def _test():
+    """
+    Test code for this module.
+    """
+    with process_SCPI.aardvark() as AARD:
+        if AARD.port != None:
+            bm2 = bm2_telemetry(AARD, "0x5C")
+            
+            print "Voltage:", bm2.voltage(), "V"
+            print "Temperature:", bm2.temperature(), "degC"
+            print bm2.read_many(BM2_TEMPERATURES)
+        
+        else:
+            print "No Aardvark Available"
+        # end if
+    # end with
+    
+    process_SCPI.close_session()
+# end def
+
+
+if __name__ == '__main__':
+    # if this code is not running as an imported module run test code
+    _test()
+# end if
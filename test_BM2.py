@@ -25,21 +25,155 @@ import sys
 sys.path.insert(1, 'src/')
 sys.path.insert(1, 'processes/')
 
+import process_profile
+
+if '--profile-imports' in sys.argv:
+    # time the imports from here on
+    process_profile.start_import_profile()
+# end if
+
+import argparse
 import BM2_process
 import process_GUI
 import process_SCPI
+import process_stations
+import process_capture
+import process_recorder
+import telemetry_map
 
 #
 # -------
 # Code
 
+parser = argparse.ArgumentParser(description = 'Test the BM2')
+parser.add_argument('--stations', action = 'store_true',
+                    help = 'test a BM2 on every connected aardvark at once')
+parser.add_argument('--slot', type = int, default = None,
+                    help = 'the station slot this test is running in')
+parser.add_argument('--aardvark', type = int, default = None,
+                    help = 'the unique ID of the aardvark to use')
+parser.add_argument('--result', default = None, metavar = 'FILE',
+                    help = 'write whether the process passed to FILE')
+parser.add_argument('--stats', default = None, metavar = 'FILE',
+                    help = 'time the I2C transactions and export them to FILE')
+parser.add_argument('--capture', default = None, metavar = 'FILE',
+                    help = 'capture the bus to FILE with a second aardvark')
+parser.add_argument('--profile-imports', action = 'store_true',
+                    help = 'report how long the imports and startup took')
+parser.add_argument('--record', default = None, metavar = 'FILE',
+                    help = 'record the telemetry to FILE while the test runs')
+parser.add_argument('--record-rate', type = float, default = 1.0, 
+                    metavar = 'HZ', help = 'the samples per second to record')
+parser.add_argument('--record-items', nargs = '+', 
+                    default = ['voltage', 'discharge_current', 'temperature'],
+                    metavar = 'ITEM', help = 'the telemetry items to record')
+args = parser.parse_args()
+
+if args.stations:
+    # run one worker per aardvark with the other options and wait for them all
+    results = process_stations.run_stations(sys.argv[0], 
+                                            [argument for argument in 
+                                             sys.argv[1:] 
+                                             if argument != '--stations'],
+                                            ['--stats', '--capture', 
+                                             '--record'])
+    sys.exit(0 if all(results.values()) else 1)
+# end if
+
+if args.stats != None:
+    # record where the time goes on the bus
+    process_SCPI.enable_stats(args.stats)
+# end if
+
+# only use the aardvark given, or the first one if none is given
+process_SCPI.bind_aardvark(args.aardvark)
+
 # Initialise the BM2 process
 BM2_struct = BM2_process.BM2_Process()
 
+# record the telemetry for the whole process if asked to
+try:
+    recorder = process_recorder.telemetry_recorder(
+        telemetry_map.bm2_telemetry, BM2_struct.properties.address, 
+        args.record_items, args.record_rate, args.record)
+    
+except ValueError, error:
+    # only numeric telemetry items can be recorded
+    parser.error(str(error))
+# end try
+
+if args.slot != None:
+    # identify the slot on the GUI
+    BM2_struct.properties.title += ' - Slot ' + str(args.slot)
+# end if
+
+if args.profile_imports:
+    # report the startup time before the GUI takes over
+    process_profile.stop_import_profile()
+    print process_profile.import_report()
+# end if
+
 # Initialise the associated GUI
 main_gui = process_GUI.process_window(BM2_struct)
 
+# capture the bus for the whole process if asked to, a station does not 
+# take an aardvark that is bound to a slot
+capture = process_capture.bus_capture(args.capture, None, 
+                                      process_stations.read_slots().values()
+                                      if args.slot != None else [])
+
+capturing = (args.capture != None) and capture.start()
+
+if (args.capture != None) and not capturing:
+    print capture.message
+# end if
+
+if args.record != None:
+    if recorder.start():
+        main_gui.show_recorder(recorder)
+        
+    else:
+        print recorder.message
+    # end if
+# end if
+
 # Start the program
 main_gui.start()
 
+# close the monitor aardvark even if the capture failed part way through
+capture.stop()
+
+if capturing:
+    # summarise the capture
+    if capture.message != '':
+        print capture.message
+    # end if
+    
+    print process_capture.decode_capture(args.capture).report()
+# end if
+
+if recorder.running:
+    # stop the recording and summarise it
+    recorder.stop()
+    print recorder.report()
+# end if
+
+# Close the aardvark now that the GUI has exited
+process_SCPI.close_session()
+
+# report whether the process passed
+failures = main_gui.failures()
+
+if args.result != None:
+    process_stations.write_result(failures, args.result)
+# end if
+
+if failures:
+    print 'FAIL: ' + '; '.join(failures)
+    sys.exit(1)
+    
+else:
+    print 'PASS'
+# end if
+
 